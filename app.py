@@ -4,6 +4,10 @@ import streamlit as st
 # Configuration Streamlit
 st.set_page_config(layout="wide", page_title="Prévisions de fréquentation")
 
+# Prévision météo rafraîchie en arrière-plan dès le démarrage du processus
+from app.utils.exogenous import start_forecast_refresher
+start_forecast_refresher()
+
 # Initialisation de la session state
 if 'page' not in st.session_state:
     st.session_state.page = 'selector'
@@ -22,6 +26,9 @@ def main():
     elif st.session_state.page == 'update_all_models':
         from app.pages.update_all_models import update_all_models_page
         update_all_models_page()
+    elif st.session_state.page == 'global_forecast':
+        from app.pages.global_forecast import global_forecast_page
+        global_forecast_page()
     elif st.session_state.page == 'manage_boutiques':
         from app.pages.manage_boutiques import manage_boutiques_page
         manage_boutiques_page()
@@ -1,10 +1,99 @@
 import sqlite3
-from typing import List, Tuple
+import threading
+import unicodedata
+import re
+from typing import Iterable, List, Optional, Tuple
 import os
 
+# Séries temporelles au format long. Clés primaires « clustered » (WITHOUT ROWID) :
+# les lignes d'une boutique sont stockées contiguës et triées par date.
+TIMESERIES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flux_weekly (
+    id_boutique INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    annee INTEGER NOT NULL,
+    semaine INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (id_boutique, date),
+    FOREIGN KEY (id_boutique) REFERENCES boutiques(id_boutique)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS exog_weekly (
+    date TEXT NOT NULL PRIMARY KEY,
+    annee INTEGER NOT NULL,
+    semaine INTEGER NOT NULL,
+    temperature_max REAL,
+    temperature_min REAL,
+    precipitation REAL,
+    is_vacation INTEGER,
+    is_public_holiday INTEGER,
+    days_in_week INTEGER
+) WITHOUT ROWID;
+
+-- Coordonnées météo saisies pour chaque boutique (sans ligne : LAT/LON de config.py)
+CREATE TABLE IF NOT EXISTS boutique_locations (
+    id_boutique INTEGER NOT NULL PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    FOREIGN KEY (id_boutique) REFERENCES boutiques(id_boutique)
+);
+
+-- Suivi des ingestions incrémentales (dernière date ingérée + empreinte de la fin)
+CREATE TABLE IF NOT EXISTS ingest_state (
+    source TEXT NOT NULL PRIMARY KEY,
+    last_date TEXT NOT NULL,
+    n_rows INTEGER NOT NULL,
+    tail_checksum TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+"""
+
+EXOG_WEEKLY_COLUMNS = [
+    "date", "annee", "semaine", "temperature_max", "temperature_min",
+    "precipitation", "is_vacation", "is_public_holiday", "days_in_week"
+]
+
+# Version du schéma (PRAGMA user_version) : à incrémenter avec toute évolution de TIMESERIES_SCHEMA
+SCHEMA_VERSION = 1
+
+_initialized_dbs = set()
+_init_lock = threading.Lock()
+
+
+def init_database(db_path: str):
+    """
+    Migration des tables de séries temporelles : TIMESERIES_SCHEMA n'est appliqué que si
+    la base est en retard sur SCHEMA_VERSION, et la vérification n'a lieu qu'une fois
+    par processus et par base.
+    """
+    key = os.path.abspath(db_path)
+    if key in _initialized_dbs:
+        return
+    with _init_lock:
+        if key in _initialized_dbs:
+            return
+        conn = sqlite3.connect(db_path)
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                conn.executescript(TIMESERIES_SCHEMA)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.commit()
+                print(f"[INFO] Schéma de la base {os.path.basename(db_path)} migré en version {SCHEMA_VERSION}.")
+        finally:
+            conn.close()
+        _initialized_dbs.add(key)
+
+
+def normalize_name(nom: str) -> str:
+    """Clé de comparaison des noms de boutiques (sans accents, casse ni ponctuation)."""
+    nom = unicodedata.normalize("NFKD", str(nom)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^A-Z0-9]", "", nom.upper())
+
+
 class DatabaseManager:
     def __init__(self, db_path: str = "app/database/boutiques.db"):
         self.db_path = db_path
+        init_database(db_path)
 
     def get_connection(self):
         return sqlite3.connect(self.db_path)
@@ -49,6 +138,153 @@ class DatabaseManager:
                 raise Exception("Impossible de supprimer ce secteur : des boutiques y sont encore rattachées.")
             cur.execute("DELETE FROM secteurs WHERE id_secteur = ?", (secteur_id,))
             conn.commit()
+
+    # --- Coordonnées météo ---
+    def get_boutique_locations(self) -> List[Tuple]:
+        """(id_boutique, nom_boutique, latitude, longitude) ; coordonnées None si non renseignées."""
+        with self.get_connection() as conn:
+            return conn.execute(
+                """SELECT b.id_boutique, b.nom_boutique, l.latitude, l.longitude
+                   FROM boutiques b LEFT JOIN boutique_locations l ON l.id_boutique = b.id_boutique
+                   ORDER BY b.id_boutique"""
+            ).fetchall()
+
+    def set_boutique_location(self, id_boutique: int, latitude: float, longitude: float):
+        with self.get_connection() as conn:
+            conn.execute(
+                """INSERT INTO boutique_locations (id_boutique, latitude, longitude) VALUES (?, ?, ?)
+                   ON CONFLICT (id_boutique) DO UPDATE SET
+                       latitude = excluded.latitude,
+                       longitude = excluded.longitude""",
+                (id_boutique, float(latitude), float(longitude))
+            )
+            conn.commit()
+
+    def clear_boutique_location(self, id_boutique: int):
+        """Efface les coordonnées saisies : la boutique revient à LAT/LON de config.py."""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM boutique_locations WHERE id_boutique = ?", (id_boutique,))
+            conn.commit()
+
+    # --- Séries hebdomadaires ---
+    def get_boutique_ids(self) -> dict:
+        """{nom normalisé: id_boutique}, pour rapprocher les colonnes Excel des boutiques."""
+        with self.get_connection() as conn:
+            rows = conn.execute("SELECT id_boutique, nom_boutique FROM boutiques").fetchall()
+        return {normalize_name(nom): id_b for id_b, nom in rows}
+
+    def upsert_flux_weekly(self, rows: Iterable[Tuple]) -> int:
+        """
+        Insère ou met à jour des lignes (id_boutique, date, annee, semaine, value).
+        Les dates sont des chaînes ISO 'YYYY-MM-DD' (début de semaine).
+        """
+        with self.get_connection() as conn:
+            cur = conn.executemany(
+                """INSERT INTO flux_weekly (id_boutique, date, annee, semaine, value)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (id_boutique, date) DO UPDATE SET
+                       annee = excluded.annee,
+                       semaine = excluded.semaine,
+                       value = excluded.value""",
+                rows
+            )
+            conn.commit()
+            return cur.rowcount
+
+    def replace_flux_weekly(self, rows: Iterable[Tuple]) -> int:
+        """Remplace tout le contenu de flux_weekly (reconstruction), en une transaction."""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM flux_weekly")
+            cur = conn.executemany(
+                """INSERT OR REPLACE INTO flux_weekly (id_boutique, date, annee, semaine, value)
+                   VALUES (?, ?, ?, ?, ?)""",
+                rows
+            )
+            conn.commit()
+            return cur.rowcount
+
+    def get_flux_weekly(self, id_boutique: int, start: Optional[str] = None,
+                        end: Optional[str] = None) -> List[Tuple]:
+        """(date, annee, semaine, value) d'une boutique sur [start, end], triés par date."""
+        with self.get_connection() as conn:
+            return conn.execute(
+                """SELECT date, annee, semaine, value FROM flux_weekly
+                   WHERE id_boutique = ? AND date >= ? AND date <= ?
+                   ORDER BY date""",
+                (id_boutique, start or "0000-00-00", end or "9999-99-99")
+            ).fetchall()
+
+    def get_flux_weekly_bounds(self, id_boutique: int) -> Tuple:
+        """(première date, dernière date, nombre de semaines) stockées pour une boutique."""
+        with self.get_connection() as conn:
+            return conn.execute(
+                "SELECT MIN(date), MAX(date), COUNT(*) FROM flux_weekly WHERE id_boutique = ?",
+                (id_boutique,)
+            ).fetchone()
+
+    def get_ingest_state(self, source: str) -> Optional[Tuple]:
+        """(last_date, n_rows, tail_checksum) de la dernière ingestion, ou None."""
+        with self.get_connection() as conn:
+            return conn.execute(
+                "SELECT last_date, n_rows, tail_checksum FROM ingest_state WHERE source = ?",
+                (source,)
+            ).fetchone()
+
+    def set_ingest_state(self, source: str, last_date: str, n_rows: int, tail_checksum: str):
+        with self.get_connection() as conn:
+            conn.execute(
+                """INSERT INTO ingest_state (source, last_date, n_rows, tail_checksum, updated_at)
+                   VALUES (?, ?, ?, ?, datetime('now'))
+                   ON CONFLICT (source) DO UPDATE SET
+                       last_date = excluded.last_date,
+                       n_rows = excluded.n_rows,
+                       tail_checksum = excluded.tail_checksum,
+                       updated_at = excluded.updated_at""",
+                (source, last_date, n_rows, tail_checksum)
+            )
+            conn.commit()
+
+    def upsert_exog_weekly(self, rows: Iterable[Tuple]) -> int:
+        """Insère ou met à jour des lignes dans l'ordre de EXOG_WEEKLY_COLUMNS."""
+        cols = ", ".join(EXOG_WEEKLY_COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in EXOG_WEEKLY_COLUMNS[1:])
+        with self.get_connection() as conn:
+            cur = conn.executemany(
+                f"""INSERT INTO exog_weekly ({cols})
+                    VALUES ({", ".join("?" * len(EXOG_WEEKLY_COLUMNS))})
+                    ON CONFLICT (date) DO UPDATE SET {updates}""",
+                rows
+            )
+            conn.commit()
+            return cur.rowcount
+
+    def replace_exog_weekly(self, rows: Iterable[Tuple]) -> int:
+        """Remplace tout le contenu de exog_weekly (reconstruction), en une transaction."""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM exog_weekly")
+            cur = conn.executemany(
+                f"""INSERT INTO exog_weekly ({", ".join(EXOG_WEEKLY_COLUMNS)})
+                    VALUES ({", ".join("?" * len(EXOG_WEEKLY_COLUMNS))})""",
+                rows
+            )
+            conn.commit()
+            return cur.rowcount
+
+    def get_exog_weekly(self, start: Optional[str] = None, end: Optional[str] = None,
+                        columns: Optional[List[str]] = None) -> List[Tuple]:
+        """Lignes de exog_weekly sur [start, end] (colonnes au choix, 'date' toujours en tête)."""
+        columns = [c for c in (columns or EXOG_WEEKLY_COLUMNS[1:]) if c != "date"]
+        unknown = [c for c in columns if c not in EXOG_WEEKLY_COLUMNS]
+        if unknown:
+            raise ValueError(f"Colonnes inconnues dans exog_weekly : {unknown}")
+        with self.get_connection() as conn:
+            return conn.execute(
+                f"""SELECT {", ".join(["date"] + columns)} FROM exog_weekly
+                    WHERE date >= ? AND date <= ? ORDER BY date""",
+                (start or "0000-00-00", end or "9999-99-99")
+            ).fetchall()
+
+
 def get_all_boutiques(db_path: str | None = None) -> list[str]:
     """Retourne la liste des boutiques connues dans la base SQLite."""
     if db_path is None:
@@ -60,3 +296,20 @@ def get_all_boutiques(db_path: str | None = None) -> list[str]:
     finally:
         conn.close()
     return [r[0] for r in rows]
+
+
+def get_boutique_secteurs(db_path: str | None = None) -> list[tuple[str, str]]:
+    """(nom_boutique, nom_secteur) de toutes les boutiques, triées par secteur puis boutique."""
+    if db_path is None:
+        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', 'database', 'boutiques.db')
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            """SELECT b.nom_boutique, COALESCE(s.nom_secteur, '')
+               FROM boutiques b LEFT JOIN secteurs s ON s.id_secteur = b.id_secteur
+               ORDER BY s.nom_secteur, b.nom_boutique"""
+        ).fetchall()
+    finally:
+        conn.close()
+    return [tuple(r) for r in rows]
@@ -0,0 +1,86 @@
+import time
+import streamlit as st
+from datetime import datetime, timedelta
+import pandas as pd
+
+from app.utils.fleet_forecast import forecast_all, period_totals, MEASURES
+
+def _week_columns(df: pd.DataFrame) -> pd.DataFrame:
+    return df.rename(columns=lambda d: f"{d:%d/%m/%Y}")
+
+def _back_button() -> None:
+    st.markdown("---")
+    if st.button("← Retour à la sélection"):
+        st.session_state.page = 'selector'
+        st.rerun()
+
+def global_forecast_page() -> None:
+    st.title("Prévision globale (toutes boutiques)")
+
+    # ───── Sélecteur de dates ────────────────────────────────────────────
+    today      = datetime.today().date()
+    default    = (today, today + timedelta(weeks=4))
+    date_sel   = st.date_input("Plage de prévision",
+                               default,
+                               min_value=today - timedelta(weeks=52),
+                               max_value=today + timedelta(weeks=52))
+    if not isinstance(date_sel, tuple) or len(date_sel) != 2:
+        st.info("Choisissez la date de fin…")
+        return
+    start_date, end_date = date_sel
+    if start_date >= end_date:
+        st.error("La date de début doit précéder la date de fin.")
+        return
+    st.info(f"Période : **{start_date:%d/%m/%Y} → {end_date:%d/%m/%Y}**")
+
+    if st.button("Lancer la prévision globale 🚀"):
+        with st.spinner("Prévision de toutes les boutiques…"):
+            t0 = time.perf_counter()
+            try:
+                wide, totals, fleet, errors = forecast_all(start_date, end_date)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            st.session_state.global_forecast = (start_date, end_date, wide, totals, fleet, errors,
+                                                time.perf_counter() - t0)
+
+    result = st.session_state.get("global_forecast")
+    if result is None or result[:2] != (start_date, end_date):
+        _back_button()
+        return
+    _, _, wide, totals, fleet, errors, elapsed = result
+
+    st.caption(f"{len(wide)} boutique(s) prévue(s) en {elapsed:.1f} s")
+    for cible, message in errors.items():
+        st.warning(f"{cible} : prévision impossible ({message})")
+    if wide.empty:
+        _back_button()
+        return
+
+    # ───── Synthèse : flux sur la période ───────────────────────────────
+    days = pd.date_range(start_date, end_date, freq="D")
+    by_secteur = period_totals(totals, days)
+    # IC de l'ensemble : résidus de la série agrégée, pas la somme des IC des secteurs
+    tot, low, high = period_totals(fleet, days)[MEASURES].iloc[0]
+    st.metric("Flux total prédit (toutes boutiques)",
+              f"{tot:,.0f}",
+              f"IC 70 % : {low:,.0f} → {high:,.0f}" if pd.notna(low) else "IC 70 % indisponible")
+
+    st.subheader("Flux par secteur sur la période")
+    st.dataframe(by_secteur.round(0))
+
+    st.subheader("Prévision hebdomadaire par secteur")
+    st.dataframe(_week_columns(totals["Prévision"]).round(0))
+    with st.expander("Bornes de l'IC 70 % par secteur"):
+        for measure in MEASURES[1:]:
+            st.markdown(f"**{measure}**")
+            st.dataframe(_week_columns(totals[measure]).round(0))
+
+    st.subheader("Prévision hebdomadaire par boutique")
+    st.dataframe(_week_columns(wide["Prévision"]).round(0))
+    with st.expander("Bornes de l'IC 70 % par boutique"):
+        for measure in MEASURES[1:]:
+            st.markdown(f"**{measure}**")
+            st.dataframe(_week_columns(wide[measure]).round(0))
+
+    _back_button()
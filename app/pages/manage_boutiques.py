@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import os
 import shutil
-from config import get_model_paths
+from config import get_model_paths, LAT, LON
 from app.database.database_manager import DatabaseManager  # adapte le chemin si besoin
 db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'database', 'boutiques.db')
 
@@ -20,16 +20,21 @@ def delete_secteur(secteur_id):
         return False, str(e)
 
 # --- Gestion des boutiques ---
-def add_boutique(nom_boutique, secteur_id):
+def add_boutique(nom_boutique, secteur_id, latitude=None, longitude=None):
     with db.get_connection() as conn:
         cur = conn.cursor()
         cur.execute("INSERT INTO boutiques (nom_boutique, id_secteur) VALUES (?, ?)", (nom_boutique, secteur_id))
         conn.commit()
+        id_boutique = cur.lastrowid
+    if latitude is not None and longitude is not None:
+        db.set_boutique_location(id_boutique, latitude, longitude)
 
 def delete_boutique(nom_boutique):
     # Supprimer la boutique de la base
     with db.get_connection() as conn:
         cur = conn.cursor()
+        cur.execute("""DELETE FROM boutique_locations WHERE id_boutique IN
+                       (SELECT id_boutique FROM boutiques WHERE nom_boutique = ?)""", (nom_boutique,))
         cur.execute("DELETE FROM boutiques WHERE nom_boutique = ?", (nom_boutique,))
         conn.commit()
     # Supprimer le dossier de modèles associé
@@ -87,16 +92,50 @@ def manage_boutiques_page():
     nom_boutique = st.text_input("Nom de la nouvelle boutique")
     secteur_nom = st.selectbox("Secteur", secteurs_df['nom_secteur'], key="secteur_boutique")
     secteur_id = secteurs_df[secteurs_df['nom_secteur'] == secteur_nom]['id_secteur'].iloc[0]
+    col_lat, col_lon = st.columns(2)
+    latitude = col_lat.number_input("Latitude (météo)", min_value=-90.0, max_value=90.0,
+                                    value=None, format="%.4f")
+    longitude = col_lon.number_input("Longitude (météo)", min_value=-180.0, max_value=180.0,
+                                     value=None, format="%.4f")
 
     if st.button("Ajouter la boutique"):
         if nom_boutique.strip() == "":
             st.error("Le nom de la boutique ne peut pas être vide.")
         else:
-            add_boutique(nom_boutique.strip(), secteur_id)
+            add_boutique(nom_boutique.strip(), secteur_id, latitude, longitude)
             st.success(f"Boutique '{nom_boutique}' ajoutée au secteur '{secteur_nom}'.")
 
     st.markdown("---")
 
+    # --- Coordonnées météo d'une boutique existante ---
+    st.header("Coordonnées météo d'une boutique")
+    locations = db.get_boutique_locations()
+    if len(locations) == 0:
+        st.info("Aucune boutique enregistrée.")
+    else:
+        noms = [nom for _, nom, _, _ in locations]
+        boutique_nom = st.selectbox("Boutique", noms, key="boutique_coordonnees")
+        id_boutique, _, lat_actuelle, lon_actuelle = locations[noms.index(boutique_nom)]
+        if lat_actuelle is None:
+            st.caption(f"Coordonnées non renseignées : météo par défaut ({LAT:.4f}, {LON:.4f}).")
+        col_lat, col_lon = st.columns(2)
+        latitude = col_lat.number_input("Latitude", min_value=-90.0, max_value=90.0, value=lat_actuelle,
+                                        format="%.4f", key=f"lat_{id_boutique}")
+        longitude = col_lon.number_input("Longitude", min_value=-180.0, max_value=180.0, value=lon_actuelle,
+                                         format="%.4f", key=f"lon_{id_boutique}")
+        col_save, col_clear = st.columns(2)
+        if col_save.button("Enregistrer les coordonnées"):
+            if latitude is None or longitude is None:
+                st.error("Renseignez la latitude et la longitude.")
+            else:
+                db.set_boutique_location(id_boutique, latitude, longitude)
+                st.success(f"Coordonnées de '{boutique_nom}' enregistrées.")
+        if col_clear.button("Revenir à la météo par défaut"):
+            db.clear_boutique_location(id_boutique)
+            st.success(f"Coordonnées de '{boutique_nom}' effacées : météo par défaut utilisée.")
+
+    st.markdown("---")
+
     # --- Suppression d'une boutique ---
     st.header("Supprimer une boutique")
     with db.get_connection() as conn:
@@ -122,10 +161,14 @@ def manage_boutiques_page():
 
     # --- Liste des boutiques actuelles ---
     st.header("Liste des boutiques")
+    locations = pd.DataFrame(db.get_boutique_locations(),
+                             columns=["id_boutique", "nom_boutique", "latitude", "longitude"])
     st.dataframe(
-        boutiques[['nom_boutique', 'id_secteur']].merge(
+        boutiques[['id_boutique', 'nom_boutique', 'id_secteur']].merge(
             secteurs_df, on='id_secteur'
-        )[['nom_boutique', 'nom_secteur']]
+        ).merge(
+            locations[['id_boutique', 'latitude', 'longitude']], on='id_boutique', how='left'
+        )[['nom_boutique', 'nom_secteur', 'latitude', 'longitude']]
     )
 
     if st.button("← Retour à la sélection"):
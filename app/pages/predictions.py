@@ -1,17 +1,12 @@
 import streamlit as st
 from datetime import datetime, timedelta
 import pandas as pd
-import numpy as np
 
 from app.utils.exogenous      import exo_var
-from app.utils.forecast       import (
-    load_model_and_scalers, forecast_future,
-    aggregate_weekly_forecast, in_sample_prediction,
-    auto_update_model_with_latest_data
-)
-from app.utils.data_loader    import load_historical_data
+from app.utils.forecast       import forecast_boutique, aggregate_weekly_forecast
+from app.utils.data_loader    import load_historical_data, load_shop_history
 from app.utils.visualizations import plot_forecast, plot_historical_data
-from config                   import HISTORICAL_FILE
+from app.utils.lags           import lag_matrices
 
 def predictions_page() -> None:
     st.title("Prévisions hebdomadaires avec données historiques")
@@ -43,65 +38,28 @@ def predictions_page() -> None:
 
     # ───── 1. Exogènes futures ──────────────────────────────────────────
     with st.spinner("Récupération des variables exogènes…"):
-        exog_future = exo_var(start_date, end_date)
+        exog_future = exo_var(start_date, end_date, cible)
     if exog_future.empty:
         st.error("Impossible d’obtenir les exogènes.")
         return
 
-    # ───── 2. Modèle + historiques ──────────────────────────────────────
-    with st.spinner("Chargement du modèle et des historiques…"):
-        model, scaler_exog, scaler_target, pca = load_model_and_scalers(cible)
-        model = auto_update_model_with_latest_data(
-            cible, model, scaler_exog, scaler_target, pca
-        )
-
-        y_hist, hist_n1, hist_n2, cal_df = load_historical_data(cible)
-
-        # exogènes HISTORIQUES alignées sur le calendrier
-        exog_hist = (exo_var(cal_df['Date'].min(), cal_df['Date'].max())
-                    .set_index("Date")
-                    .loc[cal_df['Date']])
-
-        # Alignement défensif
-        common_idx = y_hist.index.intersection(exog_hist.index)
-        y_hist = y_hist.loc[common_idx]
-        exog_hist = exog_hist.loc[common_idx]
-
-        # Prédictions in-sample pour l'IC empirique
-        pred_hist = in_sample_prediction(
-            model, scaler_exog, pca, scaler_target, exog_hist
-        )
-
-        # ── 3. Prévision future ────────────────────────────────────
-        exog_future_full = exog_future.set_index("Date")[scaler_exog.feature_names_in_]
-        forecast_df = forecast_future(
-            exog_future_full.reset_index(),
-            model, scaler_exog, scaler_target, pca,
-            train_data=y_hist, train_pred_mean=pred_hist
-        )
+    # ───── 2. Modèle + prévision (cache si modèle, historique et exogènes inchangés) ──
+    with st.spinner("Chargement du modèle et prévision…"):
+        # IC empirique : quantiles des résidus de l'ajustement in-sample persistant
+        forecast_df = forecast_boutique(cible, exog_future, start_date, end_date)
+
+    # ───── 3. Historiques ───────────────────────────────────────────────
+    y_hist, hist_n1, hist_n2, cal_df = load_historical_data(cible)
 
     # ───── 4. Ajout des colonnes Hist_N‑1 / Hist_N‑2 ────────────────────
     forecast_dates = forecast_df["Date"]
 
-    # On extrait Année/Semaine pour chaque date de prévision
-    weeks = forecast_dates.apply(lambda d: (d.year, d.isocalendar().week))
-    cal_df_hist = cal_df.set_index("Date")
-
-    # Utilise la même logique de "lag recherche SEMAINE/ANNEE"
-    def find_lag_value(year, week, lag):
-        ref_year = year - lag
-        match = cal_df_hist[(cal_df_hist["Annee"] == ref_year) & (cal_df_hist["Semaine"] == week)]
-        if not match.empty:
-            d = match.index[0]
-            return y_hist.get(d, np.nan)
-        return np.nan
-
-    lag_n1 = [find_lag_value(y, w, 1) for y, w in weeks]
-    lag_n2 = [find_lag_value(y, w, 2) for y, w in weeks]
+    # Même logique de "lag recherche SEMAINE/ANNEE", appliquée aux dates futures
+    lags = lag_matrices(y_hist.to_frame(), cal_df, lags=(1, 2), dates=forecast_dates)
 
     lag_table = pd.DataFrame({
-        "Hist_N-1": lag_n1,
-        "Hist_N-2": lag_n2
+        "Hist_N-1": lags[1][cible].to_numpy(),
+        "Hist_N-2": lags[2][cible].to_numpy()
     }, index=forecast_dates)
 
     if lag_table.isnull().any().any():
@@ -125,9 +83,9 @@ def predictions_page() -> None:
 
     # ───── 6. Synthèse numérique ────────────────────────────────────────
     days = pd.date_range(start_date, end_date, freq="D")
-    tot  = aggregate_weekly_forecast(forecast_df, days, "Prévision")
-    low  = aggregate_weekly_forecast(forecast_df, days, "Borne inférieure")
-    high = aggregate_weekly_forecast(forecast_df, days, "Borne supérieure")
+    tot, low, high = aggregate_weekly_forecast(
+        forecast_df, days, ["Prévision", "Borne inférieure", "Borne supérieure"]
+    )
     st.metric("Flux total prédit",
               f"{tot:,.0f}",
               f"IC 70 % : {low:,.0f} → {high:,.0f}")
@@ -135,15 +93,7 @@ def predictions_page() -> None:
     # ───── 7. Historique complet (expander) ─────────────────────────────
     with st.expander("Afficher l’historique complet"):
         try:
-            hist_full = pd.read_excel(HISTORICAL_FILE)
-            hist_full["Date"] = pd.to_datetime(
-                hist_full.apply(
-                    lambda r: f"{int(r.Annee)}-W{int(r.Semaine):02d}-1", axis=1
-                ), format="%G-W%V-%u"
-            )
-            hist_full = (hist_full.set_index("Date")
-                         .drop(columns=["Annee", "Semaine"])
-                         .sort_index())
+            hist_full = load_shop_history(cible).to_frame(cible)
             st.plotly_chart(
                 plot_historical_data(hist_full, cible),
                 use_container_width=True
@@ -45,7 +45,8 @@ def selector_page():
     col3, col4 = st.columns(2)
     with col3:
         if st.button("Prévision globale"):
-            pass
+            st.session_state.page = 'global_forecast'
+            st.rerun()
     with col4:
         if st.button("Mise à jour globale"):
             st.session_state.page = 'update_all_models'
@@ -60,6 +61,22 @@ def selector_page():
     if st.button("Mettre à jour les fichiers historiques"):
         with st.spinner("Mise à jour des fichiers historiques en cours…"):
             from app.utils.aggregation_fichier_primaire import update_all_historicals
-            update_all_historicals()
-        st.success("✅ Données mises à jour avec succès.")
+            report = update_all_historicals()
+        st.success(f"✅ Données mises à jour avec succès ({report['added']} jour(s) météo ajouté(s)).")
+        _show_weather_failures(report)
+
+
+def _format_days(days) -> str:
+    from app.utils.weather_fetcher import WeatherDataFetcher
+    return ", ".join(f"{s:%d/%m/%Y}" if s == e else f"{s:%d/%m/%Y} → {e:%d/%m/%Y}"
+                     for s, e in WeatherDataFetcher.contiguous_ranges(days))
+
+
+def _show_weather_failures(report: dict):
+    """Jours météo non récupérés (redemandés à la prochaine mise à jour)."""
+    if report["failed_dates"]:
+        st.warning(f"⚠️ {len(report['failed_dates'])} jour(s) météo non récupéré(s) : "
+                   f"{_format_days(report['failed_dates'])}. Ils seront redemandés à la prochaine mise à jour.")
+    for (lat, lon), days in report["failed_locations"].items():
+        st.warning(f"⚠️ Maille ({lat}, {lon}) : {len(days)} jour(s) non récupéré(s) : {_format_days(days)}.")
 
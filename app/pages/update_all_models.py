@@ -28,7 +28,7 @@ def update_all_models_page():
                 y = y.to_frame(name=cible)
 
                 # Exogènes sur la même période
-                exog = exo_var(cal_df["Date"].min(), cal_df["Date"].max())
+                exog = exo_var(cal_df["Date"].min(), cal_df["Date"].max(), cible)
                 X = cal_df.merge(exog, on="Date", how="left")
 
                 # Vérification alignement Date
@@ -59,7 +59,7 @@ def update_all_models_page():
                     y.squeeze(), X, time_light=time_light, cible=cible
                 )
                 if model_fit is not None:
-                    save_model(model_fit, scaler_exog, pca, scaler_target, cible)
+                    save_model(model_fit, scaler_exog, pca, scaler_target, cible, train_dates=cal_df["Date"])
                     if aic < 600:
                         log += f"✅ Modèle sauvegardé - Bon (AIC={aic:.2f})"
                     elif aic < 700:
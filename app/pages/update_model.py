@@ -16,7 +16,7 @@ def update_model_page():
         y = y.to_frame(name=cible)  # Pour compatibilité SARIMAX
 
         # Récupération des exogènes alignées
-        exo_hist = exo_var(cal_df['Date'].min(), cal_df['Date'].max())
+        exo_hist = exo_var(cal_df['Date'].min(), cal_df['Date'].max(), cible)
 
         # Merge strict sur Date
         X = cal_df.merge(exo_hist, on='Date', how='left', suffixes=('', '_exo'))
@@ -54,7 +54,7 @@ def update_model_page():
                 y.squeeze(), X, time_light=time_light, cible=cible
             )
         if model_fit is not None:
-            save_model(model_fit, scaler_exog, pca, scaler_target, cible)
+            save_model(model_fit, scaler_exog, pca, scaler_target, cible, train_dates=cal_df["Date"])
             if aic < 600:
                 st.success(f"Modèle sauvegardé avec succès !\nAIC = {aic:.2f} : Bon modèle")
             elif aic < 700:
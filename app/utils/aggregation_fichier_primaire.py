@@ -1,193 +1,309 @@
+import hashlib
+import os
+import openpyxl
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import numpy as np
 from app.utils.weather_fetcher import WeatherDataFetcher
-from config import HISTORICAL_EXOG, LAT, LON, HISTORICAL_FILE, RAW_HISTORICAL_FILE
-from app.utils.exogenous import exo_var
-
-# Dictionnaire mois français -> numéro
-FRENCH_MONTHS = {
-    'janvier': '01', 'février': '02', 'fevrier': '02', 'mars': '03',
-    'avril': '04', 'mai': '05', 'juin': '06',
-    'juillet': '07', 'août': '08', 'aout': '08', 'septembre': '09',
-    'octobre': '10', 'novembre': '11', 'décembre': '12', 'decembre': '12'
-}
-
-def custom_week(dt):
-    """
-    Numérote les semaines en coupant strictement au 31 décembre.
-    Semaine 1 : du 1er janvier au premier dimanche inclus.
-    Semaine 2+ : lundi→dimanche. La dernière semaine finit le 31/12.
-    """
-    jan1 = pd.Timestamp(year=dt.year, month=1, day=1)
-    first_sunday = jan1 + pd.Timedelta(days=(6 - jan1.weekday()))
-    if dt <= first_sunday:
-        return 1
-    # Nombre de semaines entières écoulées depuis le premier lundi
-    first_monday = first_sunday + pd.Timedelta(days=1)
-    delta = (dt - first_monday).days
-    return 2 + (delta // 7)
+from config import LAT, LON, HISTORICAL_FILE, RAW_HISTORICAL_FILE
+from app.utils.exogenous import get_exog_store, update_location_histories
+from app.utils.weather_store import get_daily_weather_store, read_legacy_weekly
+from app.utils.custom_calendar import date_to_week, week_to_date, week_end
+from app.utils.french_dates import parse_french_dates
+from app.database.database_manager import DatabaseManager, normalize_name
+from config import DB_PATH, USE_BOUTIQUE_WEATHER
 
-import pandas as pd
-from datetime import datetime, timedelta
-from app.utils.weather_fetcher import WeatherDataFetcher
-from config import HISTORICAL_EXOG, LAT, LON, HISTORICAL_FILE, RAW_HISTORICAL_FILE
-from app.utils.exogenous import exo_var
-
-
-# Dictionnaire mois français -> numéro
-FRENCH_MONTHS = {
-    'janvier': '01', 'février': '02', 'fevrier': '02', 'mars': '03',
-    'avril': '04', 'mai': '05', 'juin': '06',
-    'juillet': '07', 'août': '08', 'aout': '08', 'septembre': '09',
-    'octobre': '10', 'novembre': '11', 'décembre': '12', 'decembre': '12'
-}
-
-def custom_week(dt):
-    jan1 = datetime(dt.year, 1, 1)
-    first_sun = jan1 + timedelta(days=(6 - jan1.weekday()))
-    if dt <= first_sun:
-        return 1
-    return 2 + ((dt - first_sun - timedelta(days=1)).days // 7)
-
-def process(input_path, output_path):
-    import pandas as pd
-
-    # 1. Détecter la ligne d'en-tête contenant 'DATE'
-    raw = pd.read_excel(input_path, header=None)
-    mask = raw.iloc[:, 0].astype(str).str.strip().str.lower() == 'date'
-    if not mask.any():
-        raise ValueError("Ligne d'en-tête 'DATE' introuvable.")
-    hdr = mask.idxmax()
-
-    # 2. Charger avec header, supprimer colonnes vides ou 'Unnamed'
-    df = (pd.read_excel(input_path, header=hdr)
-            .loc[:, lambda d: ~d.columns.str.contains('^Unnamed')]
-          )
 
-    # 3. Convertir la première colonne en datetime (papier français)
-    date_col = df.columns[0]
-    df[date_col] = df[date_col].astype(str).str.lower()
-    for fr, num in FRENCH_MONTHS.items():
-        df[date_col] = df[date_col].str.replace(fr, num, regex=False)
-    df['Date'] = pd.to_datetime(
-        df[date_col].str.extract(r"(\d{1,2})[- ](\d{2})[- ](\d{4})")[0]
-        + '-' + df[date_col].str.extract(r"(\d{1,2})[- ](\d{2})[- ](\d{4})")[1]
-        + '-' + df[date_col].str.extract(r"(\d{1,2})[- ](\d{2})[- ](\d{4})")[2],
-        format="%d-%m-%Y", errors='coerce'
-    )
-
-    # 4. Filtrer et préparer pour agrégation
-    df = df.dropna(subset=['Date']).copy()
-    df['Annee'] = df['Date'].dt.year
-    df['Semaine'] = df['Date'].apply(custom_week)
-
-    # DEBUG: Affichage dernière semaine brute
-    last_date = df['Date'].max()
-    last_week = df.loc[df['Date'] == last_date, ['Annee', 'Semaine']].iloc[0]
-    last_annee, last_semaine = last_week['Annee'], last_week['Semaine']
-
-    # On récupère toutes les dates de la dernière semaine dans le brut
-    last_week_mask = (df['Annee'] == last_annee) & (df['Semaine'] == last_semaine)
-    last_week_dates = df.loc[last_week_mask, 'Date'].sort_values()
-    last_week_full = (last_week_dates.max() - last_week_dates.min()).days >= 6  # 7 jours ?
-
-    # Si la dernière semaine n'est pas complète, on l'enlève AVANT l'agrégation
-    if not last_week_full:
-        df = df[~last_week_mask]
-        print(f"[INFO] Semaine {last_semaine} de {last_annee} retirée car incomplète (dates du {last_week_dates.min()} au {last_week_dates.max()}).")
-
-    # 5. Somme par année/semaine (semaines partielles incluses)
-    shops = df.columns.difference(['Date', 'Annee', 'Semaine'])
-    cols_num = df[shops].select_dtypes(include='number').columns
-    result = (
-        df.groupby(['Annee', 'Semaine'])[cols_num]
-        .sum()
-        .reset_index()
-    )
-
-    # 6. Enregistrer
-    result.to_excel(output_path, index=False)
-    print(f"Enregistré dans {output_path}")
+# Ingestion incrémentale : identifiant de la source et nombre de lignes déjà
+# ingérées dont l'empreinte est revérifiée avant de reprendre à la suite
+INGEST_SOURCE = "flux_brut"
+TAIL_CHECK_ROWS = 14
+# Lecture en flux du brut : nombre de lignes par bloc transmis à l'agrégation
+RAW_CHUNK_ROWS = 2000
+
+
+def iter_raw_daily_chunks(input_path, chunk_size=RAW_CHUNK_ROWS):
+    """
+    Lit le brut journalier en une seule passe (openpyxl read_only / iter_rows).
 
+    - détecte la ligne d'en-tête 'DATE' au fil de la lecture ;
+    - ignore les colonnes sans en-tête (les 'Unnamed' de pandas) ;
+    - produit des blocs typés : 1re colonne brute (dates), boutiques en numérique.
+    L'index de chaque bloc est la position de la ligne sous l'en-tête (0, 1, …),
+    stable d'une lecture à l'autre : il sert de repère à l'ingestion incrémentale.
+    """
+    wb = openpyxl.load_workbook(input_path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+
+        # 1. Détecter la ligne d'en-tête contenant 'DATE'
+        header = None
+        for row in rows:
+            if row and str(row[0]).strip().lower() == 'date':
+                header = row
+                break
+        if header is None:
+            raise ValueError("Ligne d'en-tête 'DATE' introuvable.")
+
+        # 2. Colonnes retenues : en-tête non vide (la 1re colonne porte les dates)
+        keep = [0] + [i for i, name in enumerate(header)
+                      if i > 0 and name is not None and str(name).strip() != ""]
+        names = [header[i] for i in keep]
+        width = max(keep) + 1
+
+        def to_frame(buffer, start):
+            chunk = pd.DataFrame.from_records(buffer, columns=names)
+            chunk.index = pd.RangeIndex(start, start + len(buffer))
+            chunk[names[1:]] = chunk[names[1:]].apply(pd.to_numeric, errors='coerce')
+            return chunk
+
+        buffer, start = [], 0
+        for row in rows:
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            buffer.append([row[i] for i in keep])
+            if len(buffer) >= chunk_size:
+                yield to_frame(buffer, start)
+                start += len(buffer)
+                buffer = []
+        if buffer:
+            yield to_frame(buffer, start)
+    finally:
+        wb.close()
+
+
+def _parse_raw_dates(df):
+    # 3. Convertir la première colonne en datetime (papier français)
+    df = df.copy()
+    df['Date'] = parse_french_dates(df[df.columns[0]])
+    return df
 
 
+def _tail_checksum(parsed):
+    """Empreinte (dates + valeurs numériques + noms de colonnes) d'un bloc de lignes brutes."""
+    parsed = parsed.dropna(subset=['Date'])
+    values = parsed.drop(columns=[parsed.columns[0], 'Date']).apply(pd.to_numeric, errors='coerce')
+    h = hashlib.sha1("|".join(map(str, values.columns)).encode("utf-8"))
+    h.update(parsed['Date'].to_numpy().astype('datetime64[D]').tobytes())
+    h.update(values.to_numpy(dtype=float, na_value=np.nan).tobytes())
+    return h.hexdigest()
 
-def update_all_historicals():
-    # 1. Mise à jour de la donnée principale (boutiques/cartes)
-    process(RAW_HISTORICAL_FILE, HISTORICAL_FILE)
-
-    # 2. Mise à jour des données météo brutes
-    print("🔄 Mise à jour du fichier météo…")
-    histo_path = HISTORICAL_EXOG
-    if not pd.io.common.file_exists(histo_path):
-        raise FileNotFoundError(f"Fichier météo {histo_path} introuvable.")
-    histo = pd.read_excel(histo_path)
-    # Détection robuste de la colonne date
-    date_col = next((col for col in histo.columns if col.lower() == 'date'), None)
-    if not date_col:
-        raise ValueError("Aucune colonne 'date' trouvée dans l'historique météo.")
-    histo[date_col] = pd.to_datetime(histo[date_col])
-    date_min = histo[date_col].min()
-    date_max = histo[date_col].max()
-
-   # 3. Date max fixée à aujourd'hui
-    date_max = pd.Timestamp(datetime.today().date())
 
-    # 4. Mise à jour des données météo brutes jusqu'à aujourd'hui
-    print("🔄 Mise à jour du fichier météo…")
-    histo_path = HISTORICAL_EXOG
-    if not pd.io.common.file_exists(histo_path):
-        raise FileNotFoundError(f"Fichier météo {histo_path} introuvable.")
-    fetcher = WeatherDataFetcher(LAT, LON, proxy_url="http://localhost:3128")
-    fetcher.update_historic_file(histo_path, date_max)
+class _ResumeMismatch(Exception):
+    """Le brut ou le classeur hebdo ne correspond plus à l'état mémorisé : reconstruction complète nécessaire."""
 
 
-    # 4. Génération et sauvegarde du fichier exogène complet via exo_var
-    print("🧩 Calcul des variables exogènes complètes…")
-    exog_df = exo_var(date_min, date_max)
+def _aggregate_stream(chunks, resume=None):
+    """
+    Agrège les blocs bruts en semaines sans jamais matérialiser toute la feuille.
 
-    # 5. Nettoyage (suppression des lignes avec valeurs manquantes)
-    cols_obligatoires = ['Date', 'Annee', 'Semaine',
-                         'temperature_max', 'temperature_min', 'precipitation',
-                         'is_vacation', 'is_public_holiday', 'days_in_week']
-    exog_df = exog_df.dropna(subset=cols_obligatoires, how='any')
+    resume = (last_date, n_rows, tail_checksum) : les lignes < n_rows sont sautées
+    sans conversion, hormis les TAIL_CHECK_ROWS dernières dont l'empreinte est
+    vérifiée (_ResumeMismatch si elle diffère ou si la feuille a raccourci).
 
+    Renvoie (weekly, last_row, tail) : semaines complètes [Annee, Semaine, boutiques…],
+    position du dernier jour retenu et dernières lignes converties (pour l'état suivant).
+    """
+    n_rows = resume[1] if resume else 0
+    check_from = max(0, n_rows - TAIL_CHECK_ROWS)
+    check_rows, checked = [], resume is None
+    sums, bounds = [], []
+    tail = None
+
+    def verify():
+        parsed = _parse_raw_dates(pd.concat(check_rows)) if check_rows else None
+        if parsed is None or parsed.index.max() != n_rows - 1 or _tail_checksum(parsed) != resume[2]:
+            raise _ResumeMismatch("Brut modifié avant la dernière date ingérée")
+        return parsed
+
+    for chunk in chunks:
+        if not checked:
+            check_rows.append(chunk.loc[check_from:n_rows - 1])
+            if chunk.index.max() < n_rows:
+                continue
+            tail = verify()
+            checked = True
+        chunk = chunk.loc[n_rows:]
+        if chunk.empty:
+            continue
+
+        # 4. Conversion des dates et semaines du calendrier maison, bloc par bloc
+        parsed = _parse_raw_dates(chunk).dropna(subset=['Date'])
+        if parsed.empty:
+            continue
+        # Lignes datées seulement (comme _tail_checksum) : des lignes vides en fin de
+        # feuille ne doivent pas chasser la dernière semaine complète de la fenêtre
+        tail = pd.concat([tail, parsed]).iloc[-(TAIL_CHECK_ROWS + 32):]
+        parsed['Annee'], parsed['Semaine'] = date_to_week(parsed['Date'])
+        parsed['row'] = parsed.index
+        by_week = parsed.groupby(['Annee', 'Semaine'])
+        shops = [c for c in chunk.columns[1:]]
+        sums.append(by_week[shops].sum(min_count=1))
+        bounds.append(by_week.agg(first=('Date', 'min'), last=('Date', 'max'), row=('row', 'max')))
+    if not checked:
+        tail = verify()
+
+    if not sums:
+        return pd.DataFrame(columns=['Annee', 'Semaine']), None, tail
+
+    # 5. Somme par année/semaine (semaines à cheval sur deux blocs recombinées) ;
+    # toutes les colonnes du brut sont conservées, même sans valeur sur la période
+    weekly = pd.concat(sums).groupby(level=['Annee', 'Semaine']).sum(min_count=1)
+    weekly = weekly.fillna(0)
+    integral = [c for c in weekly.columns if (weekly[c] % 1 == 0).all()]
+    weekly[integral] = weekly[integral].astype('int64')
+    bounds = pd.concat(bounds).groupby(level=['Annee', 'Semaine']).agg(
+        {'first': 'min', 'last': 'max', 'row': 'max'})
+
+    # Dernière semaine brute : complète seulement si elle atteint sa fin calendaire
+    # (dimanche ou 31/12 ; la semaine 1 et la dernière de l'année font moins de 7 jours)
+    (last_annee, last_semaine), last = bounds.index[-1], bounds.iloc[-1]
+    if last['last'] < week_end([last['last']])[0]:
+        weekly = weekly.drop(index=(last_annee, last_semaine))
+        bounds = bounds.drop(index=(last_annee, last_semaine))
+        print(f"[INFO] Semaine {last_semaine} de {last_annee} retirée car incomplète (dates du {last['first']} au {last['last']}).")
+
+    last_row = int(bounds['row'].max()) if not bounds.empty else None
+    return weekly.reset_index(), last_row, tail
+
+
+def _upsert_weeks_xlsx(output_path, weekly):
+    """
+    Reporte les semaines de weekly dans le classeur hebdo existant, cellule par cellule :
+    lignes (Annee, Semaine) déjà présentes remplacées, nouvelles lignes ajoutées à la
+    suite. Les autres semaines ne passent pas par pandas. _ResumeMismatch si les
+    colonnes du classeur ne sont plus celles du brut.
+    """
+    wb = openpyxl.load_workbook(output_path)
     try:
-        exog_df.to_excel(histo_path, index=False)
-        print("✅ Fichier météo + exogènes mis à jour et complété.")
-    except PermissionError:
-        print(f"❌ Impossible d’écrire dans {histo_path}. Fermez le fichier Excel, puis réessayez.")
-        raise
+        ws = wb.worksheets[0]
+        col_of = {cell.value: cell.column for cell in ws[1] if cell.value is not None}
+        if set(col_of) != set(weekly.columns):
+            raise _ResumeMismatch(f"Colonnes de {os.path.basename(output_path)} différentes du brut")
+        keys = ws.iter_rows(min_row=2, values_only=True)
+        row_of = {(row[col_of['Annee'] - 1], row[col_of['Semaine'] - 1]): r
+                  for r, row in enumerate(keys, start=2)}
+        next_row = ws.max_row + 1
+        columns = {name: weekly[name].tolist() for name in weekly.columns}
+        for i, key in enumerate(zip(columns['Annee'], columns['Semaine'])):
+            r = row_of.get(key)
+            if r is None:
+                r, next_row = next_row, next_row + 1
+            for name, values in columns.items():
+                ws.cell(row=r, column=col_of[name], value=values[i])
+        wb.save(output_path)
+    finally:
+        wb.close()
+
+
+def process(input_path, output_path, incremental=False, db_path=DB_PATH):
+    """
+    Agrège le brut journalier en semaines du calendrier maison et écrit output_path.
+    Le classeur brut est lu en flux, en une seule passe.
+
+    incremental=True : reprend après la dernière ingestion (mémorisée en base) si
+    l'empreinte des dernières lignes déjà ingérées est inchangée ; seules les
+    nouvelles lignes sont converties et agrégées, et seules les semaines concernées
+    sont écrites (ajoutées / remplacées) dans output_path et flux_weekly. Sinon (ou si
+    l'empreinte diffère) : reconstruction complète, qui remplace aussi flux_weekly.
+    """
+    db = DatabaseManager(db_path)
+    state = None
+    if incremental and os.path.exists(output_path):
+        state = db.get_ingest_state(INGEST_SOURCE)
+
+    if state is not None:
+        try:
+            weekly, last_row, tail = _aggregate_stream(iter_raw_daily_chunks(input_path), resume=state)
+            print(f"[INFO] Ingestion incrémentale après le {state[0]}.")
+            if weekly.empty:
+                print("[INFO] Aucune nouvelle semaine complète à ingérer.")
+                return
+            # 6. Enregistrer les seules semaines nouvelles ou modifiées
+            _upsert_weeks_xlsx(output_path, weekly)
+        except _ResumeMismatch as e:
+            print(f"[INFO] {e} : reconstruction complète.")
+            state = None
+    if state is None:
+        weekly, last_row, tail = _aggregate_stream(iter_raw_daily_chunks(input_path))
+        # 6. Enregistrer
+        weekly.to_excel(output_path, index=False)
+    print(f"Enregistré dans {output_path}")
+    store_weekly_flux(weekly, db_path, replace=state is None)
 
+    if last_row is not None:
+        n_rows = last_row + 1
+        tail = tail.loc[max(0, n_rows - TAIL_CHECK_ROWS):last_row]
+        last_date = tail['Date'].max()
+        if pd.notna(last_date):
+            db.set_ingest_state(INGEST_SOURCE, last_date.strftime("%Y-%m-%d"), n_rows, _tail_checksum(tail))
+        else:
+            print("[WARNING] Dernière date ingérée introuvable : état non mémorisé, prochaine ingestion complète.")
 
-def update_all_historicals():
-    process(RAW_HISTORICAL_FILE, HISTORICAL_FILE)
-
-    print("🔄 Mise à jour du fichier météo…")
-    histo_path = HISTORICAL_EXOG
-    if not pd.io.common.file_exists(histo_path):
-        raise FileNotFoundError(f"Fichier météo {histo_path} introuvable.")
-    histo = pd.read_excel(histo_path)
-    date_col = next((col for col in histo.columns if col.lower() == 'date'), None)
-    if not date_col:
-        raise ValueError("Aucune colonne 'date' trouvée dans l'historique météo.")
-    histo[date_col] = pd.to_datetime(histo[date_col])
-    date_min = histo[date_col].min()
+
+def store_weekly_flux(weekly, db_path=DB_PATH, replace=False):
+    """
+    Reporte l'agrégat hebdo (Annee, Semaine, une colonne par boutique)
+    dans la table flux_weekly, au format long, par upsert groupé.
+    replace=True (reconstruction complète) : le contenu précédent de la table est remplacé.
+    """
+    db = DatabaseManager(db_path)
+    ids = db.get_boutique_ids()
+    shops = [c for c in weekly.columns if c not in ("Annee", "Semaine")]
+    unknown = [c for c in shops if normalize_name(c) not in ids]
+    if unknown:
+        print(f"[INFO] Colonnes sans boutique correspondante (non stockées en base) : {unknown}")
+
+    dates = week_to_date(weekly["Annee"], weekly["Semaine"]).strftime("%Y-%m-%d")
+    annees = weekly["Annee"].astype(int).tolist()
+    semaines = weekly["Semaine"].astype(int).tolist()
+    rows = [
+        (ids[normalize_name(shop)], d, a, s, None if pd.isna(v) else float(v))
+        for shop in shops if normalize_name(shop) in ids
+        for d, a, s, v in zip(dates, annees, semaines, weekly[shop].tolist())
+    ]
+    if replace:
+        db.replace_flux_weekly(rows)
+    else:
+        db.upsert_flux_weekly(rows)
+    print(f"[INFO] {len(rows)} lignes hebdo enregistrées dans flux_weekly.")
+
+
+
+
+def update_weather_histories():
+    """
+    Complète l'historique météo journalier (ajout des seuls jours manquants, partition de
+    l'année en cours réécrite) puis la table exogène hebdo dérivée (exog_weekly).
+    Météo_SUD.xlsx n'est plus réécrit : journalier, il amorce le store ; hebdo, ses semaines
+    restent l'historique et le store vide n'est complété qu'après sa dernière semaine.
+    Renvoie le rapport {"added": jours ajoutés, "failed_dates": jours en échec (point
+    LAT/LON), "failed_locations": {maille: jours en échec}} ; les jours en échec sont
+    redemandés à la mise à jour suivante.
+    """
+    print("🔄 Mise à jour de l'historique météo journalier…")
+    store = get_daily_weather_store()
     date_max = pd.Timestamp(datetime.today().date())
+    date_start = None
+    legacy = read_legacy_weekly()
+    if not store.has_history() and not legacy.empty:
+        date_start = week_end(legacy['date'].iloc[-1:])[0] + pd.Timedelta(days=1)
+    added, failed_dates = WeatherDataFetcher(LAT, LON).update_daily_store(store, date_max, date_start)
+    failed_locations = {}
+    if USE_BOUTIQUE_WEATHER:
+        added_locations, failed_locations = update_location_histories(date_max)
+        added += added_locations
+
+    print("🧩 Mise à jour des variables exogènes hebdo…")
+    date_min = store.first_date() or date_max
+    get_exog_store().refresh(date_min, date_max)
+    print("✅ Historique météo et variables exogènes à jour.")
+    return {"added": added, "failed_dates": failed_dates, "failed_locations": failed_locations}
 
-    fetcher = WeatherDataFetcher(LAT, LON, proxy_url="http://localhost:3128")
-    fetcher.update_historic_file(histo_path, date_max)
 
-    print("🧩 Calcul des variables exogènes complètes…")
-    exog_df = exo_var(date_min, date_max)
-    cols_obligatoires = ['Date', 'Annee', 'Semaine',
-                         'temperature_max', 'temperature_min', 'precipitation',
-                         'is_vacation', 'is_public_holiday', 'days_in_week']
-    exog_df = exog_df.dropna(subset=cols_obligatoires, how='any')
-    try:
-        exog_df.to_excel(histo_path, index=False)
-        print("✅ Fichier météo + exogènes mis à jour et complété.")
-    except PermissionError:
-        print(f"❌ Impossible d’écrire dans {histo_path}. Fermez le fichier Excel, puis réessayez.")
-        raise
\ No newline at end of file
+def update_all_historicals():
+    """Brut → historique hebdo, puis météo ; renvoie le rapport de update_weather_histories."""
+    # 1. Mise à jour de la donnée principale (boutiques/cartes)
+    process(RAW_HISTORICAL_FILE, HISTORICAL_FILE, incremental=True)
+
+    # 2. Historique météo journalier (Parquet par année) complété jusqu'à aujourd'hui
+    return update_weather_histories()
@@ -0,0 +1,128 @@
+"""
+Calendrier hebdomadaire « maison », unique pour toute l'application.
+
+Semaine 1 : du 1er janvier au premier dimanche inclus.
+Semaine 2+ : lundi → dimanche. La dernière semaine s'arrête au 31 décembre.
+
+Tout repose sur une table précalculée jour → (année, semaine, début, nb de jours)
+couvrant 1990–2100 : les conversions sont de simples indexations NumPy.
+"""
+import numpy as np
+import pandas as pd
+
+CALENDAR_START = np.datetime64("1990-01-01", "D")
+CALENDAR_END = np.datetime64("2100-12-31", "D")
+
+
+def _build_tables():
+    days = np.arange(CALENDAR_START, CALENDAR_END + 1, dtype="datetime64[D]")
+    jan1 = days.astype("datetime64[Y]").astype("datetime64[D]")
+    dec31 = (days.astype("datetime64[Y]") + 1).astype("datetime64[D]") - 1
+    # 1970-01-01 était un jeudi : lundi = 0 … dimanche = 6
+    jan1_weekday = (jan1.astype(np.int64) + 3) % 7
+    first_sunday = jan1 + (6 - jan1_weekday)
+
+    years = days.astype("datetime64[Y]").astype(np.int64) + 1970
+    weeks = np.where(days <= first_sunday, 1,
+                     2 + (days - first_sunday - 1).astype(np.int64) // 7)
+    starts = np.where(weeks == 1, jan1, first_sunday + 1 + (weeks - 2) * 7)
+    ends = np.minimum(np.where(weeks == 1, first_sunday, starts + 6), dec31)
+
+    # Une ligne par semaine : premier jour de chaque semaine dans la table jour
+    first_day = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    day_week_id = np.cumsum(np.r_[True, starts[1:] != starts[:-1]]) - 1
+    week_table = {
+        "year": years[first_day].astype(np.int16),
+        "week": weeks[first_day].astype(np.int8),
+        "week_start": starts[first_day],
+        "week_end": ends[first_day],
+        "days_in_week": ((ends - starts).astype(np.int64) + 1)[first_day].astype(np.int8),
+    }
+    # Ligne de la semaine 1 de chaque année : week_id = offset[année] + semaine - 1
+    year_offset = np.flatnonzero(week_table["week"] == 1)
+    year_weeks = np.diff(np.r_[year_offset, len(first_day)])
+    return day_week_id, week_table, year_offset, year_weeks
+
+
+_DAY_WEEK_ID, _WEEKS, _YEAR_OFFSET, _YEAR_NB_WEEKS = _build_tables()
+_FIRST_YEAR = int(_WEEKS["year"][0])
+
+
+def _day_index(dates) -> np.ndarray:
+    days = pd.DatetimeIndex(pd.to_datetime(dates)).to_numpy().astype("datetime64[D]")
+    if np.isnat(days).any():
+        raise ValueError("Dates manquantes (NaT) : conversion calendaire impossible.")
+    idx = (days - CALENDAR_START).astype(np.int64)
+    if len(idx) and (idx.min() < 0 or idx.max() >= len(_DAY_WEEK_ID)):
+        raise ValueError(f"Dates hors du calendrier {CALENDAR_START} → {CALENDAR_END}.")
+    return idx
+
+
+def week_ids(dates) -> np.ndarray:
+    """Identifiant global (ligne de la table des semaines) de la semaine de chaque date."""
+    return _DAY_WEEK_ID[_day_index(dates)]
+
+
+def date_to_week(dates) -> tuple[np.ndarray, np.ndarray]:
+    """Dates → (Annee, Semaine) du calendrier maison, en tableaux d'entiers."""
+    ids = week_ids(dates)
+    return _WEEKS["year"][ids].astype(np.int64), _WEEKS["week"][ids].astype(np.int64)
+
+
+def week_start(dates) -> pd.DatetimeIndex:
+    """Premier jour (non tronqué) de la semaine contenant chaque date."""
+    return pd.DatetimeIndex(_WEEKS["week_start"][week_ids(dates)].astype("datetime64[ns]"))
+
+
+def week_end(dates) -> pd.DatetimeIndex:
+    """Dernier jour (dimanche ou 31 décembre) de la semaine contenant chaque date."""
+    return pd.DatetimeIndex(_WEEKS["week_end"][week_ids(dates)].astype("datetime64[ns]"))
+
+
+def week_to_date(annees, semaines) -> pd.DatetimeIndex:
+    """
+    (Annee, Semaine) → date de début de semaine. NaT si la semaine n'existe pas
+    (ex. semaine 54) ou si l'année sort du calendrier.
+    """
+    annees = np.asarray(annees, dtype=np.int64)
+    semaines = np.asarray(semaines, dtype=np.int64)
+    y = annees - _FIRST_YEAR
+    valid = (y >= 0) & (y < len(_YEAR_OFFSET))
+    y = np.where(valid, y, 0)
+    valid &= (semaines >= 1) & (semaines <= _YEAR_NB_WEEKS[y])
+    ids = np.where(valid, _YEAR_OFFSET[y] + semaines - 1, 0)
+    starts = _WEEKS["week_start"][ids].astype("datetime64[ns]")
+    return pd.DatetimeIndex(np.where(valid, starts, np.datetime64("NaT", "ns")))
+
+
+def weeks_between(start_date, end_date) -> pd.DataFrame:
+    """
+    Semaines couvrant [start_date, end_date] : colonnes year, week, week_start,
+    week_end, days_in_week. Les semaines de bord sont tronquées à la période.
+    """
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    if end < start:
+        return pd.DataFrame(columns=["year", "week", "week_start", "week_end", "days_in_week"])
+    lo, hi = _day_index([start, end])
+    ids = _DAY_WEEK_ID[lo:hi + 1]
+    first = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    last = np.r_[first[1:] - 1, len(ids) - 1]
+    week_rows = ids[first]
+
+    day0 = CALENDAR_START + lo
+    return pd.DataFrame({
+        "year": _WEEKS["year"][week_rows].astype(np.int64),
+        "week": _WEEKS["week"][week_rows].astype(np.int64),
+        "week_start": (day0 + first).astype("datetime64[ns]"),
+        "week_end": (day0 + last).astype("datetime64[ns]"),
+        "days_in_week": (last - first + 1).astype(np.int64),
+    })
+
+
+def compute_custom_week_counts_for_period(start_date, end_date):
+    """
+    Pour la période [start_date, end_date], découpage en semaines avec les bornes
+    réelles (tronquées à la période). Nom historique conservé pour les appelants.
+    """
+    return weeks_between(start_date, end_date)
@@ -1,64 +1,132 @@
+import threading
 import pandas as pd
-import numpy as np
-from config import HISTORICAL_FILE
+from config import HISTORICAL_FILE, DB_PATH
+from app.database.database_manager import DatabaseManager, normalize_name
+from app.utils.excel_cache import read_excel_cached, file_signature
+from app.utils.lags import lag_matrices
+from app.utils.custom_calendar import week_to_date
 import locale
 
 locale.setlocale(locale.LC_TIME, "fr_FR.UTF-8")   # ou "fr_FR" sous Windows
 
-def week_to_custom_date(year, week):
-    first_jan = pd.Timestamp(year, 1, 1)
-    first_jan_weekday = first_jan.weekday()
-    if week == 1:
-        return first_jan
-    else:
-        days_until_next_monday = (7 - first_jan_weekday) % 7
-        first_monday = first_jan + pd.Timedelta(days=days_until_next_monday)
-        week_start = first_monday + pd.Timedelta(weeks=week - 2)
-        return week_start
+class HistoryStore:
+    """
+    Historique hebdo de TOUTES les boutiques, chargé une seule fois par version
+    du fichier source (rechargement automatique si mtime/taille changent).
+
+    - wide   : matrice Date × boutiques
+    - cal_df : calendrier [Date, Annee, Semaine], sans doublons
+    - lags   : {k: matrice N-k alignée sur wide}
+
+    Les objets renvoyés sont partagés : ne pas les modifier en place.
+    """
+
+    def __init__(self, path: str = HISTORICAL_FILE):
+        self.path = path
+        # (signature, wide, cal_df, lags) remplacé d'un bloc par refresh()
+        self._state = (None, None, None, {})
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self):
+        return self._state[0]
+
+    @property
+    def wide(self):
+        return self._state[1]
+
+    @property
+    def cal_df(self):
+        return self._state[2]
+
+    @property
+    def lags(self):
+        return self._state[3]
+
+    def _load(self):
+        """(wide, cal_df, lags) lus depuis le fichier source."""
+        df = read_excel_cached(self.path)
+        if isinstance(df.index, pd.MultiIndex):
+            df = df.reset_index()
+
+        df = df.dropna(subset=["Annee", "Semaine"])
+        df["Annee"] = df["Annee"].astype(int)
+        df["Semaine"] = df["Semaine"].astype(int)
+
+        df["Date"] = week_to_date(df["Annee"], df["Semaine"])
+        if df["Date"].isna().any():
+            print("[WARNING] Semaines inexistantes ignorées :", df[df["Date"].isna()][["Annee", "Semaine"]].values.tolist())
+            df = df.dropna(subset=["Date"])
+        df = df.sort_values(["Annee", "Semaine", "Date"]).reset_index(drop=True)
+        # Suppression explicite des doublons de Date (on garde le dernier)
+        if df["Date"].duplicated().any():
+            print("[DEBUG] Doublons trouvés, suppression :", df[df["Date"].duplicated(keep=False)][["Annee","Semaine","Date"]])
+            df = df.drop_duplicates(subset="Date", keep="last")
+        df = df.reset_index(drop=True)
+
+        shops = [c for c in df.columns if c not in ("Date", "Annee", "Semaine")]
+        wide = df.set_index("Date")[shops]
+        cal_df = df[["Date", "Annee", "Semaine"]].copy()
+        # Décalage des lags par recherche SEMAINE+ANNEE et non pas juste index
+        return wide, cal_df, lag_matrices(wide, cal_df, lags=(1, 2))
+
+    def refresh(self):
+        """Recharge l'historique si le fichier source a changé depuis le dernier chargement."""
+        signature = file_signature(self.path)
+        if signature == self.signature:
+            return
+        with self._lock:
+            if signature != self.signature:
+                print(f"[INFO] Chargement de l'historique hebdo ({self.path})")
+                self._state = (signature,) + self._load()
+
+    def shops(self) -> list[str]:
+        self.refresh()
+        return list(self.wide.columns)
+
+    def get(self, cible: str):
+        """(y_hist, hist_n1, hist_n2, cal_df) pour une boutique, sans relecture."""
+        self.refresh()
+        _, wide, cal_df, lags = self._state
+        if cible not in wide.columns:
+            raise ValueError(f"Cible « {cible} » introuvable dans l’historique.")
+        return wide[cible], lags[1][cible], lags[2][cible], cal_df
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Instance unique (par processus) du HistoryStore."""
+    global _history_store
+    if _history_store is None:
+        with _history_store_lock:
+            if _history_store is None:
+                _history_store = HistoryStore()
+    return _history_store
 
-def week_to_date(row):
-    return week_to_custom_date(int(row['Annee']), int(row['Semaine']))
 
 def load_historical_data(cible: str):
     """
     Charge l’historique de la cible, renvoie une série hebdo unique
     et un calendrier [Date, Année, Semaine], sans doublons.
     """
-    print("\n=== [DEBUG] Début load_historical_data ===")
-
-    df = pd.read_excel(HISTORICAL_FILE)
-    if isinstance(df.index, pd.MultiIndex):
-        df = df.reset_index()
-
-    df = df.dropna(subset=["Annee", "Semaine"])
-    df["Annee"] = df["Annee"].astype(int)
-    df["Semaine"] = df["Semaine"].astype(int)
-
-    df["Date"] = df.apply(week_to_date, axis=1)
-    df = df.sort_values(["Annee", "Semaine", "Date"]).reset_index(drop=True)
-    # Suppression explicite des doublons de Date (on garde le dernier)
-    if df["Date"].duplicated().any():
-        print("[DEBUG] Doublons trouvés, suppression :", df[df["Date"].duplicated(keep=False)][["Annee","Semaine","Date"]])
-        df = df.drop_duplicates(subset="Date", keep="last")
-    df = df.reset_index(drop=True)
-
-    if cible not in df.columns:
-        raise ValueError(f"Cible « {cible} » introuvable dans l’historique.")
-    y_hist = df.set_index("Date")[cible]
-    cal_df = df[["Date", "Annee", "Semaine"]].copy()
-
-    # Décalage des lags par recherche SEMAINE+ANNEE et non pas juste index
-    def lag_date(date, lag_years):
-        year = date.year - lag_years
-        week = date.isocalendar().week
-        # On cherche la 1e date qui a même (année, semaine)
-        match = cal_df[(cal_df["Annee"] == year) & (cal_df["Semaine"] == week)]
-        return match["Date"].iloc[0] if not match.empty else pd.NaT
-
-    hist_n1 = y_hist.reindex([lag_date(d, 1) for d in y_hist.index])
-    hist_n2 = y_hist.reindex([lag_date(d, 2) for d in y_hist.index])
-    hist_n1.index = y_hist.index
-    hist_n2.index = y_hist.index
-
-    print("=== [DEBUG] Fin load_historical_data ===\n")
-    return y_hist, hist_n1, hist_n2, cal_df
+    return get_history_store().get(cible)
+
+
+def load_shop_history(cible: str, start=None, end=None) -> pd.Series:
+    """
+    Série hebdo d'une boutique sur [start, end] lue dans flux_weekly (requête indexée),
+    sans lecture de classeur. Repli sur le HistoryStore si la base n'est pas alimentée.
+    """
+    db = DatabaseManager(DB_PATH)
+    id_boutique = db.get_boutique_ids().get(normalize_name(cible))
+    start = None if start is None else pd.Timestamp(start).strftime("%Y-%m-%d")
+    end = None if end is None else pd.Timestamp(end).strftime("%Y-%m-%d")
+    rows = db.get_flux_weekly(id_boutique, start, end) if id_boutique is not None else []
+    if not rows:
+        y_hist = get_history_store().get(cible)[0]
+        return y_hist.loc[start:end]
+    dates, _, _, values = zip(*rows)
+    return pd.Series(values, index=pd.DatetimeIndex(pd.to_datetime(dates), name="Date"), name=cible)
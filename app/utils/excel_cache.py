@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import pandas as pd
+from config import CACHE_DIR
+
+# Parquet nécessite pyarrow : sans lui on retombe sur une lecture Excel directe
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    pq = None
+
+EXCEL_CACHE_DIR = os.path.join(CACHE_DIR, "excel")
+
+
+def file_signature(path) -> tuple[str, int, int]:
+    """
+    Signature d'un fichier source : (chemin absolu, mtime en ns, taille).
+    Toute modification du classeur (réécriture, sauvegarde Excel) la change.
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+def _cache_prefix(path) -> str:
+    abs_path = os.path.abspath(path)
+    base = os.path.splitext(os.path.basename(abs_path))[0]
+    path_key = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:8]
+    return f"{base}-{path_key}-"
+
+
+def _cache_path(path, read_kwargs, cache_dir) -> str:
+    _, mtime_ns, size = file_signature(path)
+    kw_key = hashlib.sha1(
+        json.dumps(read_kwargs, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:8]
+    return os.path.join(cache_dir, f"{_cache_prefix(path)}{mtime_ns}-{size}-{kw_key}.parquet")
+
+
+def _purge_stale(path, current, cache_dir):
+    """Supprime les conversions d'une ancienne version du même classeur."""
+    prefix = _cache_prefix(path)
+    signature = os.path.basename(current).rsplit("-", 1)[0] + "-"
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and not name.startswith(signature):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+
+
+def _project(df, columns):
+    return df if columns is None else df[list(columns)]
+
+
+def read_excel_cached(path, columns=None, cache_dir=None, **read_kwargs) -> pd.DataFrame:
+    """
+    Équivalent de ``pd.read_excel(path, **read_kwargs)`` servi depuis un cache Parquet.
+
+    - Le classeur est converti une seule fois par version (chemin + mtime + taille).
+    - Les lectures suivantes ne lisent que les colonnes demandées (``columns``).
+    - Si la conversion échoue (types mixtes, pyarrow absent…), on lit l'Excel directement.
+    """
+    if pq is None:
+        return _project(pd.read_excel(path, **read_kwargs), columns)
+
+    cache_dir = cache_dir or EXCEL_CACHE_DIR
+    cache_path = _cache_path(path, read_kwargs, cache_dir)
+    if os.path.exists(cache_path):
+        try:
+            if columns is not None:
+                missing = [c for c in columns if c not in pq.read_schema(cache_path).names]
+                if missing:
+                    raise KeyError(f"Colonnes absentes de {os.path.basename(path)} : {missing}")
+            return pd.read_parquet(cache_path, columns=None if columns is None else list(columns))
+        except KeyError:
+            raise
+        except Exception as e:
+            print(f"[WARNING] Cache illisible {cache_path} ({e}), relecture du classeur.")
+
+    df = pd.read_excel(path, **read_kwargs)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        if not all(isinstance(c, str) for c in df.columns):
+            raise TypeError("noms de colonnes non textuels")
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        _purge_stale(path, cache_path, cache_dir)
+    except Exception as e:
+        print(f"[INFO] {os.path.basename(path)} non mis en cache : {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return _project(df, columns)
@@ -1,4 +1,7 @@
-from datetime import datetime, timedelta
+from datetime import datetime
+import hashlib
+import threading
+import time
 import pandas as pd
 import numpy as np
 import holidays
@@ -6,9 +9,14 @@ import os
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import make_pipeline
 from sklearn.linear_model import Ridge
-import requests
-from app.utils.weather_fetcher import WeatherDataFetcher, compute_custom_week_counts_for_period
-from config import LAT, LON, API_METEO_URL, PROXY_URL, HISTORICAL_EXOG
+from app.utils.weather_fetcher import WeatherDataFetcher, grid_cell, group_by_cell
+from app.utils.weather_backends import WeatherBackendError, get_weather_backend
+from app.utils.custom_calendar import compute_custom_week_counts_for_period, week_start, week_end
+from app.utils.excel_cache import read_excel_cached, file_signature
+from app.utils.weather_store import DailyWeatherStore, get_daily_weather_store, read_legacy_weekly
+from app.utils.http_cache import cache_key, get_response_cache
+from app.database.database_manager import DatabaseManager, EXOG_WEEKLY_COLUMNS, normalize_name
+from config import LAT, LON, DB_PATH, USE_BOUTIQUE_WEATHER, HISTORICAL_EXOG
 
 
 
@@ -39,6 +47,55 @@ def is_public_holiday(date: datetime) -> int:
     fr_holidays = holidays.France(years=date.year)
     return int(date in fr_holidays)
 
+
+# Versions vectorisées (mêmes règles que is_vacation / is_public_holiday)
+# Bornes mois*100 + jour ; Noël court jusqu'au 8 janvier de l'année suivante (fin d'année entière)
+VACATION_RANGES = [(218, 306), (415, 502), (701, 831), (1021, 1106), (1223, 1232)]
+
+
+def vacation_flags(dates: pd.Series) -> np.ndarray:
+    """is_vacation pour toute une colonne de dates (les 1er–8 janvier ne sont pas comptés, comme is_vacation)."""
+    dates = pd.to_datetime(dates)
+    month_day = (dates.dt.month * 100 + dates.dt.day).to_numpy()
+    # Une date avec heure après minuit n'est plus dans la période le dernier jour
+    after_midnight = (dates != dates.dt.normalize()).to_numpy()
+    flags = np.zeros(len(dates), dtype=np.int64)
+    for lo, hi in VACATION_RANGES:
+        flags |= (month_day >= lo) & ((month_day < hi) | ((month_day == hi) & ~after_midnight))
+    return flags
+
+
+def public_holiday_flags(dates: pd.Series) -> np.ndarray:
+    """is_public_holiday pour toute une colonne de dates (un seul calendrier des fériés)."""
+    dates = pd.to_datetime(dates)
+    years = dates.dt.year.dropna().unique().astype(int).tolist()
+    fr_holidays = np.array(sorted(holidays.France(years=years)), dtype="datetime64[ns]")
+    return dates.dt.normalize().isin(fr_holidays).to_numpy().astype(np.int64)
+
+
+def assign_custom_weeks(dates: pd.Series, week_counts: pd.DataFrame) -> np.ndarray:
+    """
+    Position (ligne de week_counts) de la semaine contenant chaque date, par recherche
+    dichotomique sur les débuts de semaine triés ; -1 si la date n'est couverte par aucune.
+    """
+    dates = pd.to_datetime(dates).to_numpy()
+    starts = pd.to_datetime(week_counts['week_start']).to_numpy()
+    ends = pd.to_datetime(week_counts['week_end']).to_numpy()
+    pos = np.searchsorted(starts, dates, side='right') - 1
+    inside = (pos >= 0) & (dates <= ends[np.clip(pos, 0, None)]) if len(starts) else np.zeros(len(dates), bool)
+    return np.where(inside, pos, -1)
+
+
+def _week_columns(dates: pd.Series, week_counts: pd.DataFrame):
+    """(année, semaine) de chaque date ; NaN pour les dates non couvertes."""
+    pos = assign_custom_weeks(dates, week_counts)
+    years = week_counts['year'].to_numpy()
+    weeks = week_counts['week'].to_numpy()
+    if (pos >= 0).all():
+        return years[pos], weeks[pos]
+    return (np.where(pos >= 0, years[pos].astype(float), np.nan),
+            np.where(pos >= 0, weeks[pos].astype(float), np.nan))
+
 def add_exogenous_variables(df: pd.DataFrame) -> pd.DataFrame:
     # Accepte aussi bien 'date' que 'Date'
     if 'date' not in df.columns:
@@ -51,18 +108,12 @@ def add_exogenous_variables(df: pd.DataFrame) -> pd.DataFrame:
     # Ajouter les colonnes Annee et Semaine
     start_date = df['date'].min()
     end_date = df['date'].max()
-    week_counts = compute_custom_week_counts_for_period(start_date, end_date)
-
-    def get_year_and_week(date):
-        week_info = week_counts[(week_counts['week_start'] <= date) & (week_counts['week_end'] >= date)]
-        if not week_info.empty:
-            return week_info.iloc[0]['year'], week_info.iloc[0]['week']
-        return None, None
-
-    df['Annee'], df['Semaine'] = zip(*df['date'].apply(lambda x: get_year_and_week(x)))
+    week_counts = (compute_custom_week_counts_for_period(start_date, end_date)
+                   if not df.empty else pd.DataFrame(columns=['year', 'week', 'week_start', 'week_end']))
+    df['Annee'], df['Semaine'] = _week_columns(df['date'], week_counts)
 
-    df['is_vacation'] = df['date'].apply(is_vacation)
-    df['is_public_holiday'] = df['date'].apply(is_public_holiday)
+    df['is_vacation'] = vacation_flags(df['date'])
+    df['is_public_holiday'] = public_holiday_flags(df['date'])
     return df
 
 def add_time_features(df):
@@ -73,13 +124,7 @@ def add_time_features(df):
     week_counts = compute_custom_week_counts_for_period(start_date, end_date)
 
     # Création des colonnes 'custom_year' et 'custom_week'
-    def get_custom_year_and_week(date):
-        week_info = week_counts[(week_counts['week_start'] <= date) & (week_counts['week_end'] >= date)]
-        if not week_info.empty:
-            return week_info.iloc[0]['year'], week_info.iloc[0]['week']
-        return None, None
-
-    df["custom_year"], df["custom_week"] = zip(*df["date"].apply(get_custom_year_and_week))
+    df["custom_year"], df["custom_week"] = _week_columns(df["date"], week_counts)
     # Prendre la base du nombre de semaines max trouvé dans week_counts (pour la périodicité)
     nb_weeks = week_counts['week'].max()
     df["sin_week"] = np.sin(2 * np.pi * df["custom_week"] / nb_weeks)
@@ -93,19 +138,47 @@ def get_custom_week_starts_covering(start_date, end_date):
     return pd.to_datetime(week_grid['week_start']).sort_values().unique()
 
 
-def fetch_weather_forecast(lat, lon, start_date, end_date):
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": start_date.strftime("%Y-%m-%d"),
-        "end_date": end_date.strftime("%Y-%m-%d"),
-        "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum",
-        "timezone": "auto"
-    }
-    r = requests.get(url, params=params, timeout=15)
-    r.raise_for_status()
-    data = r.json()
+def fetch_weather_forecasts(locations, start_date, end_date, ttl=None):
+    """
+    Prévisions journalières open-meteo pour plusieurs points (lat, lon) : les points absents
+    du cache disque (ttl secondes, FORECAST_TTL par défaut) sont demandés ensemble, en une
+    requête par paquet de WeatherDataFetcher.MAX_LOCATIONS_PER_REQUEST points.
+    Renvoie une liste de DataFrames alignée sur locations.
+    """
+    backend = get_weather_backend()
+    daily = "temperature_2m_max,temperature_2m_min,precipitation_sum"
+    start, end = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+    cache = get_response_cache()
+    keys = [cache_key(backend.endpoint("forecast"), lat, lon, start, end, daily) for lat, lon in locations]
+    payloads = [cache.get(key, ttl=FORECAST_TTL if ttl is None else ttl) for key in keys]
+    todo = [i for i, data in enumerate(payloads) if data is None]
+    if len(todo) < len(locations):
+        print(f"[INFO] Prévision météo servie depuis le cache disque ({len(locations) - len(todo)} point(s)).")
+
+    size = WeatherDataFetcher.MAX_LOCATIONS_PER_REQUEST
+    for chunk in (todo[j:j + size] for j in range(0, len(todo), size)):
+        params = {
+            "latitude": ",".join(f"{locations[i][0]:.4f}" for i in chunk),
+            "longitude": ",".join(f"{locations[i][1]:.4f}" for i in chunk),
+            "start_date": start,
+            "end_date": end,
+            "daily": daily,
+            "timezone": "auto"
+        }
+        data = backend.fetch_sync("forecast", params)
+        # Un seul point : objet JSON ; plusieurs : liste dans l'ordre des coordonnées
+        for i, payload in zip(chunk, data if isinstance(data, list) else [data]):
+            payloads[i] = payload
+            cache.put(keys[i], payload)
+    return [_forecast_frame(data or {}) for data in payloads]
+
+
+def fetch_weather_forecast(lat, lon, start_date, end_date, ttl=None):
+    """Prévision journalière open-meteo d'un point ; réponse gardée en cache disque ttl secondes (FORECAST_TTL)."""
+    return fetch_weather_forecasts([(lat, lon)], start_date, end_date, ttl=ttl)[0]
+
+
+def _forecast_frame(data):
     if "daily" not in data or "time" not in data["daily"]:
         return pd.DataFrame()
     df = pd.DataFrame({
@@ -121,12 +194,13 @@ def fetch_weather_forecast(lat, lon, start_date, end_date):
 def aggregate_daily_to_custom_week(df_daily):
     week_counts = compute_custom_week_counts_for_period(df_daily.date.min(),
                                                         df_daily.date.max())
+    pos = assign_custom_weeks(df_daily["date"], week_counts)
 
-    def get_week_start(d):
-        row = week_counts[(week_counts.week_start <= d) & (week_counts.week_end >= d)]
-        return row.iloc[0]["week_start"]
-
-    df_daily["week_start"] = df_daily["date"].apply(get_week_start)
+    # days_in_week = nombre réel de jours couverts par cette semaine dans le calendrier custom
+    df_daily = df_daily.assign(
+        week_start=pd.to_datetime(week_counts["week_start"]).to_numpy()[pos],
+        days_in_week=week_counts["days_in_week"].to_numpy()[pos],
+    )
     weekly = (df_daily
               .groupby("week_start")
               .agg({
@@ -135,16 +209,11 @@ def aggregate_daily_to_custom_week(df_daily):
                  "precipitation":"mean",
                  # nouveaux indicateurs : on prend l'indicateur du **lundi** de la semaine
                  "is_vacation":"max",
-                 "is_public_holiday":"max"
+                 "is_public_holiday":"max",
+                 "days_in_week":"first"
               })
               .reset_index()
               .rename(columns={"week_start":"date"}))
-    # days_in_week = nombre réel de jours couverts par cette semaine dans le calendrier custom
-    week_counts = compute_custom_week_counts_for_period(df_daily.date.min(),
-                                                        df_daily.date.max())
-    weekly["days_in_week"] = weekly["date"].apply(
-        lambda d: week_counts.loc[week_counts.week_start == d,"days_in_week"].iloc[0]
-    )
     return weekly
 
 def impute_missing_weeks_ridge(df_hist, missing_dates):
@@ -194,64 +263,6 @@ def impute_missing_weeks_ridge(df_hist, missing_dates):
     return pd.DataFrame(imputations)
 
 
-def compute_custom_week_counts_for_period(start_date, end_date):
-    """
-    Pour la période [start_date, end_date], calcule pour chaque année
-    le découpage en semaines avec les bornes réelles (en respectant les limites de l'année).
-    Toutes les dates sont des pd.Timestamp.
-    """
-    start_date = pd.Timestamp(start_date)
-    end_date = pd.Timestamp(end_date)
-    results = []
-
-    for year in range(start_date.year, end_date.year + 1):
-        year_start = pd.Timestamp(year=year, month=1, day=1)
-        year_end = pd.Timestamp(year=year, month=12, day=31)
-        effective_start = max(year_start, start_date)
-        effective_end = min(year_end, end_date)
-
-        # Première semaine : du 1er janvier au premier dimanche
-        first_week_start = effective_start
-        first_week_end = first_week_start + timedelta(days=(6 - first_week_start.weekday()))
-        if first_week_end > effective_end:
-            first_week_end = effective_end
-        if effective_start > first_week_start:
-            first_week_start = effective_start
-
-        week_number = 1
-        results.append({
-            'year': year,
-            'week': week_number,
-            'week_start': first_week_start,
-            'week_end': first_week_end,
-            'days_in_week': max(1, (first_week_end - first_week_start).days + 1)  # Garantir au moins 1 jour
-        })
-
-        # Semaines suivantes
-        week_number += 1
-        next_week_start = first_week_end + timedelta(days=1)
-        while next_week_start <= effective_end:
-            week_start = next_week_start
-            week_end = week_start + timedelta(days=6)
-            if week_end > effective_end:
-                week_end = effective_end
-
-            # Calculer days_in_week avec une contrainte minimale de 1 jour
-            days_in_week = max(1, (week_end - week_start).days + 1)
-
-            results.append({
-                'year': year,
-                'week': week_number,
-                'week_start': week_start,
-                'week_end': week_end,
-                'days_in_week': days_in_week
-            })
-
-            week_number += 1
-            next_week_start = week_end + timedelta(days=1)
-
-    return pd.DataFrame(results)
-
 def generate_custom_week_grid(start_date, end_date):
     """
     Génère une grille de semaines personnalisée entre start_date et end_date.
@@ -266,128 +277,605 @@ def generate_custom_week_grid(start_date, end_date):
     week_grid = week_grid.sort_values(['Annee', 'Semaine', 'Date']).reset_index(drop=True)
     return week_grid
 
-def exo_var(start_date, end_date) -> pd.DataFrame:
-    print(f"\n=== [DEBUG] Début exo_var ===")
-    print(f"[DEBUG] start_date: {start_date}, end_date: {end_date}")
-
-    # Étape 1 : grille des semaines personnalisées
-    week_grid = generate_custom_week_grid(pd.Timestamp(start_date), pd.Timestamp(end_date))
-    df_weeks = week_grid.copy()
-    df_weeks['Date'] = pd.to_datetime(df_weeks['Date'])
-
-    print(f"[DEBUG] df_weeks shape : {df_weeks.shape}")
-    print(f"[DEBUG] df_weeks - dates min/max : {df_weeks['Date'].min()} -> {df_weeks['Date'].max()}")
-
-    # Étape 2 : chargement données historiques
-    if os.path.exists(HISTORICAL_EXOG):
-        df_hist = pd.read_excel(HISTORICAL_EXOG)
-        # Harmonisation du nom de colonne
-        if 'date' not in df_hist.columns:
-            if 'Date' in df_hist.columns:
-                df_hist = df_hist.rename(columns={'Date': 'date'})
-            else:
-                raise ValueError(f"Colonne 'date' ou 'Date' absente de df_hist, colonnes présentes : {df_hist.columns.tolist()}")
-        df_hist['date'] = pd.to_datetime(df_hist['date'])
-        df_hist = add_exogenous_variables(df_hist)
-    else:
-        df_hist = pd.DataFrame(columns=["date", "temperature_max", "temperature_min", "precipitation", "source", "Annee", "Semaine"])
+# --- Table hebdomadaire matérialisée des exogènes -------------------------------
+# Calculée une fois par version de l'historique journalier (persistée dans exog_weekly) puis
+# servie par tranches. La prévision court terme est rafraîchie en arrière-plan
+# (ForecastRefresher) : les lectures ne font jamais d'appel réseau.
+EXOG_SOURCE = "exog_weekly"
+EXOG_FEATURES_VERSION = 1          # à incrémenter si le calcul des variables change
+EXOG_HORIZON_WEEKS = 104           # semaines matérialisées au-delà d'aujourd'hui
+FORECAST_DAYS = 15
+FORECAST_TTL = 3 * 3600            # secondes (mémoire et cache disque)
+FORECAST_RETRY_DELAY = 10 * 60     # après un échec de l'API prévision
+FORECAST_MAX_AGE = 2 * 24 * 3600   # au-delà, la dernière prévision reçue n'est plus utilisée
+
+WEATHER_COLS = ['temperature_max', 'temperature_min', 'precipitation']
+FLAG_COLS = ['is_vacation', 'is_public_holiday']
+EXOG_COLS = WEATHER_COLS + FLAG_COLS + ['days_in_week']
+EXOG_DTYPES = {
+    'Annee': 'int16', 'Semaine': 'int8',
+    'temperature_max': 'float32', 'temperature_min': 'float32', 'precipitation': 'float32',
+    'is_vacation': 'int8', 'is_public_holiday': 'int8', 'days_in_week': 'int8',
+}
+
+
+def _load_exog_history(source):
+    """
+    Historique météo avec indicateurs calendaires, colonne 'date'. source : store
+    journalier (DailyWeatherStore) ou fichier Parquet / Excel (journalier ou hebdo).
+    """
+    if isinstance(source, DailyWeatherStore):
+        return add_exogenous_variables(source.read())
+    if not os.path.exists(source):
+        return pd.DataFrame(columns=["date"] + WEATHER_COLS + FLAG_COLS)
+    df_hist = pd.read_parquet(source) if source.endswith(".parquet") else read_excel_cached(source)
+    # Harmonisation du nom de colonne
+    if 'date' not in df_hist.columns:
+        if 'Date' in df_hist.columns:
+            df_hist = df_hist.rename(columns={'Date': 'date'})
+        else:
+            raise ValueError(f"Colonne 'date' ou 'Date' absente de df_hist, colonnes présentes : {df_hist.columns.tolist()}")
+    df_hist['date'] = pd.to_datetime(df_hist['date'])
+    return add_exogenous_variables(df_hist)
 
-    print(f"[DEBUG] df_hist shape : {df_hist.shape}, dates : {df_hist['date'].min()} -> {df_hist['date'].max()}")
 
-    # Étape 3 : appel API pour forecast à court terme
+class ExogStore:
+    """
+    Variables exogènes hebdo matérialisées sur toute la plage utile :
+    historique (semaines présentes dans le store météo journalier) + imputations
+    ridge des semaines manquantes jusqu'à EXOG_HORIZON_WEEKS après aujourd'hui.
+
+    - weather  : DailyWeatherStore (celui du point lat/lon par défaut) ou fichier
+    - legacy   : Météo_SUD.xlsx hebdo (store principal) : ses semaines complètent
+                 l'historique là où le store journalier n'a pas de données
+    - table    : DataFrame indexé par début de semaine (dtypes compacts)
+    - version  : empreinte de la source (EXOG_FEATURES_VERSION, calendrier, partitions)
+    La table est rechargée depuis exog_weekly si la version persistée est la bonne.
+    Sinon, seules les semaines touchées par les partitions modifiées (et les semaines
+    imputées, qui dépendent de tout l'historique) sont recalculées et seules les lignes
+    qui changent sont réécrites ; à défaut, reconstruction complète
+    (db_path=None : en mémoire seulement, cas des stores par maille météo). La prévision API est un instantané publié par le
+    ForecastRefresher ; get() lit le dernier instantané sans jamais attendre l'API.
+    Table et version sont publiées ensemble, d'une seule affectation, une fois la nouvelle
+    table construite à part (jamais modifiée en place) : get() lit sans verrou un état
+    cohérent, et seul refresh() prend le verrou.
+    """
+
+    def __init__(self, weather=None, db_path: str | None = DB_PATH,
+                 lat: float = LAT, lon: float = LON, legacy: str | None = None):
+        self.weather = weather if weather is not None else get_daily_weather_store(lat, lon)
+        self.db_path = db_path
+        self.legacy = legacy
+        # (signature, semaines avec indicateurs) du classeur hebdo, relu s'il change
+        self._legacy = (None, None)
+        self.lat = lat
+        self.lon = lon
+        # (version, table) remplacé d'un bloc par refresh()
+        self._state = (None, None)
+        # Historique journalier (avec indicateurs) de la dernière construction, pour les mises à jour
+        self._daily = None
+        # Instantané (prévision hebdo, horodatage) remplacé d'un bloc par le refresher
+        self._forecast = (pd.DataFrame(), None)
+        self._lock = threading.Lock()
+        self._forecast_lock = threading.Lock()
+        self._initial_forecast_done = False
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    @property
+    def table(self):
+        return self._state[1]
+
+    def has_history(self) -> bool:
+        if isinstance(self.weather, DailyWeatherStore):
+            return self.weather.has_history() or not self._legacy_weeks().empty
+        return os.path.exists(self.weather)
+
+    def _legacy_signature(self) -> str:
+        if not self.legacy or not os.path.exists(self.legacy):
+            return "-"
+        _, mtime_ns, size = file_signature(self.legacy)
+        return f"{mtime_ns}:{size}"
+
+    def _legacy_weeks(self) -> pd.DataFrame:
+        """Semaines du classeur hebdo, avec indicateurs (vide sans classeur hebdo)."""
+        signature = self._legacy_signature()
+        if self._legacy[0] != signature:
+            weeks = read_legacy_weekly(self.legacy) if signature != "-" else pd.DataFrame()
+            self._legacy = (signature, add_exogenous_variables(weeks) if not weeks.empty else weeks)
+        return self._legacy[1]
+
+    def _with_legacy(self, daily: pd.DataFrame) -> pd.DataFrame:
+        """Historique journalier, plus les semaines du classeur hebdo dont il n'a pas le début."""
+        legacy = self._legacy_weeks()
+        if legacy.empty:
+            return daily
+        if daily.empty:
+            return legacy
+        return (pd.concat([legacy, daily], ignore_index=True)
+                  .drop_duplicates(subset='date', keep='last')
+                  .sort_values('date').reset_index(drop=True))
+
+    def _source_version(self) -> str:
+        if not self.has_history():
+            return f"v{EXOG_FEATURES_VERSION}|absent"
+        if isinstance(self.weather, DailyWeatherStore):
+            return (f"v{EXOG_FEATURES_VERSION}|{calendar_fingerprint()}|{self.weather.signature()}"
+                    f"|{self._legacy_signature()}")
+        _, mtime_ns, size = file_signature(self.weather)
+        return f"v{EXOG_FEATURES_VERSION}|{mtime_ns}|{size}"
+
+    @staticmethod
+    def _covers(table, start, end) -> bool:
+        return (table is not None and not table.empty
+                and table.index[0] <= start and end <= week_end(table.index[-1:])[0])
+
+    def _build(self, start, end) -> pd.DataFrame:
+        df_hist = _load_exog_history(self.weather)
+        self._daily = df_hist if isinstance(self.weather, DailyWeatherStore) else None
+        if self._daily is not None:
+            df_hist = self._with_legacy(df_hist)
+        if not df_hist.empty:
+            start = min(start, df_hist['date'].min())
+            end = max(end, df_hist['date'].max())
+        end = max(end, pd.Timestamp(datetime.today().date()) + pd.Timedelta(weeks=EXOG_HORIZON_WEEKS))
+        print(f"[INFO] Calcul de la table exogène hebdo {start.date()} → {end.date()}")
+
+        grid = generate_custom_week_grid(start, end)
+        hist = df_hist.drop_duplicates(subset='date', keep='last').set_index('date')
+        table = grid.set_index('Date')[['Annee', 'Semaine', 'days_in_week']]
+        table = table.join(hist.reindex(table.index)[WEATHER_COLS + FLAG_COLS])
+
+        # Semaines absentes de l'historique : imputation ridge + indicateurs calendaires
+        missing = table.index[~table.index.isin(hist.index)]
+        if len(missing):
+            df_ridge = add_exogenous_variables(impute_missing_weeks_ridge(df_hist, missing))
+            table.loc[missing, WEATHER_COLS + FLAG_COLS] = (
+                df_ridge.set_index('date')[WEATHER_COLS + FLAG_COLS].reindex(missing).to_numpy())
+        print(f"[INFO] {len(table)} semaines exogènes dont {len(missing)} imputées (ridge).")
+
+        table.index.name = 'Date'
+        return _compact_table(table)
+
+    @staticmethod
+    def _rows(table, index=None):
+        """Lignes exog_weekly (ordre EXOG_WEEKLY_COLUMNS) de la table, ou des semaines index."""
+        t = table if index is None else table.loc[index]
+
+        def sql_values(col, cast):
+            return [None if np.isnan(v) else cast(v) for v in t[col].astype(float).tolist()]
+
+        return zip(t.index.strftime("%Y-%m-%d").tolist(),
+                   *(sql_values(c, int) for c in ['Annee', 'Semaine']),
+                   *(sql_values(c, float) for c in WEATHER_COLS),
+                   *(sql_values(c, int) for c in FLAG_COLS + ['days_in_week']))
+
+    def _save(self, db, table, version, index=None):
+        """Persiste toute la table, ou seulement les semaines index (upsert)."""
+        if index is None:
+            db.replace_exog_weekly(self._rows(table))
+        elif len(index):
+            db.upsert_exog_weekly(self._rows(table, index))
+        db.set_ingest_state(EXOG_SOURCE, table.index[-1].strftime("%Y-%m-%d"), len(table), version)
+
+    def _splice_daily(self, years):
+        """Historique journalier en mémoire, avec les seules années modifiées relues."""
+        if self._daily is None:
+            self._daily = _load_exog_history(self.weather)
+            return
+        fresh = [self.weather.read(f"{y}-01-01", f"{y}-12-31") for y in years]
+        fresh = add_exogenous_variables(pd.concat(fresh, ignore_index=True)) if fresh else None
+        kept = self._daily[~self._daily['date'].dt.year.isin(years)]
+        self._daily = (pd.concat([kept, fresh], ignore_index=True)
+                         .sort_values('date').reset_index(drop=True))
+
+    def _update(self, table, old_version, version):
+        """
+        Mise à jour incrémentale de table entre deux versions du store journalier.
+        Semaines sales : celles qui commencent dans une partition modifiée, plus toutes
+        les semaines imputées si la météo a changé (la ridge est ajustée sur tout
+        l'historique) ; indicateurs calendaires revus partout (calcul vectorisé).
+        Renvoie (nouvelle table, index des semaines modifiées) sans modifier table, ou
+        None si une reconstruction complète s'impose (dont un classeur hebdo modifié).
+        """
+        old_parts, new_parts = _version_partitions(old_version), _version_partitions(version)
+        if (table is None or table.empty or old_parts is None or new_parts is None
+                or _version_legacy(old_version) != _version_legacy(version)):
+            return None
+        changed_years = sorted(y for y in old_parts.keys() | new_parts.keys()
+                               if old_parts.get(y) != new_parts.get(y))
+        weeks = table.index
+        fresh = table[WEATHER_COLS + FLAG_COLS].astype({c: 'float64' for c in WEATHER_COLS})
+        fresh[FLAG_COLS] = add_exogenous_variables(pd.DataFrame({'date': weeks}))[FLAG_COLS].to_numpy()
+        if changed_years:
+            self._splice_daily(changed_years)
+            history = self._with_legacy(self._daily)
+            hist = history.drop_duplicates(subset='date', keep='last').set_index('date')
+            observed = weeks.isin(hist.index)
+            dirty = weeks[observed & weeks.year.isin(changed_years)]
+            fresh.loc[dirty, WEATHER_COLS] = hist.loc[dirty, WEATHER_COLS].to_numpy()
+            missing = weeks[~observed]
+            if len(missing):
+                df_ridge = impute_missing_weeks_ridge(history, missing)
+                fresh.loc[missing, WEATHER_COLS] = (
+                    df_ridge.set_index('date')[WEATHER_COLS].reindex(missing).to_numpy())
+            print(f"[INFO] Exogènes : années {changed_years} relues, {len(dirty)} semaine(s) "
+                  f"observée(s) et {len(missing)} imputée(s) recalculées.")
+
+        fresh = fresh.astype({c: EXOG_DTYPES[c] for c in WEATHER_COLS})
+        fresh[FLAG_COLS] = fresh[FLAG_COLS].astype('Int8')
+        old = table[WEATHER_COLS + FLAG_COLS]
+        differs = ((fresh != old) & ~(fresh.isna() & old.isna())).fillna(True).any(axis=1)
+        changed = weeks[differs.to_numpy()]
+        table = table.copy()  # la table publiée peut être en cours de lecture
+        table.loc[changed, WEATHER_COLS + FLAG_COLS] = fresh.loc[changed]
+        print(f"[INFO] Exogènes : {len(changed)} semaine(s) mise(s) à jour sur {len(weeks)}.")
+        return table, changed
+
+    @staticmethod
+    def _load_db(db) -> pd.DataFrame:
+        rows = db.get_exog_weekly()
+        table = pd.DataFrame(rows, columns=EXOG_WEEKLY_COLUMNS).rename(
+            columns={'date': 'Date', 'annee': 'Annee', 'semaine': 'Semaine'})
+        table['Date'] = pd.to_datetime(table['Date']).astype('datetime64[ns]')
+        table = table.set_index('Date')[['Annee', 'Semaine', 'days_in_week'] + WEATHER_COLS + FLAG_COLS]
+        return _compact_table(table)
+
+    def refresh(self, start=None, end=None):
+        """
+        (Re)charge la table si la source a changé ou si [start, end] sort de la plage.
+        La nouvelle table est préparée à part puis publiée avec sa version d'un bloc.
+        """
+        version = self._source_version()
+        start = pd.Timestamp(start if start is not None else end if end is not None else datetime.today().date())
+        end = pd.Timestamp(end if end is not None else start)
+        current, table = self._state
+        if version == current and self._covers(table, start, end):
+            return
+        with self._lock:
+            current, table = self._state
+            if version == current and self._covers(table, start, end):
+                return
+            db = DatabaseManager(self.db_path) if self.db_path else None
+            if version != current:
+                # Nouvelle version de la source : table persistée, à jour ou à compléter
+                if table is None and db:
+                    state = db.get_ingest_state(EXOG_SOURCE)
+                    if state is not None:
+                        table, current = self._load_db(db), state[2]
+                updated = self._update(table, current, version) if current != version else None
+                if updated is not None:
+                    table, changed = updated
+                    if db:
+                        self._save(db, table, version, changed)
+                elif current != version:
+                    table = None
+                if self._covers(table, start, end):
+                    self._state = (version, table)
+                    return
+            if table is not None and not table.empty:
+                start = min(start, table.index[0])
+                end = max(end, table.index[-1])
+            table = self._build(start, end)
+            if db:
+                self._save(db, table, version)
+            self._state = (version, table)
+
+    def publish_forecast(self, df_forecast: pd.DataFrame):
+        """Remplace l'instantané de prévision (hebdo, indexé par 'date') en une seule affectation."""
+        self._forecast = (df_forecast, time.time())
+
+    def forecast(self) -> pd.DataFrame:
+        """
+        Dernière prévision publiée, agrégée par semaine et indexée par 'date' (vide si aucune
+        ou plus vieille que FORECAST_MAX_AGE). Sans instantané (premier appel), une seule
+        récupération bloquante ; ensuite, le réseau reste au refresher (démarré par app.py).
+        """
+        if self._forecast[1] is None and not self._initial_forecast_done:
+            with self._forecast_lock:
+                if self._forecast[1] is None and not self._initial_forecast_done:
+                    try:
+                        refresh_forecasts([self])
+                    except Exception as e:  # même traitement que le refresher : imputation
+                        print(f"[WARNING] Prévision météo initiale en échec : {e}")
+                    finally:
+                        self._initial_forecast_done = True
+        df_forecast, published_at = self._forecast
+        if published_at is None:
+            return df_forecast
+        if time.time() - published_at > FORECAST_MAX_AGE:
+            print("[WARNING] Prévision météo trop ancienne : valeurs imputées utilisées.")
+            return pd.DataFrame()
+        return df_forecast
+
+    def get(self, start_date, end_date, columns=None) -> pd.DataFrame:
+        """
+        Semaines couvrant [start_date, end_date] : Date, Annee, Semaine + colonnes exogènes
+        (toutes par défaut). days_in_week est tronqué à la période, comme la grille.
+        """
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        columns = EXOG_COLS if columns is None else list(columns)
+        unknown = [c for c in columns if c not in EXOG_COLS]
+        if unknown:
+            raise ValueError(f"Variables exogènes inconnues : {unknown}")
+        self.refresh(start, end)
+        table = self.table  # une seule lecture : instantané cohérent même si refresh publie entre-temps
+
+        week_grid = generate_custom_week_grid(start, end)
+        df_final = week_grid.set_index('Date')
+        # Semaine tronquée en début de période : valeurs de la semaine complète
+        feats = table.reindex(week_start(df_final.index))[WEATHER_COLS + FLAG_COLS]
+        feats.index = df_final.index
+        forecast = self._forecast_window(end)
+        if not forecast.empty:
+            feats = feats.astype({c: 'float64' for c in WEATHER_COLS})
+            on_grid = forecast.index.intersection(feats.index)
+            feats.loc[on_grid] = forecast.loc[on_grid].to_numpy()
+        df_final[WEATHER_COLS + FLAG_COLS] = feats
+
+        # Imputation ffill/bfill, puis médiane en dernier recours
+        exog_cols = [c for c in EXOG_COLS if c in columns]
+        df_final[exog_cols] = df_final[exog_cols].ffill().bfill()
+        if df_final[exog_cols].isnull().any().any():
+            print("[WARNING] Imputation médiane appliquée !")
+            df_final[exog_cols] = df_final[exog_cols].fillna(df_final[exog_cols].median())
+        if df_final[exog_cols].isnull().any().any():
+            raise ValueError("NaN résiduels après imputation finale !")
+
+        df_final = df_final.reset_index()[['Date', 'Annee', 'Semaine'] + exog_cols]
+        return df_final.astype({c: t for c, t in EXOG_DTYPES.items() if c in df_final.columns})
+
+    def _forecast_window(self, end):
+        today = pd.Timestamp(datetime.today().date())
+        if today > end:
+            return pd.DataFrame()
+        forecast = self.forecast()
+        return forecast.loc[:end] if not forecast.empty else forecast
+
+
+def _compact_table(table: pd.DataFrame) -> pd.DataFrame:
+    table = table.astype({c: t for c, t in EXOG_DTYPES.items() if c not in FLAG_COLS})
+    table[FLAG_COLS] = table[FLAG_COLS].astype('Int8')
+    return table
+
+
+def _version_partitions(version):
+    """{année: signature} d'une version de store journalier ; None si versions incomparables."""
+    parts = (version or "").split("|")
+    if len(parts) != 4 or parts[0] != f"v{EXOG_FEATURES_VERSION}":
+        return None
+    return {int(year): signature for year, signature in
+            (p.split(":", 1) for p in parts[2].split(";") if p)}
+
+
+def _version_legacy(version):
+    """Signature du classeur hebdo d'une version de store journalier."""
+    return (version or "").split("|")[-1]
+
+
+_calendar_fingerprint = None
+
+
+def calendar_fingerprint() -> str:
+    """
+    Empreinte des indicateurs calendaires (vacances, fériés) sur 2000–2040, calculée une
+    fois par processus : une correction du calendrier change la version de la table.
+    """
+    global _calendar_fingerprint
+    if _calendar_fingerprint is None:
+        days = pd.Series(pd.date_range("2000-01-01", "2040-12-31"))
+        flags = np.concatenate([vacation_flags(days), public_holiday_flags(days)]).astype(np.int8)
+        _calendar_fingerprint = hashlib.sha1(flags.tobytes()).hexdigest()[:12]
+    return _calendar_fingerprint
+
+
+_exog_store = None
+_exog_store_lock = threading.Lock()
+_refresher = None
+# Stores par maille météo (boutiques éloignées du point LAT/LON de config.py)
+_location_stores = {}
+
+
+def get_exog_store() -> ExogStore:
+    """Instance unique (par processus) de l'ExogStore."""
+    global _exog_store
+    if _exog_store is None:
+        with _exog_store_lock:
+            if _exog_store is None:
+                _exog_store = ExogStore(legacy=HISTORICAL_EXOG)
+    return _exog_store
+
+
+def _all_exog_stores():
+    stores = [_exog_store] if _exog_store is not None else []
+    return stores + list(_location_stores.values())
+
+
+def refresh_forecasts(stores=None) -> bool:
+    """
+    Récupère la prévision de tous les stores (une requête multi-points), l'agrège par
+    semaine et publie les instantanés. En cas d'échec, les instantanés précédents
+    restent en place ; renvoie False.
+    """
+    stores = _all_exog_stores() if stores is None else list(stores)
+    if not stores:
+        return True
     today = pd.Timestamp(datetime.today().date())
-    forecast_end = min(today + pd.Timedelta(days=15), pd.Timestamp(end_date))
-    df_forecast_weekly = pd.DataFrame()
-
-    if today <= forecast_end:
-        df_forecast = fetch_weather_forecast(LAT, LON, today, forecast_end)
-        if not df_forecast.empty:
-            df_forecast = add_exogenous_variables(df_forecast)
-            df_forecast_weekly = aggregate_daily_to_custom_week(df_forecast)
-    
-    print(f"[DEBUG] df_forecast_weekly shape : {df_forecast_weekly.shape}, preview:\n{df_forecast_weekly.head()}")
-
-    # Étape 4 : concat historique + forecast
-    df_all = pd.concat([df_hist, df_forecast_weekly], ignore_index=True)
-    df_all['date'] = pd.to_datetime(df_all['date'])
-    df_all = df_all.drop_duplicates(subset="date", keep="last")
-
-    print(f"[DEBUG] df_all shape : {df_all.shape}")
-    print(f"[DEBUG] df_all - dates min/max : {df_all['date'].min()} -> {df_all['date'].max()}")
-
-    # Étape 5 : identifier les semaines manquantes
-    known_weeks = set(df_all["date"].dt.normalize())
-    missing_dates = [d for d in df_weeks['Date'].dt.normalize() if d not in known_weeks]
-    print(f"[DEBUG] Nombre de dates manquantes : {len(missing_dates)}")
-
-    # Étape 6 : imputations ridge
-    df_ridge = impute_missing_weeks_ridge(df_all, missing_dates) if missing_dates else pd.DataFrame()
-    if not df_ridge.empty:
-        df_ridge = add_exogenous_variables(df_ridge)
-    print(f"[DEBUG] df_ridge shape : {df_ridge.shape}")
-
-    # Étape 7 : tout concaténer
-    df_all = pd.concat([df_all, df_ridge], ignore_index=True)
-    df_all['date'] = pd.to_datetime(df_all['date'])
-
-    # DEBUG intermédiaire
-    print("\n>>> Pré-merge - Aperçu de df_weeks:")
-    print(df_weeks.head(10))
-    print("\n>>> Pré-merge - Aperçu de df_all[['date','source']]:")
-    print(df_all.head(10))
-
-    # Étape 8 : merge exogène sur semaines
-    df_final = df_weeks.merge(
-        df_all,
-        left_on='Date',
-        right_on='date',
-        how='left',
-        suffixes=('', '_exog')
-    )
+    try:
+        frames = fetch_weather_forecasts([(s.lat, s.lon) for s in stores],
+                                         today, today + pd.Timedelta(days=FORECAST_DAYS))
+    except WeatherBackendError as e:
+        print(f"[WARNING] Prévision météo indisponible ({e}) : dernière prévision conservée.")
+        return False
+    for store, df_forecast in zip(stores, frames):
+        if df_forecast.empty:
+            continue
+        df_forecast = aggregate_daily_to_custom_week(add_exogenous_variables(df_forecast))
+        store.publish_forecast(df_forecast.set_index('date')[WEATHER_COLS + FLAG_COLS])
+    return True
 
-    # Étape 9 : colonnes finales et imputations
-    exog_cols = [
-        'temperature_max', 'temperature_min', 'precipitation',
-        'is_vacation', 'is_public_holiday', 'days_in_week'
-    ]
 
-    # Remplissage des colonnes manquantes
-    if 'days_in_week' not in df_final.columns:
-        df_final['days_in_week'] = 7
-    df_final['Annee'] = df_final['Annee'].fillna(df_final['Annee_exog'])
-    df_final['Semaine'] = df_final['Semaine'].fillna(df_final['Semaine_exog'])
+class ForecastRefresher(threading.Thread):
+    """
+    Thread démon qui rafraîchit les prévisions de tous les stores toutes les
+    FORECAST_TTL secondes (FORECAST_RETRY_DELAY après un échec de l'API).
+    wake() avance le prochain rafraîchissement, stop() l'arrête.
+    """
+
+    def __init__(self, interval: float = FORECAST_TTL, retry_delay: float = FORECAST_RETRY_DELAY):
+        super().__init__(name="forecast-refresher", daemon=True)
+        self.interval = interval
+        self.retry_delay = retry_delay
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                ok = refresh_forecasts()
+            except Exception as e:  # le thread ne doit jamais mourir
+                print(f"[WARNING] Rafraîchissement de la prévision météo en échec : {e}")
+                ok = False
+            self._wake.wait(self.interval if ok else self.retry_delay)
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+
+def start_forecast_refresher() -> ForecastRefresher:
+    """Démarre (une fois par processus) le rafraîchissement des prévisions en arrière-plan."""
+    global _refresher
+    if _refresher is None:
+        get_exog_store()  # le store principal fait partie du premier rafraîchissement
+        with _exog_store_lock:
+            if _refresher is None:
+                _refresher = ForecastRefresher()
+                _refresher.start()
+    return _refresher
+
+
+def get_location_exog_store(lat, lon) -> ExogStore:
+    """
+    Store de la maille contenant (lat, lon) ; le store principal pour la maille du
+    point LAT/LON. Les boutiques d'une même maille partagent le même store.
+    """
+    cell = grid_cell(lat, lon)
+    if cell == grid_cell(LAT, LON):
+        return get_exog_store()
+    with _exog_store_lock:
+        if cell not in _location_stores:
+            _location_stores[cell] = ExogStore(get_daily_weather_store(*cell), db_path=None,
+                                               lat=cell[0], lon=cell[1])
+        return _location_stores[cell]
+
+
+def boutique_locations(db_path: str = DB_PATH) -> dict:
+    """{nom normalisé: (lat, lon)} des boutiques dont les coordonnées sont renseignées."""
+    return {normalize_name(nom): (lat, lon)
+            for _, nom, lat, lon in DatabaseManager(db_path).get_boutique_locations()
+            if lat is not None and lon is not None}
+
+
+def update_location_histories(end_date=None, db_path: str = DB_PATH):
+    """
+    Met à jour l'historique météo journalier de chaque maille de boutique (hors maille
+    LAT/LON, couverte par le store principal) : jours manquants depuis le début du store
+    principal, récupérés pour toutes les mailles à la fois (requêtes multi-points).
+    Renvoie (nombre de jours ajoutés, {maille: jours en échec}) ; seules les mailles en
+    échec figurent dans le dictionnaire.
+    """
+    cells = [c for c in group_by_cell(boutique_locations(db_path)) if c != grid_cell(LAT, LON)]
+    if not cells:
+        return 0, {}
+    end = pd.Timestamp(end_date or datetime.today().date())
+    # Les mailles n'ont pas de classeur hebdo : leur historique journalier remonte à son début
+    legacy = read_legacy_weekly()
+    starts = [d for d in (get_daily_weather_store().first_date(),
+                          legacy['date'].iloc[0] if not legacy.empty else None) if d is not None]
+    start = min(starts) if starts else None
+    stores = [get_daily_weather_store(*cell) for cell in cells]
+    missing = set()
+    for store in stores:
+        missing.update(store.missing_days(end, start))
+    if not missing:
+        print("[INFO] Historiques météo des boutiques à jour.")
+        return 0, {}
+
+    print(f"🔄 Météo des boutiques : {len(cells)} maille(s), {len(missing)} jour(s) à compléter…")
+    fetcher = WeatherDataFetcher(LAT, LON)
+    frames, failed_dates = fetcher.fetch_locations_dates(cells, sorted(missing))
+    added = sum(store.append(new_data) for store, new_data in zip(stores, frames))
+    return added, {cell: failed for cell, failed in zip(cells, failed_dates) if failed}
+
+
+def get_exog(start_date, end_date, columns=None) -> pd.DataFrame:
+    """Tranche [start_date, end_date] de la table exogène hebdo (dtypes compacts)."""
+    return get_exog_store().get(start_date, end_date, columns)
+
+
+def get_boutique_exog(cible, start_date, end_date, columns=None) -> pd.DataFrame:
+    """
+    Comme get_exog, avec la météo de la maille de la boutique. Repli sur la table
+    principale si la boutique n'a pas de coordonnées ou si sa maille n'a pas encore
+    d'historique (voir update_location_histories).
+    """
+    return _boutique_exog_store(cible, boutique_locations()).get(start_date, end_date, columns)
 
-    df_final = df_final.sort_values(['Annee', 'Semaine', 'Date']).reset_index(drop=True)
-    df_final = df_final[['Date', 'Annee', 'Semaine'] + exog_cols]
 
-    # Imputation ffill/bfill
-    df_final[exog_cols] = df_final[exog_cols].ffill().bfill()
+def _boutique_exog_store(cible, locations: dict) -> ExogStore:
+    location = locations.get(normalize_name(cible))
+    store = get_location_exog_store(*location) if location else get_exog_store()
+    if store is not get_exog_store() and not store.has_history():
+        print(f"[INFO] Pas d'historique météo pour la maille de {cible} : météo principale utilisée.")
+        store = get_exog_store()
+    return store
 
-    # Dernier rempart : médiane si besoin
-    if df_final[exog_cols].isnull().any().any():
-        print("[WARNING] Imputation médiane appliquée !")
-        df_final[exog_cols] = df_final[exog_cols].fillna(df_final[exog_cols].median())
 
-    # Vérification finale
-    if df_final[exog_cols].isnull().any().any():
-        raise ValueError("NaN résiduels après imputation finale !")
+def _model_dtypes(df_final: pd.DataFrame) -> pd.DataFrame:
+    return df_final.astype({c: ('float64' if c in WEATHER_COLS else 'int64')
+                            for c in df_final.columns if c != 'Date'})
 
-    # Affichage final
-    print("\n>>> EXOG FINAL SAMPLE:")
-    print(df_final.head(10))
-    print("\n>>> STATISTIQUES DESCRIPTIVES:")
-    print(df_final.describe(include='all'))
 
-    print("=== [DEBUG] Fin exo_var ===\n")
+def exo_var(start_date, end_date, cible=None) -> pd.DataFrame:
+    """
+    Variables exogènes hebdo sur [start_date, end_date] au format historique
+    (Date, Annee, Semaine + EXOG_FEATURES en int64/float64) pour les modèles.
+    Avec USE_BOUTIQUE_WEATHER, la météo est celle de la maille de la boutique `cible`.
+    """
+    if cible is not None and USE_BOUTIQUE_WEATHER:
+        df_final = get_boutique_exog(cible, start_date, end_date)
+    else:
+        df_final = get_exog(start_date, end_date)
+    print(f"[INFO] exo_var {pd.Timestamp(start_date).date()} → {pd.Timestamp(end_date).date()} : {len(df_final)} semaines")
+    return _model_dtypes(df_final)
 
-    # Juste avant de retourner df_final
-    if 'date' in df_final.columns and 'Date' not in df_final.columns:
-        df_final['Date'] = df_final['date']
-    if 'date' in df_final.columns:
-        df_final = df_final.drop(columns=['date'])
-    df_final = df_final[['Date', 'Annee', 'Semaine'] + exog_cols]
-    return df_final
 
+def exo_var_many(start_date, end_date, cibles) -> dict:
+    """
+    exo_var pour plusieurs boutiques : {cible: DataFrame}, une seule extraction par
+    maille météo (une seule en tout sans USE_BOUTIQUE_WEATHER). Les boutiques d'une
+    même maille partagent le même DataFrame : ne pas le modifier en place.
+    """
+    if not USE_BOUTIQUE_WEATHER:
+        df_final = exo_var(start_date, end_date)
+        return {cible: df_final for cible in cibles}
+    locations = boutique_locations()
+    frames, by_store = {}, {}
+    for cible in cibles:
+        store = _boutique_exog_store(cible, locations)
+        if id(store) not in by_store:
+            by_store[id(store)] = _model_dtypes(store.get(start_date, end_date))
+        frames[cible] = by_store[id(store)]
+    print(f"[INFO] exo_var {pd.Timestamp(start_date).date()} → {pd.Timestamp(end_date).date()} : "
+          f"{len(cibles)} boutiques, {len(by_store)} maille(s) météo")
+    return frames
 
 
 def verify_data_completeness(df_weeks, df_final):
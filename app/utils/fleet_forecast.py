@@ -0,0 +1,164 @@
+"""
+Prévision de toutes les boutiques en une fois (page « Prévision globale »).
+
+Les exogènes futures sont extraites une seule fois par maille météo (exo_var_many),
+puis chaque boutique (forecast_boutique : paquet modèle, mise à jour automatique,
+bornes, forecast_future, ou cache de prévisions) est traitée dans un pool de processus
+persistant, démarré au premier appel. Grâce à
+l'ajustement in-sample rangé dans les paquets, l'historique n'est relu que pour les
+boutiques qui ont reçu de nouvelles semaines.
+
+Les bornes d'un secteur ou de l'ensemble ne sont pas la somme des bornes des boutiques
+(des quantiles ne s'additionnent pas) : elles viennent des quantiles des résidus de la
+série agrégée (somme des ajustements in-sample des boutiques).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from app.database.database_manager import get_boutique_secteurs
+from app.utils.exogenous import exo_var_many
+from app.utils.forecast import (
+    forecast_boutique, compute_empirical_bounds, weekly_day_weights
+)
+from config import get_model_paths
+
+MEASURES = ["Prévision", "Borne inférieure", "Borne supérieure"]
+FLEET_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+FLEET_LABEL = "Toutes boutiques"
+
+
+def fleet_boutiques(db_path: str | None = None) -> pd.DataFrame:
+    """Boutiques ayant un modèle entraîné (paquet ou ancien pickle) : colonnes Boutique, Secteur."""
+    rows = [(nom, secteur) for nom, secteur in get_boutique_secteurs(db_path)
+            if any(os.path.exists(get_model_paths(nom)[key]) for key in ("BUNDLE_FILE", "MODEL_FILE"))]
+    return pd.DataFrame(rows, columns=["Boutique", "Secteur"])
+
+
+def _forecast_shop(cible, exog_future: pd.DataFrame, start_date, end_date, alpha: float):
+    """(prévision, ajustement in-sample y / y_hat) d'une boutique ; exécutée dans le pool."""
+    return forecast_boutique(cible, exog_future, start_date, end_date, alpha, with_fit=True)
+
+
+def aggregate_bounds(fits: list, alpha: float = 0.70) -> tuple[float, float]:
+    """
+    Écarts (bas, haut) de l'IC empirique d'une somme de boutiques : quantiles des
+    résidus de la série agrégée (y et y_hat sommés sur les semaines communes à toutes).
+    """
+    joint = pd.concat(fits, axis=1, keys=range(len(fits))).dropna()
+    y = joint.xs("y", axis=1, level=1).sum(axis=1)
+    y_hat = joint.xs("y_hat", axis=1, level=1).sum(axis=1)
+    return compute_empirical_bounds(y, y_hat, alpha)
+
+
+def _group_forecast(wide: pd.DataFrame, fits: dict, alpha: float) -> pd.Series:
+    """Prévision sommée des lignes de wide et bornes de la série agrégée, colonnes (mesure, Date)."""
+    point = wide["Prévision"].sum()
+    try:
+        low, high = aggregate_bounds([fits[cible] for cible in wide.index.get_level_values("Boutique")], alpha)
+    except ValueError as e:
+        print(f"[WARNING] IC agrégé indisponible ({e})")
+        low = high = np.nan
+    return pd.concat({"Prévision": point, "Borne inférieure": point + low, "Borne supérieure": point + high},
+                     names=[None, "Date"])
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_forecast_pool(workers: int = FLEET_WORKERS) -> ProcessPoolExecutor:
+    """
+    Pool (unique par processus Streamlit) conservé d'un appel à l'autre : les processus
+    ont déjà importé statsmodels et chargé leurs caches. Démarrage « spawn » : pas de
+    fork d'un processus qui exécute des threads (Streamlit, rafraîchissement météo).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_forecast_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _run_pool(shops, exog, start_date, end_date, alpha, workers, results, errors):
+    futures = {cible: get_forecast_pool(workers).submit(_forecast_shop, cible, exog[cible],
+                                                        start_date, end_date, alpha)
+               for cible in shops}
+    for cible, future in futures.items():
+        try:
+            results[cible] = future.result()
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            errors[cible] = str(e)
+
+
+def forecast_all(start_date, end_date, workers: int = FLEET_WORKERS, db_path: str | None = None,
+                 alpha: float = 0.70):
+    """
+    Prévision de toutes les boutiques sur [start_date, end_date].
+    Renvoie (wide, totals, fleet, errors) :
+    - wide   : une ligne par boutique (index Secteur, Boutique), colonnes (mesure, Date)
+               pour les mesures de MEASURES ;
+    - totals : une ligne par secteur, même présentation : prévision sommée, bornes de la
+               série agrégée du secteur (voir aggregate_bounds) ;
+    - fleet  : idem pour l'ensemble des boutiques (une ligne, FLEET_LABEL) ;
+    - errors : {boutique: message} des boutiques non prévues.
+    Bornes NaN si l'historique commun est trop court.
+    workers=0 : traitement séquentiel dans le processus courant.
+    """
+    shops = fleet_boutiques(db_path)
+    exog = exo_var_many(start_date, end_date, shops["Boutique"])
+    if any(df.empty for df in exog.values()):
+        raise ValueError("Impossible d'obtenir les exogènes.")
+
+    results, errors = {}, {}
+    if workers:
+        try:
+            _run_pool(shops["Boutique"], exog, start_date, end_date, alpha, workers, results, errors)
+        except BrokenProcessPool:
+            print("[WARNING] Pool de prévision interrompu : boutiques restantes traitées séquentiellement.")
+            shutdown_forecast_pool()
+    for cible in shops["Boutique"]:
+        if cible in results or cible in errors:
+            continue
+        try:
+            results[cible] = _forecast_shop(cible, exog[cible], start_date, end_date, alpha)
+        except Exception as e:
+            errors[cible] = str(e)
+    for cible, message in errors.items():
+        print(f"[WARNING] Prévision globale : {cible} ignorée ({message})")
+
+    if not results:
+        empty = pd.DataFrame(index=pd.MultiIndex.from_tuples([], names=["Secteur", "Boutique"]))
+        return empty, empty.droplevel("Boutique"), empty.droplevel("Boutique"), errors
+    fits = {cible: fit for cible, (_, fit) in results.items()}
+    long = pd.concat({cible: df.set_index("Date")[MEASURES] for cible, (df, _) in results.items()},
+                     names=["Boutique", "Date"])
+    wide = long.unstack("Date")
+    secteurs = shops.set_index("Boutique")["Secteur"].reindex(wide.index)
+    wide.index = pd.MultiIndex.from_arrays([secteurs, wide.index], names=["Secteur", "Boutique"])
+    wide = wide.sort_index()
+    totals = pd.DataFrame({secteur: _group_forecast(group, fits, alpha)
+                           for secteur, group in wide.groupby(level="Secteur")}).T.rename_axis("Secteur")
+    fleet = _group_forecast(wide, fits, alpha).to_frame(FLEET_LABEL).T
+    return wide, totals[wide.columns], fleet[wide.columns], errors
+
+
+def period_totals(wide: pd.DataFrame, selected_days: pd.DatetimeIndex) -> pd.DataFrame:
+    """Flux sur les jours sélectionnés (voir aggregate_weekly_forecast), par ligne et mesure."""
+    weights = weekly_day_weights(wide[MEASURES[0]].columns, selected_days)
+    return pd.DataFrame({measure: wide[measure].to_numpy(dtype=float) @ weights for measure in MEASURES},
+                        index=wide.index)
@@ -3,16 +3,79 @@ import pandas as pd
 import numpy as np
 import os
 from config import BASE_DIR
-from app.utils.data_loader import load_historical_data
+from app.utils.data_loader import load_historical_data, get_history_store
+from app.utils.excel_cache import file_signature
 from app.utils.exogenous    import exo_var
-
-def load_model_and_scalers(cible):
+from app.utils.forecast_cache import frame_digest, get_forecast_cache
+from app.utils.model_bundle import (
+    bundle_path, load_model_bundle, save_model_bundle, model_lock, read_manifest,
+    read_delta_header, recorded_history_signature, save_model_delta, model_version
+)
+from app.utils.slim_sarimax import SlimSarimaxResults, append_weeks
+
+def load_model_and_scalers(cible, with_fit=False):
+    # Paquet unique (une ouverture, manifeste vérifié avant désérialisation) ;
+    # with_fit : ajoute l'ajustement in-sample persistant (None si absent)
+    if os.path.exists(bundle_path(cible)):
+        return load_model_bundle(cible, with_fit=with_fit)
+    # Ancien format : quatre pickles, remplacés par un paquet à la prochaine sauvegarde
     folder = os.path.join(BASE_DIR, 'models', f"{cible}_models")
     model = joblib.load(os.path.join(folder, f"sarimax_model_{cible}.pkl"))
     scaler_exog = joblib.load(os.path.join(folder, f"scaler_exog_{cible}.pkl"))
     scaler_target = joblib.load(os.path.join(folder, f"scaler_target_{cible}.pkl"))
     pca = joblib.load(os.path.join(folder, f"pca_{cible}.pkl"))
-    return model, scaler_exog, scaler_target, pca
+    return (model, scaler_exog, scaler_target, pca) + ((None,) if with_fit else ())
+
+
+def in_sample_fit(model, scaler_target, dates) -> pd.DataFrame:
+    """
+    Ajustement in-sample (échelle réelle) d'un modèle complet, tiré des valeurs déjà
+    calculées par le filtre : colonnes y (observé) et y_hat (prédiction à un pas),
+    indexées par les dates d'entraînement.
+    """
+    if isinstance(model, SlimSarimaxResults):
+        raise ValueError("Modèle allégé : ajustement in-sample indisponible sans l'historique.")
+    dates = pd.DatetimeIndex(pd.to_datetime(dates), name="Date")[:int(model.nobs)]
+    y = scaler_target.inverse_transform(np.asarray(model.model.endog).reshape(-1, 1)).ravel()
+    y_hat = scaler_target.inverse_transform(np.asarray(model.fittedvalues).reshape(-1, 1)).ravel()
+    return pd.DataFrame({"y": y[:len(dates)], "y_hat": y_hat[:len(dates)]}, index=dates)
+
+
+def forecast_bounds(cible, model, scaler_exog, scaler_target, pca, fit=None, alpha: float = 0.70):
+    """
+    Écarts (bas, haut) de l'IC empirique : quantiles des résidus de l'ajustement
+    in-sample persistant (voir complete_in_sample_fit).
+    """
+    fit = complete_in_sample_fit(cible, model, scaler_exog, scaler_target, pca, fit)
+    return compute_empirical_bounds(fit["y"], fit["y_hat"], alpha)
+
+
+def complete_in_sample_fit(cible, model, scaler_exog, scaler_target, pca, fit=None) -> pd.DataFrame:
+    """
+    Ajustement in-sample (y / y_hat par Date) : celui du paquet s'il existe ; sinon
+    (modèle allégé d'avant sa persistance), prédictions in-sample recalculées sur
+    l'historique et ses exogènes.
+    """
+    if fit is None:
+        y_hist, _, _, cal_df = load_historical_data(cible)
+        exog_hist = (exo_var(cal_df['Date'].min(), cal_df['Date'].max(), cible)
+                     .set_index("Date")
+                     .loc[cal_df['Date']])
+        common_idx = y_hist.index.intersection(exog_hist.index)
+        pred_hist = in_sample_prediction(
+            model, scaler_exog, pca, scaler_target, exog_hist.loc[common_idx], y_hist.loc[common_idx]
+        )
+        fit = pd.DataFrame({"y": y_hist.loc[common_idx], "y_hat": pred_hist})
+    return fit
+
+
+def residual_bounds(fit: pd.DataFrame, alpha: float = 0.70, window_weeks: int = 104) -> dict | None:
+    """Quantiles des résidus récents de l'ajustement (voir compute_empirical_bounds), pour le manifeste."""
+    try:
+        q_lo, q_hi = compute_empirical_bounds(fit["y"], fit["y_hat"], alpha, window_weeks)
+    except ValueError:
+        return None
+    return {"alpha": alpha, "window_weeks": window_weeks, "low": float(q_lo), "high": float(q_hi)}
 
 def in_sample_prediction(
     model,
@@ -20,49 +83,33 @@ def in_sample_prediction(
     pca,
     scaler_target,
     exog_hist: pd.DataFrame,
+    y_hist: pd.Series | None = None,
 ) -> pd.Series:
     """
     Retourne les prédictions *in‑sample* du modèle, **dé‑normalisées**,
     indexées exactement comme ``exog_hist``.
+    Modèle allégé : ``y_hist`` (historique réel aligné sur ``exog_hist``) est requis,
+    les prédictions étant recalculées par filtrage.
     """
     X_pca = pca.transform(
         scaler_exog.transform(exog_hist[scaler_exog.feature_names_in_])
     )
-    y_pred_norm = model.get_prediction(exog=X_pca).predicted_mean
+    if isinstance(model, SlimSarimaxResults):
+        if y_hist is None:
+            raise ValueError("Modèle allégé : l'historique y_hist est requis pour les prédictions in-sample.")
+        y_norm = scaler_target.transform(y_hist.to_numpy().reshape(-1, 1)).ravel()
+        y_pred_norm = pd.Series(model.in_sample(y_norm, X_pca))
+    else:
+        y_pred_norm = model.get_prediction(exog=X_pca).predicted_mean
     y_pred_real = scaler_target.inverse_transform(
         y_pred_norm.to_numpy().reshape(-1, 1)
     ).ravel()
 
     # 🛠 Correction : aligner explicitement les longueurs
     n = min(len(y_pred_real), len(exog_hist.index))
-        # === DEBUG ALIGNEMENT AVANT RETOUR ===
-    idx_pred = pd.Index(range(len(y_pred_real)))
-    idx_exog = exog_hist.index
-
-    if len(y_pred_real) != len(idx_exog):
-        print("[DEBUG ALIGNEMENT] Mismatch de taille :")
-        print(f"  - Prédictions : {len(y_pred_real)}")
-        print(f"  - Index exogènes : {len(idx_exog)}")
-
-        # Si index est un DatetimeIndex, afficher les dates manquantes/supplémentaires
-        if isinstance(idx_exog, pd.DatetimeIndex):
-            print(f"  - Dates exogènes : {idx_exog.min()} à {idx_exog.max()} (total: {len(idx_exog)})")
-        else:
-            print(f"  - Index exogènes : {list(idx_exog)[:10]} ...")
-        # Afficher quelques valeurs de y_pred_real si utile
-        print(f"  - Valeurs y_pred_real (échantillon): {y_pred_real[:10]}")
-    # Si les index sont DatetimeIndex, comparer les dates
-    if hasattr(exog_hist, "index") and isinstance(exog_hist.index, pd.DatetimeIndex):
-        if hasattr(exog_hist, "index"):
-            dates_exog = set(exog_hist.index)
-            n_pred = len(y_pred_real)
-            n_exog = len(exog_hist.index)
-            if n_pred != n_exog:
-                print("[DEBUG] Index non alignés !")
-                # Impossible de donner les "dates" côté y_pred_real si ce n'est pas un Series, mais on peut donner la longueur
-                print(f"  - y_pred_real: {n_pred}, exogènes: {n_exog}")
-                print(f"  - Dates exogènes: {sorted(dates_exog)[:5]} ... {sorted(dates_exog)[-5:]}")
-                # Optionnel : Afficher des exemples de dates dans les historiques si dispo
+    if len(y_pred_real) != len(exog_hist.index):
+        print(f"[INFO] Prédictions in-sample tronquées à {n} semaines "
+              f"({len(y_pred_real)} prédictions, {len(exog_hist.index)} semaines d'exogènes).")
 
     return pd.Series(y_pred_real[:n], index=exog_hist.index[:n], name="y_hat")
 
@@ -105,7 +152,8 @@ def forecast_future(
     pca,
     train_data: pd.Series | None = None,
     train_pred_mean: pd.Series | None = None,
-    alpha: float = 0.70
+    alpha: float = 0.70,
+    bounds: tuple[float, float] | None = None
 ) -> pd.DataFrame:
     print("\n=== [DEBUG] Début forecast_future ===")
 
@@ -139,12 +187,15 @@ def forecast_future(
     y_hat = pd.Series(y_hat, index=dates, name="y_hat")
 
     # --- 4. bornes empiriques (échelle réelle) ----------------
-    if train_data is not None and train_pred_mean is not None:
-        low_d, up_d = compute_empirical_bounds(
+    #     bounds : quantiles des résidus déjà calculés (ajustement persistant)
+    if bounds is None and train_data is not None and train_pred_mean is not None:
+        bounds = compute_empirical_bounds(
             train_data.reset_index(drop=True),
             train_pred_mean.reset_index(drop=True),
             alpha=alpha
         )
+    if bounds is not None:
+        low_d, up_d = bounds
         y_lower = y_hat + low_d
         y_upper = y_hat + up_d
     else:
@@ -168,100 +219,203 @@ def forecast_future(
 
 
 
+# Poids des jours dans le flux d'une semaine (lundi → dimanche)
+WEEKDAY_WEIGHTS = np.array([1, 1, 1, 1, 1, 1.2, 0])
+
+
+def weekly_day_weights(week_starts, selected_days) -> np.ndarray:
+    """
+    Part du flux de chaque semaine (débutant à week_starts) qui tombe dans selected_days :
+    somme des poids WEEKDAY_WEIGHTS des jours sélectionnés / somme des poids de la semaine.
+    """
+    starts = pd.DatetimeIndex(pd.to_datetime(week_starts)).normalize().to_numpy().astype('datetime64[D]')
+    days = starts[:, None] + np.arange(7)                       # (semaines, 7)
+    selected = pd.DatetimeIndex(selected_days).normalize().to_numpy().astype('datetime64[D]')
+    weekday = (days.astype(np.int64) + 3) % 7                    # 01/01/1970 est un jeudi ; lundi = 0
+    return (WEEKDAY_WEIGHTS[weekday] * np.isin(days, selected)).sum(axis=1) / WEEKDAY_WEIGHTS.sum()
+
+
 def aggregate_weekly_forecast(
     forecast_weekly: pd.DataFrame,
     selected_days: pd.DatetimeIndex,
-    column: str = 'Prévision'
-) -> float:
-    if forecast_weekly[column].isnull().any():
+    column: str | list = 'Prévision'
+) -> float | pd.Series:
+    """
+    Flux total sur selected_days, à partir des prévisions hebdomadaires (colonne Date =
+    début de semaine) réparties sur les jours selon WEEKDAY_WEIGHTS.
+    column : un nom (renvoie un float) ou une liste (renvoie une Series par colonne,
+    par ex. Prévision + bornes, ou une colonne par boutique).
+    """
+    columns = [column] if isinstance(column, str) else list(column)
+    values = forecast_weekly[columns].to_numpy(dtype=float)
+    if np.isnan(values).any():
         raise ValueError("Des NaN sont présents dans les prévisions hebdomadaires.")
 
-    weights = {0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1.2, 6: 0}
-    total_weight = sum(weights.values())
-    selected_set = set(selected_days.date)
+    totals = weekly_day_weights(forecast_weekly['Date'], selected_days) @ values
+    return float(totals[0]) if isinstance(column, str) else pd.Series(totals, index=columns)
 
-    total_flux = 0.0
-    for _, row in forecast_weekly.iterrows():
-        week_start = pd.to_datetime(row['Date'])
-        days = pd.date_range(start=week_start, periods=7)
-        common_days = set(days.date).intersection(selected_set)
-        if not common_days:
-            continue
-        daily_flux = row[column] / total_weight
-        for day in common_days:
-            total_flux += daily_flux * weights[day.weekday()]
+def history_signature():
+    """Signature (chemin, mtime, taille) du fichier d'historique : comparaison sans chargement."""
+    return list(file_signature(get_history_store().path))
 
-    return total_flux
 
-def auto_update_model_with_latest_data(cible, model, scaler_exog, scaler_target, pca):
+def auto_update_model_with_latest_data(cible, model, scaler_exog, scaler_target, pca, in_sample=None):
     """
     Extend the SARIMAX model with any new weekly observations that have become 
-    available since the model was last trained. This function appends new data 
-    (with proper scaling and PCA transformation for exogenous variables) to the 
-    model and saves the updated model.
+    available since the model was last trained, without refitting. The new weeks
+    (endog, PCA exog, one-step predictions) and the final filter state are stored
+    as a versioned delta next to the bundle, written atomically under a per-shop
+    file lock: the bundle itself is never rewritten here.
+    "Is there new data?" is first answered by comparing the history file signature
+    with the one recorded at the last check, without loading the history.
+    A check that finds no new weeks writes nothing: the signature is remembered in
+    this process only. A full model keeps its type until a delta exists; once loaded
+    with a delta it is served in slim form, resumed from the delta's final state.
+    The persisted in-sample fit (``in_sample``: y / y_hat by Date) is extended with
+    the appended weeks. Returns (model, in_sample).
     """
-    # Load the full historical data to identify new observations
-    y_hist, _, _, cal_df = load_historical_data(cible)
-    total_obs = len(y_hist)
-    old_nobs = model.nobs  # number of observations the model was originally trained on
-    
-    # If no new data, return the model unchanged
-    if total_obs <= old_nobs:
-        return model
-    
-    new_points_count = total_obs - old_nobs
-    print(f"[DEBUG] New data detected: {new_points_count} new weeks will be appended to the model.")
-    
-    # Prepare new endogenous (target) data – scale it using the existing scaler_target
-    new_endog = y_hist.iloc[old_nobs:]           # new target values (real scale)
-    new_endog_norm = scaler_target.transform(new_endog.to_numpy().reshape(-1, 1)).ravel()
-    # Create a series for new endogenous data with index continuing from old_nobs
-    # Harmoniser le nom de la colonne avec l'endogène d'origine
-    original_name = model.model.data.orig_endog.name if hasattr(model.model.data.orig_endog, 'name') else "y"
-
-    new_endog_series = pd.Series(
-        new_endog_norm,
-        index=pd.RangeIndex(start=old_nobs, stop=total_obs),
-        name=original_name
+    signature = history_signature()
+    if os.path.exists(bundle_path(cible)) and _history_checked(cible, signature):
+        return model, in_sample
+
+    with model_lock(cible):
+        # Legacy files (four pickles, or bundle without in-sample fit): migrate once
+        if not os.path.exists(bundle_path(cible)) or (in_sample is None and not isinstance(model, SlimSarimaxResults)):
+            _, _, _, cal_df = load_historical_data(cible)
+            if not isinstance(model, SlimSarimaxResults):
+                in_sample = in_sample_fit(model, scaler_target, cal_df["Date"])
+            save_model_bundle(cible, model, scaler_exog, pca, scaler_target, train_dates=cal_df["Date"].iloc[:model.nobs],
+                              in_sample=in_sample,
+                              bounds=residual_bounds(in_sample) if in_sample is not None else None)
+
+        # Another session may have appended weeks since this copy was loaded: start from disk
+        header = read_delta_header(cible)
+        if (header or read_manifest(bundle_path(cible)))["nobs"] != model.nobs:
+            model, scaler_exog, scaler_target, pca, in_sample = load_model_and_scalers(cible, with_fit=True)
+        if _history_checked(cible, signature):
+            return model, in_sample
+
+        # Load the full historical data to identify new observations
+        y_hist, _, _, cal_df = load_historical_data(cible)
+        total_obs = len(y_hist)
+        old_nobs = model.nobs  # number of observations the model was originally trained on
+
+        # If no new data, remember the check (no delta write) and return the model unchanged
+        if total_obs <= old_nobs:
+            _checked_history[cible] = signature
+            return model, in_sample
+
+        new_points_count = total_obs - old_nobs
+        print(f"[DEBUG] New data detected: {new_points_count} new weeks will be appended to the model.")
+
+        # Prepare new endogenous (target) data – scale it using the existing scaler_target
+        new_endog = y_hist.iloc[old_nobs:]           # new target values (real scale)
+        new_endog_norm = scaler_target.transform(new_endog.to_numpy().reshape(-1, 1)).ravel()
+
+        # Prepare new exogenous data for the corresponding new dates
+        new_dates = cal_df["Date"].iloc[old_nobs:]   # dates for new observations
+        exo_new = exo_var(new_dates.min(), new_dates.max(), cible)
+        if exo_new.empty:
+            # If we cannot retrieve exogenous data for the new period, skip the update
+            print("[WARNING] No exogenous data for new dates; model update skipped.")
+            return model, in_sample
+        # Align exogenous data to the weekly dates of new observations
+        new_exog_aligned = exo_new.set_index("Date").loc[new_dates]
+
+        # Ensure exogenous features match those used in training
+        missing_cols = [c for c in scaler_exog.feature_names_in_ if c not in new_exog_aligned.columns]
+        if missing_cols:
+            raise ValueError(f"Les variables exogènes manquantes pour les nouvelles données : {missing_cols}")
+
+        # Apply scaling and PCA transformation to new exogenous features
+        X_new_pca = pca.transform(scaler_exog.transform(new_exog_aligned[scaler_exog.feature_names_in_]))
+        exog_expected = [c for c in model.model.exog_names if c not in ("const", "intercept")]
+        if X_new_pca.shape[1] != len(exog_expected):
+            raise ValueError("Mismatch in PCA output dimensions vs model exog features during update.")
+
+        # Append the new weeks (parameters unchanged): slim models filter only the new
+        # weeks from the final state, full models (no delta yet) by statsmodels' append
+        updated_model = append_weeks(model, new_endog_norm, X_new_pca)
+        y_hat_norm = np.asarray(updated_model.fittedvalues)[-new_points_count:]
+        rows = _delta_rows(new_dates, new_endog.to_numpy(dtype=float),
+                           scaler_target.inverse_transform(y_hat_norm.reshape(-1, 1)).ravel(),
+                           y_hat_norm, X_new_pca)
+        bounds = None
+        if in_sample is not None:
+            in_sample = pd.concat([in_sample, rows[["y", "y_hat"]]])
+            bounds = residual_bounds(in_sample)
+
+        version = save_model_delta(cible, updated_model, rows, signature, bounds)
+        print(f"[DEBUG] Model extended with {new_points_count} weeks (delta v{version}).")
+        return updated_model, in_sample
+
+
+# Signatures d'historique déjà vérifiées sans nouvelle semaine (par boutique, dans ce processus)
+_checked_history = {}
+
+
+def _history_checked(cible, signature) -> bool:
+    return signature in (recorded_history_signature(cible), _checked_history.get(cible))
+
+
+def _delta_rows(dates, y, y_hat, y_hat_norm, exog_pca=None) -> pd.DataFrame:
+    """Lignes du delta : y, y_hat (échelle réelle), y_hat_norm et exogènes PCA, indexées par Date."""
+    rows = pd.DataFrame({"y": np.asarray(y, dtype=float), "y_hat": np.asarray(y_hat, dtype=float),
+                         "y_hat_norm": np.asarray(y_hat_norm, dtype=float)},
+                        index=pd.DatetimeIndex(pd.to_datetime(list(dates)), name="Date"))
+    if exog_pca is not None:
+        for i in range(exog_pca.shape[1]):
+            rows[f"exog_{i}"] = exog_pca[:, i]
+    return rows
+
+
+def forecast_key(cible, exog_future: pd.DataFrame, start_date, end_date, alpha: float = 0.70) -> dict:
+    """Clé du cache de prévisions : version modèle + historique (en-têtes seuls) et contenu des exogènes."""
+    return {
+        "cible": cible,
+        "version": {"model": model_version(cible), "history": history_signature()},
+        "exog": frame_digest(exog_future),
+        "start": str(start_date)[:10],
+        "end": str(end_date)[:10],
+        "alpha": alpha,
+    }
+
+
+def in_sample_key(cible) -> dict:
+    """Clé du cache pour l'ajustement in-sample : version modèle + historique seulement."""
+    return {"cible": cible, "version": {"model": model_version(cible), "history": history_signature()},
+            "kind": "in_sample"}
+
+
+def forecast_boutique(cible, exog_future: pd.DataFrame, start_date, end_date,
+                      alpha: float = 0.70, use_cache: bool = True, with_fit: bool = False):
+    """
+    Prévision d'une boutique sur exog_future : chargement du modèle, mise à jour
+    automatique, IC empirique et forecast_future. Servie depuis le cache de prévisions
+    tant que modèle, historique et exogènes sont inchangés.
+    with_fit : renvoie (prévision, ajustement in-sample y / y_hat dont sont tirées les
+    bornes), l'ajustement étant mis en cache à côté de la prévision.
+    """
+    cache = get_forecast_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(forecast_key(cible, exog_future, start_date, end_date, alpha))
+        fit = cache.get(in_sample_key(cible)) if with_fit and cached is not None else None
+        if cached is not None and (fit is not None or not with_fit):
+            print(f"[INFO] Prévision {cible} servie depuis le cache.")
+            return (cached, fit) if with_fit else cached
+
+    model, scaler_exog, scaler_target, pca, fit = load_model_and_scalers(cible, with_fit=True)
+    model, fit = auto_update_model_with_latest_data(cible, model, scaler_exog, scaler_target, pca, fit)
+    fit = complete_in_sample_fit(cible, model, scaler_exog, scaler_target, pca, fit)
+    bounds = forecast_bounds(cible, model, scaler_exog, scaler_target, pca, fit, alpha)
+    forecast_df = forecast_future(
+        exog_future.set_index("Date")[scaler_exog.feature_names_in_].reset_index(),
+        model, scaler_exog, scaler_target, pca,
+        bounds=bounds
     )
-
-    # Prepare new exogenous data for the corresponding new dates
-    new_dates = cal_df["Date"].iloc[old_nobs:]   # dates for new observations
-    start_new_date = new_dates.min()
-    end_new_date   = new_dates.max()
-    exo_new = exo_var(start_new_date, end_new_date)
-    if exo_new.empty:
-        # If we cannot retrieve exogenous data for the new period, skip the update
-        print("[WARNING] No exogenous data for new dates; model update skipped.")
-        return model
-    # Align exogenous data to the weekly dates of new observations
-    exo_new = exo_new.set_index("Date")
-    new_exog_aligned = exo_new.loc[new_dates]
-    
-    # Ensure exogenous features match those used in training
-    feature_cols = [c for c in scaler_exog.feature_names_in_ if c in new_exog_aligned.columns]
-    missing_cols = [c for c in scaler_exog.feature_names_in_ if c not in new_exog_aligned.columns]
-    if missing_cols:
-        raise ValueError(f"Les variables exogènes manquantes pour les nouvelles données : {missing_cols}")
-    
-    # Apply scaling and PCA transformation to new exogenous features
-    X_new_scaled = scaler_exog.transform(new_exog_aligned[feature_cols])
-    X_new_pca = pca.transform(X_new_scaled)
-    exog_expected = [c for c in model.model.exog_names if c not in ("const", "intercept")]
-    if X_new_pca.shape[1] != len(exog_expected):
-        raise ValueError("Mismatch in PCA output dimensions vs model exog features during update.")
-    # Create DataFrame for new exogenous PCA data with proper index
-    X_new_pca_df = pd.DataFrame(X_new_pca, 
-                                index=pd.RangeIndex(start=old_nobs, stop=total_obs), 
-                                columns=exog_expected)
-    
-    # Append new observations to the model without refitting parameters
-    updated_model = model.append(new_endog_series, exog=X_new_pca_df, refit=False)
-    print("[DEBUG] Model successfully extended with new data.")
-    
-    # Save the updated model back to disk (overwriting the old model file)
-    model_path = os.path.join(BASE_DIR, 'models', f"{cible}_models", f"sarimax_model_{cible}.pkl")
-    joblib.dump(updated_model, model_path)
-    print(f"[DEBUG] Updated model saved to {model_path}")
-    
-    return updated_model
+    if cache is not None:
+        # clé recalculée : la mise à jour automatique a pu faire avancer le delta
+        cache.put(forecast_key(cible, exog_future, start_date, end_date, alpha), forecast_df)
+        if with_fit:
+            cache.put(in_sample_key(cible), fit[["y", "y_hat"]])
+    return (forecast_df, fit[["y", "y_hat"]]) if with_fit else forecast_df
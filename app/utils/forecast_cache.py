@@ -0,0 +1,149 @@
+"""
+Cache disque (SQLite) des prévisions d'une boutique (et de l'ajustement in-sample
+dont sont tirées leurs bornes).
+
+Clé : (boutique, version du modèle, signature de l'historique, empreinte du contenu
+des exogènes, début, fin, alpha). Un réentraînement, une mise à jour automatique, un
+nouvel historique ou une nouvelle prévision météo changent la clé : l'entrée n'est
+plus servie, et les entrées des versions précédentes du modèle de la boutique sont
+supprimées à l'écriture suivante. Au-delà de max_entries, les entrées les moins
+récemment lues sont évincées (LRU). Le fichier peut être supprimé sans risque.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import pandas as pd
+from config import CACHE_DIR
+
+FORECAST_CACHE_PATH = os.path.join(CACHE_DIR, "forecasts.sqlite")
+FORECAST_CACHE_MAX_ENTRIES = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    digest TEXT NOT NULL PRIMARY KEY,
+    cible TEXT NOT NULL,
+    version TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    stored_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_forecasts_last_access ON forecasts (last_access);
+"""
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """Empreinte du contenu d'un DataFrame (colonnes, types, valeurs)."""
+    h = hashlib.sha1(json.dumps([[str(c) for c in df.columns], [str(t) for t in df.dtypes]]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class ForecastCache:
+    def __init__(self, path: str = FORECAST_CACHE_PATH, max_entries: int = FORECAST_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")  # lectures concurrentes (pool de prévision globale)
+            conn.executescript(SCHEMA)
+            self._ready = True
+        return conn
+
+    @staticmethod
+    def _digest(key: dict) -> str:
+        return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, key: dict) -> pd.DataFrame | None:
+        """Prévision en cache pour key, ou None (absente ou cache illisible)."""
+        digest = self._digest(key)
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT payload FROM forecasts WHERE digest = ?", (digest,)).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE forecasts SET last_access = ? WHERE digest = ?", (time.time(), digest))
+                    conn.commit()
+            finally:
+                conn.close()
+            df = None if row is None else pickle.loads(row[0])
+        except Exception as e:  # base verrouillée / corrompue, pickle d'une autre version de pandas…
+            print(f"[WARNING] Cache de prévisions illisible ({e}).")
+            df = None
+        self._count("misses" if df is None else "hits")
+        return df
+
+    def put(self, key: dict, df: pd.DataFrame):
+        """
+        Enregistre df sous key (doit contenir "cible" et "version"). Les entrées de la
+        même boutique pour une autre version sont supprimées ; puis éviction LRU.
+        """
+        now = time.time()
+        version = json.dumps(key["version"], sort_keys=True, default=str)
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM forecasts WHERE cible = ? AND version != ?", (key["cible"], version))
+                conn.execute(
+                    """INSERT OR REPLACE INTO forecasts (digest, cible, version, payload, stored_at, last_access)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (self._digest(key), key["cible"], version,
+                     pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), now, now)
+                )
+                conn.execute(
+                    """DELETE FROM forecasts WHERE digest NOT IN
+                       (SELECT digest FROM forecasts ORDER BY last_access DESC LIMIT ?)""",
+                    (self.max_entries,)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            self._count("stores")
+        except (OSError, sqlite3.Error) as e:
+            print(f"[INFO] Prévision non mise en cache : {e}")
+
+    def clear(self):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("DELETE FROM forecasts")
+                conn.commit()
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            print(f"[WARNING] Cache de prévisions non vidé : {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+_forecast_cache = None
+_forecast_cache_lock = threading.Lock()
+
+
+def get_forecast_cache() -> ForecastCache:
+    """Instance unique (par processus) du cache de prévisions."""
+    global _forecast_cache
+    if _forecast_cache is None:
+        with _forecast_cache_lock:
+            if _forecast_cache is None:
+                _forecast_cache = ForecastCache()
+    return _forecast_cache
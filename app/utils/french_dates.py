@@ -0,0 +1,84 @@
+"""
+Conversion des dates « papier » françaises du brut journalier
+(ex. « Samedi 2 Janvier 2016 », « 1er août 2019 », « 02-01-2016 »).
+
+Chaque libellé distinct n'est analysé qu'une fois : le résultat est mémorisé
+dans un dictionnaire puis redistribué sur toute la colonne.
+"""
+import re
+import unicodedata
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+
+# Mois sans accents : les libellés sont normalisés (NFKD → ASCII) avant analyse
+MONTHS = {
+    'janvier': 1, 'fevrier': 2, 'mars': 3, 'avril': 4, 'mai': 5, 'juin': 6,
+    'juillet': 7, 'aout': 8, 'septembre': 9, 'octobre': 10, 'novembre': 11, 'decembre': 12,
+}
+
+# « [jour de semaine] 2 janvier 2016 » ou « 02-01-2016 » / « 2 01 2016 » / « 2/01/2016 »
+_TEXT_DATE = re.compile(r"(\d{1,2})(?:er)?\s+([a-z]+)\.?\s+(\d{4})")
+_NUMERIC_DATE = re.compile(r"(\d{1,2})[-/ ](\d{1,2})[-/ ](\d{4})")
+
+# Mémo libellé → Timestamp (NaT si illisible) ; vidé au-delà de _CACHE_MAX entrées
+_CACHE: dict = {}
+_CACHE_MAX = 200_000
+
+
+def _ascii_lower(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return text.encode("ascii", "ignore").decode("ascii").lower()
+
+
+def _parse_one(value):
+    if isinstance(value, (datetime, date, pd.Timestamp)):
+        return pd.Timestamp(value).normalize()
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return pd.NaT
+
+    text = _ascii_lower(str(value))
+    match = _TEXT_DATE.search(text)
+    if match and match.group(2) in MONTHS:
+        day, month, year = int(match.group(1)), MONTHS[match.group(2)], int(match.group(3))
+    else:
+        match = _NUMERIC_DATE.search(text)
+        if not match:
+            return pd.NaT
+        day, month, year = (int(g) for g in match.groups())
+    try:
+        return pd.Timestamp(year=year, month=month, day=day)
+    except ValueError:
+        return pd.NaT
+
+
+def parse_french_date(value):
+    """Un libellé (ou une cellule déjà datée) → Timestamp ; NaT si illisible."""
+    try:
+        return _CACHE[value]
+    except KeyError:
+        pass
+    except TypeError:  # valeur non hachable
+        return _parse_one(value)
+    if len(_CACHE) >= _CACHE_MAX:
+        _CACHE.clear()
+    parsed = _CACHE[value] = _parse_one(value)
+    return parsed
+
+
+def parse_french_dates(values) -> pd.Series:
+    """
+    Colonne de libellés → Series datetime64 (même index si ``values`` est une Series).
+    Les libellés distincts sont analysés une seule fois puis redistribués.
+    """
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    codes, uniques = pd.factorize(values.astype(object), use_na_sentinel=True)
+    parsed = pd.DatetimeIndex([parse_french_date(v) for v in uniques], dtype="datetime64[ns]")
+    out = np.full(len(values), np.datetime64("NaT", "ns"))
+    mask = codes >= 0
+    out[mask] = parsed.to_numpy()[codes[mask]]
+    return pd.Series(out, index=values.index, name=values.name)
+
+
+def clear_cache():
+    _CACHE.clear()
@@ -0,0 +1,93 @@
+"""
+Cache disque des réponses JSON des API météo.
+
+Clé : (endpoint, lat, lon, dates, variables). Les réponses d'archive complètes
+ne changent plus : elles n'expirent jamais. Les prévisions ont une durée de vie
+(ttl, en secondes). Écriture atomique (fichier temporaire puis renommage).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from config import CACHE_DIR
+
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, "http")
+
+
+def cache_key(endpoint, lat, lon, start_date, end_date, variables) -> dict:
+    """Clé normalisée (coordonnées arrondies, variables triées)."""
+    if isinstance(variables, str):
+        variables = variables.split(",")
+    return {
+        "endpoint": endpoint,
+        "lat": round(float(lat), 4),
+        "lon": round(float(lon), 4),
+        "start_date": str(start_date)[:10],
+        "end_date": str(end_date)[:10],
+        "variables": sorted(v.strip() for v in variables),
+    }
+
+
+class ResponseCache:
+    def __init__(self, cache_dir: str = HTTP_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: dict) -> str:
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json")
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, key: dict, ttl=None):
+        """Réponse en cache, ou None si absente / expirée (ttl en secondes, None = jamais)."""
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            if ttl is not None and time.time() - entry["stored_at"] > ttl:
+                raise KeyError("expirée")
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        self._count("hits")
+        return entry["payload"]
+
+    def put(self, key: dict, payload):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"stored_at": time.time(), "key": key, "payload": payload}, f)
+            os.replace(tmp_path, path)
+            self._count("stores")
+        except OSError as e:
+            print(f"[INFO] Réponse non mise en cache : {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores,
+                "hit_rate": self.hits / total if total else 0.0}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Instance unique (par processus) du cache de réponses."""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+from app.utils.custom_calendar import date_to_week
+
+
+def build_week_index(cal_df: pd.DataFrame) -> pd.Series:
+    """
+    Index (Annee, Semaine) -> 1re Date correspondante du calendrier historique.
+    """
+    first = cal_df.drop_duplicates(subset=["Annee", "Semaine"], keep="first")
+    return pd.Series(
+        pd.to_datetime(first["Date"]).to_numpy(),
+        index=pd.MultiIndex.from_arrays(
+            [first["Annee"].astype(int), first["Semaine"].astype(int)],
+            names=["Annee", "Semaine"]
+        ),
+        name="Date"
+    )
+
+
+def lag_keys(dates, lag_years: int) -> pd.MultiIndex:
+    """
+    Clés (année - lag_years, même semaine du calendrier maison) pour chaque date.
+    """
+    annees, semaines = date_to_week(dates)
+    return pd.MultiIndex.from_arrays([annees - lag_years, semaines],
+                                     names=["Annee", "Semaine"])
+
+
+def lag_matrix(wide: pd.DataFrame, cal_df: pd.DataFrame, lag_years: int,
+               dates=None, week_index: pd.Series | None = None) -> pd.DataFrame:
+    """
+    Matrice N-k de toutes les boutiques en une seule passe.
+
+    - wide      : valeurs hebdo indexées par Date, une colonne par boutique
+    - cal_df    : calendrier [Date, Annee, Semaine] de l'historique
+    - lag_years : k (1 pour N-1, 2 pour N-2…)
+    - dates     : dates à renseigner (par défaut l'index de ``wide``), y compris futures
+
+    Chaque ligne reçoit la valeur de la semaine (année - k, même semaine) ;
+    NaN si cette semaine n'existe pas dans l'historique.
+    """
+    if week_index is None:
+        week_index = build_week_index(cal_df)
+    dates = wide.index if dates is None else pd.DatetimeIndex(pd.to_datetime(dates))
+
+    pos = week_index.index.get_indexer(lag_keys(dates, lag_years))
+    src_dates = np.where(pos >= 0, week_index.to_numpy()[pos], np.datetime64("NaT"))
+    lagged = wide.reindex(pd.DatetimeIndex(src_dates))
+    lagged.index = dates
+    return lagged
+
+
+def lag_matrices(wide: pd.DataFrame, cal_df: pd.DataFrame, lags=(1, 2), dates=None) -> dict:
+    """Raccourci : {k: lag_matrix(...)} pour plusieurs décalages, index commun construit une fois."""
+    week_index = build_week_index(cal_df)
+    return {k: lag_matrix(wide, cal_df, k, dates=dates, week_index=week_index) for k in lags}
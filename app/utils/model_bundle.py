@@ -0,0 +1,385 @@
+"""
+Paquet modèle : un seul fichier par boutique (SARIMAX, scalers, PCA) et un manifeste JSON.
+
+Format :
+    MAGIC (8 octets) | taille de l'en-tête (uint64) | en-tête JSON (manifeste + table des tampons)
+    | pickle protocole 5 | tampons des grands tableaux NumPy, alignés sur 64 octets
+
+Les grands tableaux sont sérialisés hors bande : avec mmap_mode, ils deviennent des
+vues sur le fichier projeté en mémoire, sans copie. Le manifeste se lit sans rien
+désérialiser, et un écart de version (format ou bibliothèques) est refusé avant
+tout unpickling. Écriture atomique (fichier temporaire puis renommage).
+
+Les semaines ajoutées ensuite (mise à jour sans réestimation) vont dans un delta
+versionné à côté du paquet : lignes endogènes / exogènes et état final du filtre.
+Écritures sous verrou fichier par boutique.
+"""
+import json
+import mmap
+import os
+import pickle
+import platform
+import re
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import sklearn
+import statsmodels
+from app.utils.slim_sarimax import SlimSarimaxResults, append_weeks, final_state
+from config import get_model_paths, SLIM_MODEL_ARTIFACT
+
+BUNDLE_FORMAT = 1
+MAGIC = b"SRMXPKG1"
+ALIGN = 64
+OUT_OF_BAND_MIN_BYTES = 64 * 1024  # en dessous, le tableau reste dans le pickle
+MODEL_LOCK_TIMEOUT = 30  # secondes
+# Windows refuse de remplacer un fichier projeté en mémoire (mise à jour du modèle chargé)
+DEFAULT_MMAP_MODE = None if os.name == "nt" else "c"
+
+
+class ModelBundleError(ValueError):
+    pass
+
+
+class ModelBundleVersionError(ModelBundleError):
+    pass
+
+
+def bundle_path(cible) -> str:
+    return get_model_paths(cible)["BUNDLE_FILE"]
+
+
+def library_versions() -> dict:
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "scikit-learn": sklearn.__version__, "statsmodels": statsmodels.__version__}
+
+
+def _release(version: str) -> tuple:
+    """'1.6.2' → (1, 6) : seules majeure et mineure comptent."""
+    return tuple(int(n) for n in re.findall(r"\d+", str(version))[:2])
+
+
+def _aligned(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def build_manifest(cible, model, scaler_exog, pca, train_dates=None, bounds=None) -> dict:
+    spec = model.model
+    dates = pd.DatetimeIndex(pd.to_datetime(train_dates)) if train_dates is not None else None
+    return {
+        "format": BUNDLE_FORMAT,
+        "cible": cible,
+        "artifact": "slim" if isinstance(model, SlimSarimaxResults) else "full",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "order": list(spec.order),
+        "seasonal_order": list(spec.seasonal_order),
+        "aic": float(model.aic),
+        "nobs": int(model.nobs),
+        "train_start": str(dates.min().date()) if dates is not None and len(dates) else None,
+        "train_end": str(dates.max().date()) if dates is not None and len(dates) else None,
+        "features": [str(c) for c in scaler_exog.feature_names_in_],
+        "exog_names": [str(c) for c in spec.exog_names or []],
+        "pca_components": int(pca.n_components_) if pca is not None else None,
+        "residual_bounds": bounds,
+        "versions": library_versions(),
+    }
+
+
+def write_bundle(path, objects: dict, manifest: dict):
+    """Écrit objects (dict picklable) et manifest dans un seul fichier, atomiquement."""
+    buffers = []
+
+    def in_band(buffer):
+        if buffer.raw().nbytes < OUT_OF_BAND_MIN_BYTES:
+            return True
+        buffers.append(buffer.raw())
+        return False
+
+    payload = pickle.dumps(objects, protocol=5, buffer_callback=in_band)
+    # Décalages relatifs au début des données (après l'en-tête aligné)
+    table, offset = [], _aligned(len(payload))
+    for buffer in buffers:
+        table.append([offset, buffer.nbytes])
+        offset = _aligned(offset + buffer.nbytes)
+    header = json.dumps({"manifest": manifest, "payload": [0, len(payload)], "buffers": table},
+                        ensure_ascii=False).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            for start, chunk in [(0, payload)] + [(o, b) for (o, _), b in zip(table, buffers)]:
+                f.seek(data_start + start)
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _read_header(f) -> tuple[dict, int]:
+    prefix = f.read(len(MAGIC) + 8)
+    if len(prefix) < len(MAGIC) + 8 or prefix[:len(MAGIC)] != MAGIC:
+        raise ModelBundleError(f"{getattr(f, 'name', 'fichier')} n'est pas un paquet modèle.")
+    size, = struct.unpack("<Q", prefix[len(MAGIC):])
+    header = json.loads(f.read(size).decode("utf-8"))
+    return header, _aligned(len(MAGIC) + 8 + size)
+
+
+def read_manifest(path) -> dict:
+    """Manifeste du paquet, sans désérialiser le modèle."""
+    with open(path, "rb") as f:
+        return _read_header(f)[0]["manifest"]
+
+
+def check_versions(manifest: dict):
+    """Refuse un paquet d'un autre format ou entraîné avec d'autres versions majeures/mineures."""
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ModelBundleVersionError(
+            f"Format de paquet {manifest.get('format')} non pris en charge (attendu {BUNDLE_FORMAT}).")
+    current = library_versions()
+    skew = [f"{lib} {saved} → {current[lib]}" for lib, saved in manifest.get("versions", {}).items()
+            if lib in current and lib != "python" and _release(saved) != _release(current[lib])]
+    if skew:
+        raise ModelBundleVersionError(
+            f"Modèle {manifest.get('cible')} entraîné avec d'autres versions ({', '.join(skew)}) : "
+            f"réentraîner le modèle.")
+
+
+def load_bundle(path, mmap_mode=DEFAULT_MMAP_MODE, check=True) -> tuple[dict, dict]:
+    """
+    (manifeste, objets) en une seule ouverture. mmap_mode : None (lecture en mémoire),
+    "c" (projection, copie à l'écriture : le fichier n'est jamais modifié) ou "r"
+    (lecture seule ; insuffisant pour SARIMAX, dont le filtre exige des tableaux modifiables).
+    """
+    if mmap_mode not in (None, "r", "c"):
+        raise ValueError(f"mmap_mode inconnu : {mmap_mode!r}")
+    with open(path, "rb") as f:
+        header, data_start = _read_header(f)
+        manifest = header["manifest"]
+        if check:
+            check_versions(manifest)
+        if mmap_mode:
+            access = mmap.ACCESS_READ if mmap_mode == "r" else mmap.ACCESS_COPY
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=access))[data_start:]
+        else:
+            data = bytearray(os.fstat(f.fileno()).st_size - data_start)
+            f.seek(data_start)
+            f.readinto(data)
+            data = memoryview(data)
+    start, size = header["payload"]
+    objects = pickle.loads(data[start:start + size],
+                           buffers=[data[o:o + n] for o, n in header["buffers"]])
+    return manifest, objects
+
+
+def save_model_bundle(cible, model, scaler_exog, pca, scaler_target, train_dates=None, slim=None,
+                      in_sample=None, bounds=None, history_signature=None) -> str:
+    """
+    Paquet de la boutique (remplace les quatre pickles de l'ancien format et le delta).
+    slim (SLIM_MODEL_ARTIFACT par défaut) : modèle allégé pour l'inférence seule.
+    in_sample : ajustement in-sample (y / y_hat par Date) ; bounds : quantiles des
+    résidus associés ; history_signature : signature de l'historique d'entraînement.
+    """
+    if (SLIM_MODEL_ARTIFACT if slim is None else slim) and not isinstance(model, SlimSarimaxResults):
+        model = SlimSarimaxResults.from_results(model)
+    paths = get_model_paths(cible)
+    manifest = build_manifest(cible, model, scaler_exog, pca, train_dates, bounds)
+    manifest.update(bundle_id=uuid.uuid4().hex, history_signature=history_signature)
+    with model_lock(cible):
+        write_bundle(paths["BUNDLE_FILE"],
+                     {"model": model, "scaler_exog": scaler_exog, "pca": pca, "scaler_target": scaler_target,
+                      "in_sample": in_sample},
+                     manifest)
+        for key in ("MODEL_FILE", "SCALER_EXOG_FILE", "SCALER_TARGET_FILE", "PCA_FILE", "DELTA_FILE"):
+            if os.path.exists(paths[key]):
+                os.remove(paths[key])
+    return paths["BUNDLE_FILE"]
+
+
+def load_model_bundle(cible, mmap_mode=DEFAULT_MMAP_MODE, with_fit=False):
+    """
+    (model, scaler_exog, scaler_target, pca) depuis le paquet de la boutique, delta
+    appliqué (voir apply_delta), suivi de l'ajustement in-sample (None si absent) si with_fit.
+    """
+    manifest, objects = load_bundle(bundle_path(cible), mmap_mode=mmap_mode)
+    model, fit = objects["model"], objects.get("in_sample")
+    delta = load_delta(cible, manifest)
+    if delta is not None:
+        model, fit = apply_delta(model, fit, *delta, scaler_target=objects["scaler_target"])
+    loaded = model, objects["scaler_exog"], objects["scaler_target"], objects["pca"]
+    return loaded + (fit,) if with_fit else loaded
+
+
+# --- Verrou par boutique ------------------------------------------------------
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+_held_locks = threading.local()
+
+
+@contextmanager
+def model_lock(cible, timeout: float = MODEL_LOCK_TIMEOUT):
+    """
+    Verrou exclusif (fichier .lock du dossier modèle) autour des écritures d'une boutique :
+    entre processus comme entre sessions d'un même processus. Réentrant pour un même
+    thread. TimeoutError au-delà de timeout.
+    """
+    held = _held_locks.__dict__.setdefault("cibles", set())
+    if cible in held:
+        yield
+        return
+    path = get_model_paths(cible)["LOCK_FILE"]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    deadline = time.monotonic() + timeout
+    with open(path, "a+b") as f:
+        while True:
+            try:
+                _try_lock(f)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Modèle {cible} verrouillé depuis plus de {timeout:.0f} s.")
+                time.sleep(0.05)
+        held.add(cible)
+        try:
+            yield
+        finally:
+            held.discard(cible)
+            _unlock(f)
+
+
+# --- Delta : semaines ajoutées depuis l'entraînement --------------------------
+
+def read_delta_header(cible, manifest: dict | None = None) -> dict | None:
+    """En-tête du delta s'il existe et se rapporte au paquet actuel (sinon None), sans désérialiser."""
+    try:
+        header = read_manifest(get_model_paths(cible)["DELTA_FILE"])
+        manifest = manifest or read_manifest(bundle_path(cible))
+    except OSError:
+        return None
+    if header.get("bundle_id") != manifest.get("bundle_id") or header.get("base_nobs") != manifest.get("nobs"):
+        return None  # delta d'un modèle précédent (réentraîné depuis)
+    return header
+
+
+def recorded_history_signature(cible):
+    """Signature de l'historique lors de la dernière vérification (delta, sinon paquet), sans désérialiser."""
+    try:
+        manifest = read_manifest(bundle_path(cible))
+    except OSError:
+        return None
+    header = read_delta_header(cible, manifest)
+    return (header or manifest).get("history_signature")
+
+
+def model_version(cible) -> dict:
+    """Version du modèle sur disque (paquet + version du delta, sinon ancien pickle), sans désérialiser."""
+    try:
+        manifest = read_manifest(bundle_path(cible))
+    except OSError:
+        stat = os.stat(get_model_paths(cible)["MODEL_FILE"])
+        return {"legacy": [stat.st_mtime_ns, stat.st_size]}
+    header = read_delta_header(cible, manifest)
+    return {"bundle_id": manifest.get("bundle_id") or manifest.get("created_at"),
+            "delta": header["version"] if header else 0}
+
+
+def load_delta(cible, manifest: dict):
+    """(en-tête, objets) du delta valide pour ce paquet, ou None."""
+    if read_delta_header(cible, manifest) is None:
+        return None
+    header, objects = load_bundle(get_model_paths(cible)["DELTA_FILE"], mmap_mode=None)
+    return header, objects
+
+
+def apply_delta(model, fit, header: dict, objects: dict, scaler_target=None):
+    """
+    Modèle à l'état du delta et ajustement in-sample complété. L'état final est repris
+    du delta, sans refiltrer l'historique : un modèle complet est alors servi sous sa
+    forme allégée (inférence seule ; l'ajustement in-sample vient du paquet et du delta).
+    Modèle complet à échelle concentrée : semaines du delta ajoutées par append
+    (refiltrage de l'historique ; scaler_target requis).
+    """
+    if header["nobs"] == header["base_nobs"]:
+        return model, fit  # aucune semaine ajoutée
+    rows = objects["rows"]
+    try:
+        base = model if isinstance(model, SlimSarimaxResults) else SlimSarimaxResults.from_results(model)
+    except ValueError:
+        base = None
+    if base is not None:
+        model = SlimSarimaxResults(base.model, base.params, header["nobs"], base.aic,
+                                   objects["state"], objects["state_cov"],
+                                   pd.Series(rows["y_hat_norm"].to_numpy(),
+                                             index=pd.RangeIndex(header["base_nobs"], header["nobs"])))
+    else:
+        if scaler_target is None:
+            raise ModelBundleError("Delta d'un modèle complet : scaler_target requis pour le réappliquer.")
+        endog_norm = scaler_target.transform(rows[["y"]].to_numpy(dtype=float)).ravel()
+        model = append_weeks(model, endog_norm, rows.filter(regex=r"^exog_\d+$").to_numpy(dtype=float))
+    if fit is not None and len(rows):
+        fit = pd.concat([fit, rows[["y", "y_hat"]]])
+    return model, fit
+
+
+def save_model_delta(cible, model, rows: pd.DataFrame, history_signature=None,
+                     bounds=None) -> int:
+    """
+    Ajoute au delta de la boutique les semaines rows (index Date ; y, y_hat, y_hat_norm et
+    exogènes PCA) et l'état final du modèle (complet ou allégé). Écriture atomique ; à
+    appeler sous model_lock. Renvoie la nouvelle version du delta (inchangée, sans
+    écriture, si rows est vide).
+    """
+    manifest = read_manifest(bundle_path(cible))
+    current = load_delta(cible, manifest)
+    if not len(rows):
+        return current[0]["version"] if current is not None else 0
+    if current is not None:
+        rows = pd.concat([current[1]["rows"], rows])
+    version = current[0]["version"] + 1 if current is not None else 1
+    if manifest["nobs"] + len(rows) != model.nobs:
+        raise ModelBundleError(f"Delta {cible} incohérent : {manifest['nobs']} + {len(rows)} ≠ {model.nobs} semaines.")
+    header = {
+        "format": BUNDLE_FORMAT,
+        "kind": "delta",
+        "cible": cible,
+        "bundle_id": manifest.get("bundle_id"),
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "base_nobs": manifest["nobs"],
+        "nobs": int(model.nobs),
+        "train_end": str(rows.index.max().date()),
+        "history_signature": history_signature,
+        "residual_bounds": bounds,
+        "versions": library_versions(),
+    }
+    state, state_cov = final_state(model)
+    write_bundle(get_model_paths(cible)["DELTA_FILE"],
+                 {"rows": rows, "state": state, "state_cov": state_cov}, header)
+    return version
@@ -7,7 +7,6 @@ os.environ["OPENBLAS_NUM_THREADS"] = "4"
 os.environ["MKL_NUM_THREADS"] = "4"
 os.environ["NUMEXPR_NUM_THREADS"] = "4"
 
-import joblib
 import numpy as np
 import pandas as pd
 import streamlit as st
@@ -18,7 +17,9 @@ from skopt.utils import use_named_args
 from scipy.stats import qmc
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
-from config import BASE_DIR, EXOG_FEATURES
+from config import EXOG_FEATURES
+from app.utils.model_bundle import save_model_bundle
+from app.utils.forecast import in_sample_fit, residual_bounds, history_signature
 
 warnings.filterwarnings("ignore", category=sm.tools.sm_exceptions.ConvergenceWarning)
 
@@ -265,24 +266,26 @@ def optimize_sarimax_model(train_data, train_exog, orders=None, cible=None, time
         st.error(f"Échec full fit pour {format_order(best_order)}: {e}")
         return None, best_order, scaler_exog, pca, scaler_target
 
-def save_model(model_fit, scaler_exog, pca, scaler_target, cible):
+def save_model(model_fit, scaler_exog, pca, scaler_target, cible, train_dates=None, slim=None):
     """
-    Sauvegarde les objets nécessaires à la prévision pour la cible donnée.
+    Sauvegarde les objets nécessaires à la prévision pour la cible donnée,
+    dans un paquet unique avec manifeste (voir model_bundle).
     - model_fit      : modèle SARIMAX entraîné
     - scaler_exog    : Scaler fitted sur les exogènes
     - pca            : Composant PCA fitted (peut être None)
     - scaler_target  : Scaler fitted sur la cible
     - cible          : Nom de la cible (boutique)
+    - train_dates    : dates d'entraînement (période reportée dans le manifeste)
+    - slim           : version allégée, inférence seule (SLIM_MODEL_ARTIFACT par défaut)
+    L'ajustement in-sample et les quantiles des résidus (IC empirique) sont calculés
+    ici une fois pour toutes et rangés dans le paquet.
     """
     if not cible:
         raise ValueError("Le nom de la cible (boutique) doit être fourni à save_model.")
-    target_folder = os.path.join(BASE_DIR, 'models', f"{cible}_models")
-    os.makedirs(target_folder, exist_ok=True)
-
-    # Sauvegarde stricte : modèle, scalers, PCA, option résidus
-    joblib.dump(model_fit,       os.path.join(target_folder, f"sarimax_model_{cible}.pkl"))
-    joblib.dump(scaler_exog,     os.path.join(target_folder, f"scaler_exog_{cible}.pkl"))
-    joblib.dump(pca,             os.path.join(target_folder, f"pca_{cible}.pkl"))
-    joblib.dump(scaler_target,   os.path.join(target_folder, f"scaler_target_{cible}.pkl"))
+    in_sample = in_sample_fit(model_fit, scaler_target, train_dates) if train_dates is not None else None
+    return save_model_bundle(cible, model_fit, scaler_exog, pca, scaler_target, train_dates, slim,
+                             in_sample=in_sample,
+                             bounds=residual_bounds(in_sample) if in_sample is not None else None,
+                             history_signature=history_signature())
 
 
@@ -0,0 +1,116 @@
+"""
+Modèle SARIMAX allégé, pour l'inférence seule.
+
+Un SARIMAXResults picklé emporte les données d'entraînement, les sorties du filtre
+et du lisseur pour chaque semaine et les matrices de covariance. La prévision hors
+échantillon n'a besoin que des paramètres, de la spécification du modèle et de l'état
+prédit (moyenne, covariance) pour la première semaine hors échantillon : le filtre de
+Kalman reprend à partir de là, aux mêmes valeurs près que le modèle complet.
+"""
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+
+
+class SarimaxSpec:
+    """Spécification (arguments du constructeur SARIMAX, sans les données)."""
+
+    def __init__(self, init_kwds: dict, endog_names, exog_names):
+        self.init_kwds = init_kwds
+        self.endog_names = endog_names
+        self.exog_names = list(exog_names or [])
+        self.order = init_kwds["order"]
+        self.seasonal_order = init_kwds["seasonal_order"]
+
+    def build(self, endog, exog=None, offset: int = 0):
+        """SARIMAX sur endog/exog ; offset = nb de semaines déjà filtrées (tendance temporelle)."""
+        kwds = dict(self.init_kwds, trend_offset=self.init_kwds.get("trend_offset", 1) + offset)
+        exog = None if exog is None or not self.exog_names else np.asarray(exog, dtype=float)
+        return sm.tsa.SARIMAX(np.asarray(endog, dtype=float), exog=exog, **kwds)
+
+
+class SlimSarimaxResults:
+    """
+    Remplaçant de SARIMAXResults pour forecast_future / auto_update : nobs, params,
+    aic, model (spécification), predict (hors échantillon), append (refit=False) et
+    in_sample (prédictions in-sample, recalculées sur l'historique fourni).
+    fittedvalues ne couvre que les semaines ajoutées par le dernier append.
+    """
+
+    def __init__(self, spec: SarimaxSpec, params, nobs: int, aic: float, state, state_cov,
+                 fittedvalues=None):
+        self.model = spec
+        self.params = np.asarray(params, dtype=float)
+        self.nobs = int(nobs)
+        self.aic = float(aic)
+        self.state = np.asarray(state, dtype=float)
+        self.state_cov = np.asarray(state_cov, dtype=float)
+        self.fittedvalues = (fittedvalues if fittedvalues is not None
+                             else pd.Series(dtype=float, index=pd.RangeIndex(self.nobs, self.nobs)))
+
+    @classmethod
+    def from_results(cls, res) -> "SlimSarimaxResults":
+        kwds = {k: v for k, v in res.model._get_init_kwds().items() if k not in ("endog", "exog")}
+        if kwds.get("concentrate_scale"):
+            raise ValueError("Modèle à échelle concentrée : version allégée non prise en charge.")
+        spec = SarimaxSpec(kwds, res.model.endog_names, res.model.exog_names)
+        return cls(spec, res.params, res.nobs, res.aic,
+                   res.predicted_state[:, -1], res.predicted_state_cov[:, :, -1])
+
+    def _filter_from_state(self, endog, exog):
+        mod = self.model.build(endog, exog, offset=self.nobs)
+        mod.ssm.initialize_known(self.state, self.state_cov)
+        return mod.filter(self.params, cov_type="none")  # covariance des paramètres inutile ici
+
+    def predict(self, start=None, end=None, exog=None) -> pd.Series:
+        """Prévision de start (= nobs) à end inclus ; exog : une ligne par semaine prévue."""
+        start = self.nobs if start is None else int(start)
+        end = start if end is None else int(end)
+        if start != self.nobs:
+            raise ValueError(f"Modèle allégé : prévision hors échantillon uniquement (start = {self.nobs}).")
+        steps = end - start + 1
+        if exog is not None and len(exog) != steps:
+            raise ValueError(f"exog : {len(exog)} lignes pour {steps} semaines à prévoir.")
+        res = self._filter_from_state(np.full(steps, np.nan), exog)
+        return pd.Series(np.asarray(res.fittedvalues), index=pd.RangeIndex(start, end + 1),
+                         name="predicted_mean")
+
+    def append(self, endog, exog=None, refit=False) -> "SlimSarimaxResults":
+        """Filtre les nouvelles semaines et renvoie un modèle avec l'état mis à jour (paramètres inchangés)."""
+        if refit:
+            raise ValueError("Modèle allégé : pas de réestimation possible (refit=False uniquement).")
+        res = self._filter_from_state(endog, exog)
+        nobs = self.nobs + len(endog)
+        fitted = pd.Series(np.asarray(res.fittedvalues), index=pd.RangeIndex(self.nobs, nobs))
+        return SlimSarimaxResults(self.model, self.params, nobs, self.aic,
+                                  res.predicted_state[:, -1], res.predicted_state_cov[:, :, -1], fitted)
+
+    def in_sample(self, endog, exog=None) -> np.ndarray:
+        """Prédictions in-sample (un pas) sur l'historique d'entraînement endog/exog, normalisé."""
+        return np.asarray(self.model.build(endog, exog).filter(self.params, cov_type="none").fittedvalues)
+
+
+def append_weeks(model, endog_norm, exog_pca):
+    """
+    Ajoute des semaines (endogène normalisée, exogènes PCA) sans réestimation, en
+    conservant le type d'artefact : un SARIMAXResults complet reste complet (append
+    de statsmodels, qui refiltre tout l'historique), un modèle allégé reste allégé.
+    """
+    if isinstance(model, SlimSarimaxResults):
+        return model.append(endog_norm, exog=exog_pca, refit=False)
+    # Données au même format que celles de l'ajustement (nom de l'endogène, colonnes exogènes)
+    index = pd.RangeIndex(int(model.nobs), int(model.nobs) + len(endog_norm))
+    data = model.model.data
+    exog_columns = (data.orig_exog.columns if hasattr(data.orig_exog, "columns")
+                    else [c for c in model.model.exog_names if c not in ("const", "intercept")])
+    return model.append(pd.Series(np.asarray(endog_norm, dtype=float), index=index,
+                                  name=getattr(data.orig_endog, "name", "y")),
+                        exog=pd.DataFrame(np.asarray(exog_pca, dtype=float), index=index, columns=exog_columns),
+                        refit=False)
+
+
+def final_state(model) -> tuple[np.ndarray, np.ndarray]:
+    """État prédit (moyenne, covariance) pour la première semaine hors échantillon."""
+    if isinstance(model, SlimSarimaxResults):
+        return model.state, model.state_cov
+    return model.predicted_state[:, -1], model.predicted_state_cov[:, :, -1]
@@ -0,0 +1,355 @@
+"""
+Sources de données météo interchangeables, au format des réponses open-meteo.
+
+- HttpWeatherBackend      : API open-meteo (archive + prévision), proxy de config.py
+- ReplayWeatherBackend    : réponses enregistrées (cache HTTP ou fichiers JSON), avec
+                            latence et taux d'erreur simulés : tests de charge hors ligne
+- SyntheticWeatherBackend : série générée (saisonnalité + bruit déterministe)
+
+Le backend actif est choisi par WEATHER_BACKEND (config.py ou variable d'environnement).
+Chaque backend renvoie, pour une requête (kind, params), le JSON open-meteo : un objet
+pour un point, une liste pour plusieurs points (latitudes séparées par des virgules).
+"""
+import asyncio
+import glob
+import json
+import math
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+import numpy as np
+import aiohttp
+import requests
+from config import (API_METEO_URL, API_METEO_FORECAST_URL, PROXY_URL, WEATHER_BACKEND,
+                    WEATHER_REPLAY_DIR, WEATHER_REPLAY_LATENCY, WEATHER_REPLAY_ERROR_RATE)
+
+DAILY_VARIABLES = ("temperature_2m_max", "temperature_2m_min", "precipitation_sum")
+
+
+class WeatherBackendError(Exception):
+    """Échec définitif d'une requête (ex. 4xx) : inutile de réessayer."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class WeatherRetryableError(WeatherBackendError):
+    """Échec transitoire (429, 5xx, réseau) ; retry_after en secondes si le serveur l'indique."""
+
+    def __init__(self, status=None, retry_after=None, message=None):
+        super().__init__(message or f"HTTP {status}", status)
+        self.retry_after = retry_after
+
+
+def _retry_after_seconds(value):
+    """En-tête Retry-After (secondes ou date HTTP) → secondes, ou None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _split_floats(value):
+    return [float(v) for v in str(value).split(",")]
+
+
+def _request_days(params):
+    start = date.fromisoformat(params["start_date"])
+    end = date.fromisoformat(params["end_date"])
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _payload(lat, lon, days, values):
+    """Réponse open-meteo d'un point : values = {variable: liste alignée sur days}."""
+    return {"latitude": lat, "longitude": lon,
+            "daily": {"time": [d.isoformat() for d in days], **values}}
+
+
+@asynccontextmanager
+async def _no_session():
+    yield None
+
+
+class WeatherBackend(ABC):
+    """
+    Interface d'une source météo. kind : "archive" ou "forecast" ; params : paramètres
+    open-meteo (latitude, longitude, start_date, end_date, daily…).
+    Erreurs : WeatherRetryableError (à réessayer) ou WeatherBackendError.
+    """
+    name = "abstract"
+
+    def endpoint(self, kind: str) -> str:
+        """Identifiant du point d'accès (clé du cache de réponses)."""
+        return f"{self.name}://{kind}"
+
+    def session(self, limit: int = 4):
+        """Contexte asynchrone fournissant la session passée à fetch() (None par défaut)."""
+        return _no_session()
+
+    @abstractmethod
+    async def fetch(self, session, kind: str, params: dict):
+        """Réponse JSON (objet ou liste de points) pour la requête."""
+
+    def fetch_sync(self, kind: str, params: dict):
+        """Version bloquante de fetch(), pour les appels hors boucle asyncio."""
+        async def run():
+            async with self.session(1) as session:
+                return await self.fetch(session, kind, params)
+        return asyncio.run(run())
+
+
+class HttpWeatherBackend(WeatherBackend):
+    """API open-meteo ; le proxy ne sert qu'aux requêtes listées dans proxied_kinds."""
+    name = "http"
+
+    def __init__(self, archive_url: str = API_METEO_URL, forecast_url: str = API_METEO_FORECAST_URL,
+                 proxy_url: str | None = PROXY_URL, proxied_kinds=("archive",), timeout: float = 30.0):
+        self.urls = {"archive": archive_url or API_METEO_URL, "forecast": forecast_url or API_METEO_FORECAST_URL}
+        self.proxy_url = proxy_url
+        self.proxied_kinds = tuple(proxied_kinds)
+        self.timeout = timeout
+
+    def _proxy(self, kind):
+        return self.proxy_url if kind in self.proxied_kinds else None
+
+    def endpoint(self, kind):
+        return self.urls[kind]
+
+    def session(self, limit=4):
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit))
+
+    async def fetch(self, session, kind, params):
+        try:
+            async with session.get(self.urls[kind], params=params, proxy=self._proxy(kind),
+                                   timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise WeatherRetryableError(
+                        response.status, _retry_after_seconds(response.headers.get("Retry-After")))
+                if response.status >= 400:
+                    raise WeatherBackendError(f"HTTP {response.status}", response.status)
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise WeatherRetryableError(message=repr(e)) from e
+
+    def fetch_sync(self, kind, params):
+        proxy = self._proxy(kind)
+        proxies = {"http": proxy, "https": proxy} if proxy else None
+        try:
+            r = requests.get(self.urls[kind], params=params, proxies=proxies, timeout=15)
+        except requests.RequestException as e:
+            raise WeatherRetryableError(message=repr(e)) from e
+        if r.status_code == 429 or r.status_code >= 500:
+            raise WeatherRetryableError(r.status_code, _retry_after_seconds(r.headers.get("Retry-After")))
+        if r.status_code >= 400:
+            raise WeatherBackendError(f"HTTP {r.status_code}", r.status_code)
+        return r.json()
+
+
+class _LocalBackend(WeatherBackend):
+    """
+    Backend sans réseau : réponse calculée par respond(), précédée d'une latence
+    simulée (latency ± jitter secondes) ; une fraction error_rate des requêtes
+    échoue avec error_status (Retry-After de retry_after secondes pour un 429).
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, retry_after: float | None = None, seed: int | None = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        """(délai, échec ?) de la requête suivante ; compte les requêtes."""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            failed = self._rng.random() < self.error_rate
+            self.errors += failed
+        return delay, failed
+
+    def _answer(self, kind, params, failed):
+        if failed:
+            raise WeatherRetryableError(self.error_status, self.retry_after)
+        lats, lons = _split_floats(params["latitude"]), _split_floats(params["longitude"])
+        days = _request_days(params)
+        variables = str(params.get("daily", ",".join(DAILY_VARIABLES))).split(",")
+        payloads = [self.respond(kind, lat, lon, days, variables) for lat, lon in zip(lats, lons)]
+        return payloads if len(payloads) > 1 else payloads[0]
+
+    @abstractmethod
+    def respond(self, kind, lat, lon, days, variables) -> dict:
+        """Réponse open-meteo d'un point pour les jours demandés."""
+
+    async def fetch(self, session, kind, params):
+        delay, failed = self._draw()
+        await asyncio.sleep(delay)
+        return self._answer(kind, params, failed)
+
+    def fetch_sync(self, kind, params):
+        delay, failed = self._draw()
+        time.sleep(delay)
+        return self._answer(kind, params, failed)
+
+
+class ReplayWeatherBackend(_LocalBackend):
+    """
+    Rejoue des réponses enregistrées : entrées du cache HTTP (http_cache.ResponseCache)
+    ou fichiers JSON open-meteo bruts, cherchés récursivement sous replay_dir.
+    Chaque point demandé est servi par le point enregistré le plus proche ; un jour
+    absent des enregistrements prend la valeur du même jour des années précédentes
+    (ce qui permet de rejouer des « prévisions » futures), sinon null comme l'API.
+    sources : préfixes d'endpoint retenus parmi les entrées du cache (API réelle par défaut).
+    """
+    name = "replay"
+    MAX_YEARS_BACK = 10
+
+    def __init__(self, replay_dir: str = WEATHER_REPLAY_DIR, sources=("http",), **kwargs):
+        super().__init__(**kwargs)
+        self.replay_dir = replay_dir
+        self.sources = tuple(sources)
+        self._series = None
+        self._index_lock = threading.Lock()
+
+    @staticmethod
+    def _kind_of(path, key):
+        endpoint = str((key or {}).get("endpoint", path)).lower()
+        return "forecast" if "forecast" in endpoint else "archive"
+
+    def _load(self):
+        """{(lat, lon): {variable: {date: valeur}}}, toutes sources confondues."""
+        series = {}
+        paths = glob.glob(os.path.join(self.replay_dir, "**", "*.json"), recursive=True)
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            key = entry.get("key") if isinstance(entry, dict) and "payload" in entry else None
+            if key is not None and not str(key.get("endpoint", "")).startswith(self.sources):
+                continue  # ex. réponse synthétique mise en cache : pas un enregistrement de l'API
+            payloads = entry["payload"] if key is not None else entry
+            for payload in payloads if isinstance(payloads, list) else [payloads]:
+                daily = payload.get("daily") or {}
+                lat = (key or payload).get("lat", payload.get("latitude"))
+                lon = (key or payload).get("lon", payload.get("longitude"))
+                if lat is None or lon is None or "time" not in daily:
+                    continue
+                point = series.setdefault((round(float(lat), 4), round(float(lon), 4)), {})
+                days = [date.fromisoformat(t[:10]) for t in daily["time"]]
+                # Archive prioritaire sur prévision pour un même jour
+                overwrite = self._kind_of(path, key) == "archive"
+                for variable in DAILY_VARIABLES:
+                    values = point.setdefault(variable, {})
+                    for day, value in zip(days, daily.get(variable) or []):
+                        if value is not None and (overwrite or day not in values):
+                            values[day] = value
+        if not series:
+            raise WeatherBackendError(f"Aucune réponse enregistrée sous {self.replay_dir}.")
+        print(f"[INFO] Rejeu météo : {len(paths)} fichier(s), {len(series)} point(s) enregistré(s).")
+        return series
+
+    def series(self):
+        if self._series is None:
+            with self._index_lock:
+                if self._series is None:
+                    self._series = self._load()
+        return self._series
+
+    def respond(self, kind, lat, lon, days, variables):
+        series = self.series()
+        point = min(series, key=lambda p: (p[0] - lat) ** 2 + (p[1] - lon) ** 2)
+        values = {}
+        for variable in variables:
+            recorded = series[point].get(variable, {})
+            column = []
+            for day in days:
+                value = recorded.get(day)
+                for years in range(1, self.MAX_YEARS_BACK + 1):
+                    if value is not None:
+                        break
+                    try:
+                        value = recorded.get(day.replace(year=day.year - years))
+                    except ValueError:  # 29 février
+                        value = recorded.get(day.replace(year=day.year - years, day=28))
+                column.append(value)
+            values[variable] = column
+        return _payload(lat, lon, days, values)
+
+
+class SyntheticWeatherBackend(_LocalBackend):
+    """
+    Météo générée : cycle annuel des températures, gradient avec la latitude, pluie
+    intermittente. Déterministe : même point et même jour → mêmes valeurs, quelle
+    que soit la requête.
+    """
+    name = "synthetic"
+
+    @staticmethod
+    def _noise(ordinals, lat, lon, salt):
+        x = np.sin(ordinals * 12.9898 + lat * 78.233 + lon * 37.719 + salt) * 43758.5453
+        return x - np.floor(x)
+
+    def respond(self, kind, lat, lon, days, variables):
+        n = np.array([d.toordinal() for d in days], dtype=np.float64)
+        doy = np.array([d.timetuple().tm_yday for d in days], dtype=np.float64)
+        season = np.sin(2 * math.pi * (doy - 105) / 365.25)
+        t_max = 18.0 - 0.6 * (lat - 44.0) + 9.0 * season + 6.0 * (self._noise(n, lat, lon, 1.0) - 0.5)
+        t_min = t_max - 6.0 - 4.0 * self._noise(n, lat, lon, 2.0)
+        rain = self._noise(n, lat, lon, 3.0) < 0.35 - 0.1 * season
+        precipitation = np.where(rain, -4.0 * np.log1p(-0.999 * self._noise(n, lat, lon, 4.0)), 0.0)
+        generated = {"temperature_2m_max": t_max, "temperature_2m_min": t_min,
+                     "precipitation_sum": precipitation}
+        return _payload(lat, lon, days, {v: np.round(generated[v], 1).tolist()
+                                         for v in variables if v in generated})
+
+
+_BACKENDS = {
+    "http": HttpWeatherBackend,
+    "replay": lambda: ReplayWeatherBackend(latency=WEATHER_REPLAY_LATENCY,
+                                           error_rate=WEATHER_REPLAY_ERROR_RATE),
+    "synthetic": SyntheticWeatherBackend,
+}
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def make_weather_backend(name: str) -> WeatherBackend:
+    if name not in _BACKENDS:
+        raise ValueError(f"Backend météo inconnu : {name!r} (attendu : {', '.join(_BACKENDS)})")
+    return _BACKENDS[name]()
+
+
+def get_weather_backend() -> WeatherBackend:
+    """Instance unique (par processus) du backend choisi par WEATHER_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_weather_backend(WEATHER_BACKEND)
+    return _backend
+
+
+def set_weather_backend(backend: WeatherBackend | None):
+    """Remplace le backend du processus (benchmarks, rejeu) ; None = retour à WEATHER_BACKEND."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -1,56 +1,293 @@
 import asyncio
 import random
-import os
-from datetime import datetime, timedelta, date
+import time
+from datetime import timedelta, date
 import pandas as pd
-import aiohttp
+from app.utils.http_cache import cache_key, get_response_cache
+from app.utils.weather_backends import (HttpWeatherBackend, WeatherBackendError, WeatherRetryableError,
+                                        get_weather_backend)
+
+# Résolution retenue pour regrouper les boutiques proches (degrés, ~10 km)
+GRID_CELL_DEG = 0.1
+
+
+class TokenBucket:
+    """
+    Limiteur de débit asynchrone : `rate` requêtes/s en régime permanent,
+    rafales jusqu'à `capacity`. block_for() suspend toutes les requêtes
+    (réponse 429 / Retry-After du serveur).
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def block_for(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def grid_cell(lat, lon, step=None):
+    """
+    Maille météo (centre arrondi) d'un point : deux boutiques dans la même maille
+    partagent la même série, récupérée une seule fois.
+    """
+    step = step or GRID_CELL_DEG
+    return round(round(lat / step) * step, 4), round(round(lon / step) * step, 4)
+
+
+def group_by_cell(locations, step=None):
+    """{clé: (lat, lon)} → {maille: [clés]} (ordre d'apparition conservé)."""
+    cells = {}
+    for key, (lat, lon) in locations.items():
+        cells.setdefault(grid_cell(lat, lon, step), []).append(key)
+    return cells
+
 
 class WeatherDataFetcher:
-    def __init__(self, lat, lon, api_url="https://archive-api.open-meteo.com/v1/archive", proxy_url=None):
+    # Nombre maximal de jours par requête d'archive (les trous plus longs sont découpés)
+    MAX_RANGE_DAYS = 366
+    # Nombre maximal de points (lat, lon) par requête multi-points
+    MAX_LOCATIONS_PER_REQUEST = 50
+
+    def __init__(self, lat, lon, api_url=None, proxy_url=None,
+                 max_range_days=MAX_RANGE_DAYS, max_concurrency=4, rate_per_sec=5.0,
+                 max_retries=4, backoff_base=1.0, backoff_max=60.0, cache=None,
+                 max_locations_per_request=MAX_LOCATIONS_PER_REQUEST, backend=None):
         self.lat = lat
         self.lon = lon
-        self.api_url = api_url
-        self.proxy_url = proxy_url
-
-    async def fetch_single_date_async(self, session, date):
-        params = {
-            'latitude': self.lat,
-            'longitude': self.lon,
-            'start_date': date.strftime('%Y-%m-%d'),
-            'end_date': date.strftime('%Y-%m-%d'),
-            'daily': 'temperature_2m_max,temperature_2m_min,precipitation_sum',
-            'timezone': 'auto'
-        }
-        try:
-            async with session.get(self.api_url, params=params, proxy=self.proxy_url, timeout=15) as response:
-                response.raise_for_status()
-                data = await response.json()
-                if 'daily' in data and data['daily'].get('time'):
-                    return {
-                        'date': data['daily']['time'][0],
-                        'temperature_max': data['daily']['temperature_2m_max'][0],
-                        'temperature_min': data['daily']['temperature_2m_min'][0],
-                        'precipitation': data['daily']['precipitation_sum'][0]
-                    }
-                return None
-        except Exception as e:
-            print(f"❌ Erreur lors de la récupération de {date.strftime('%Y-%m-%d')} : {e}")
-            return None
-
-    async def fetch_dates_in_batch(self, dates, batch_size=2):
-        all_data = []
-        total_dates = len(dates)
-        for i in range(0, total_dates, batch_size):
-            batch = dates[i:i + batch_size]
-            async with aiohttp.ClientSession() as session:
-                tasks = [self.fetch_single_date_async(session, date) for date in batch]
-                batch_results = await asyncio.gather(*tasks)
-                valid_results = [r for r in batch_results if r]
-                all_data.extend(valid_results)
-            await asyncio.sleep(random.uniform(1, 3))
-        return all_data
-
-    def fetch_weather_data_optimized(self, start_date, end_date, batch_size=10):
+        # Source des réponses : backend de config.py (WEATHER_BACKEND), sauf URL d'archive explicite
+        if backend is None:
+            backend = (HttpWeatherBackend(archive_url=api_url, proxy_url=proxy_url)
+                       if api_url else get_weather_backend())
+        self.backend = backend
+        self.api_url = backend.endpoint("archive")
+        self.max_range_days = max_range_days
+        self.max_locations_per_request = max_locations_per_request
+        # Débit borné par le quota de l'API (seau à jetons), pas par des pauses fixes
+        self.max_concurrency = max_concurrency
+        self.rate_per_sec = rate_per_sec
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Cache disque des réponses d'archive (None = cache partagé, False = désactivé)
+        self.cache = get_response_cache() if cache is None else cache
+        # Jours non récupérés lors du dernier appel (après toutes les tentatives)
+        self.failed_dates = []
+
+    @staticmethod
+    def contiguous_ranges(dates, max_range_days=MAX_RANGE_DAYS):
+        """
+        Regroupe des jours (dans n'importe quel ordre, doublons tolérés) en plages
+        contiguës [début, fin], chacune limitée à max_range_days jours.
+        """
+        days = sorted({pd.Timestamp(d).date() for d in dates})
+        ranges = []
+        for day in days:
+            if ranges and (day - ranges[-1][1]).days == 1 and (day - ranges[-1][0]).days < max_range_days:
+                ranges[-1][1] = day
+            else:
+                ranges.append([day, day])
+        return [tuple(r) for r in ranges]
+
+    @staticmethod
+    def _parse_daily(data):
+        daily = data.get('daily') or {}
+        return [
+            {
+                'date': day,
+                'temperature_max': t_max,
+                'temperature_min': t_min,
+                'precipitation': precipitation
+            }
+            for day, t_max, t_min, precipitation in zip(
+                daily.get('time') or [],
+                daily.get('temperature_2m_max') or [],
+                daily.get('temperature_2m_min') or [],
+                daily.get('precipitation_sum') or []
+            )
+        ]
+
+    @staticmethod
+    def _is_complete(data, start, end):
+        """Réponse d'archive définitive : tous les jours présents, sans valeur manquante."""
+        daily = data.get('daily') or {}
+        columns = [daily.get(k) or [] for k in ('temperature_2m_max', 'temperature_2m_min', 'precipitation_sum')]
+        n_days = (end - start).days + 1
+        return (len(daily.get('time') or []) == n_days
+                and all(len(c) == n_days and None not in c for c in columns))
+
+    def _backoff(self, attempt):
+        """Attente avant la tentative suivante : exponentielle, avec gigue complète."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _get_json(self, session, params, bucket, semaphore, label):
+        """
+        Requête d'archive avec reprises : 429 / 5xx / erreurs réseau → nouvelle tentative
+        (Retry-After respecté, sinon attente exponentielle aléatoire). Renvoie le JSON, ou None.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    await bucket.acquire()
+                    return await self.backend.fetch(session, "archive", params)
+            except WeatherRetryableError as e:
+                error = e
+                if e.status == 429:
+                    bucket.block_for(e.retry_after if e.retry_after is not None else self._backoff(attempt))
+                if attempt == self.max_retries:
+                    break
+                await asyncio.sleep(e.retry_after if e.retry_after is not None else self._backoff(attempt))
+            except WeatherBackendError as e:
+                # Autre erreur 4xx : requête invalide, inutile de réessayer
+                error = e
+                break
+        print(f"❌ Erreur lors de la récupération de {label} : {error!r}")
+        return None
+
+    async def fetch_locations_range_async(self, session, locations, start, end, bucket=None, semaphore=None):
+        """
+        Tous les jours de [start, end] pour plusieurs points (lat, lon) : une requête par paquet
+        de max_locations_per_request points (coordonnées séparées par des virgules).
+        Renvoie une liste alignée sur locations : lignes du point, ou None en cas d'échec.
+        """
+        daily = 'temperature_2m_max,temperature_2m_min,precipitation_sum'
+        bucket = bucket or TokenBucket(self.rate_per_sec)
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        results = [None] * len(locations)
+        keys = [cache_key(self.api_url, lat, lon, start, end, daily) for lat, lon in locations]
+
+        # Archive complète déjà reçue : elle ne changera plus
+        todo = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if self.cache else None
+            if cached is not None:
+                results[i] = self._parse_daily(cached)
+            else:
+                todo.append(i)
+
+        async def fetch_chunk(chunk):
+            params = {
+                'latitude': ",".join(f"{locations[i][0]:.4f}" for i in chunk),
+                'longitude': ",".join(f"{locations[i][1]:.4f}" for i in chunk),
+                'start_date': start.strftime('%Y-%m-%d'),
+                'end_date': end.strftime('%Y-%m-%d'),
+                'daily': daily,
+                'timezone': 'auto'
+            }
+            label = f"{start:%Y-%m-%d} → {end:%Y-%m-%d} ({len(chunk)} point(s))"
+            data = await self._get_json(session, params, bucket, semaphore, label)
+            if data is None:
+                return
+            # Un seul point : objet JSON ; plusieurs : liste dans l'ordre des coordonnées
+            payloads = data if isinstance(data, list) else [data]
+            for i, payload in zip(chunk, payloads):
+                if self.cache and self._is_complete(payload, start, end):
+                    self.cache.put(keys[i], payload)
+                results[i] = self._parse_daily(payload)
+
+        size = self.max_locations_per_request
+        await asyncio.gather(*(fetch_chunk(todo[j:j + size]) for j in range(0, len(todo), size)))
+        return results
+
+    async def fetch_range_async(self, session, start, end, bucket=None, semaphore=None):
+        """Tous les jours de [start, end] pour le point de l'instance ; None en cas d'échec."""
+        return (await self.fetch_locations_range_async(
+            session, [(self.lat, self.lon)], start, end, bucket, semaphore))[0]
+
+    async def fetch_locations_dates_async(self, locations, dates, batch_size=None):
+        """
+        Jours demandés pour plusieurs points, par plages contiguës, sur une seule session
+        (pool de connexions) avec au plus batch_size requêtes en vol.
+        Renvoie (lignes par point, jours en échec par point), alignés sur locations.
+        """
+        ranges = self.contiguous_ranges(dates, self.max_range_days)
+        n_requests = len(ranges) * -(-len(locations) // self.max_locations_per_request)
+        print(f"📡 {n_requests} requête(s) d'archive pour {sum((e - s).days + 1 for s, e in ranges)} jour(s) "
+              f"× {len(locations)} point(s).")
+        concurrency = batch_size or self.max_concurrency
+        bucket = TokenBucket(self.rate_per_sec)
+        semaphore = asyncio.Semaphore(concurrency)
+        async with self.backend.session(concurrency) as session:
+            results = await asyncio.gather(*(
+                self.fetch_locations_range_async(session, locations, start, end, bucket, semaphore)
+                for start, end in ranges
+            ))
+
+        all_data = [[] for _ in locations]
+        failed_dates = [[] for _ in locations]
+        for (start, end), per_location in zip(ranges, results):
+            for i, rows in enumerate(per_location):
+                if rows is None:
+                    failed_dates[i].extend(start + timedelta(days=k) for k in range((end - start).days + 1))
+                else:
+                    all_data[i].extend(rows)
+        return all_data, failed_dates
+
+    async def fetch_dates_in_batch(self, dates, batch_size=None):
+        """Jours demandés pour le point de l'instance. Renvoie (lignes, jours en échec)."""
+        all_data, failed_dates = await self.fetch_locations_dates_async(
+            [(self.lat, self.lon)], dates, batch_size=batch_size)
+        return all_data[0], failed_dates[0]
+
+    def fetch_locations_dates(self, locations, dates, batch_size=None):
+        """
+        Version synchrone multi-points : (DataFrames par point, jours en échec par point).
+        Les points d'une même maille (grid_cell) devraient être dédoublonnés en amont.
+        """
+        today = pd.Timestamp.today().normalize()
+        dates = [d for d in pd.to_datetime(list(dates)) if d <= today]
+        if not dates or not locations:
+            return [pd.DataFrame() for _ in locations], [[] for _ in locations]
+        all_data, failed_dates = asyncio.run(
+            self.fetch_locations_dates_async(list(locations), dates, batch_size=batch_size))
+        for (lat, lon), failed in zip(locations, failed_dates):
+            if failed:
+                print(f"⚠️ ({lat}, {lon}) : {len(failed)} jour(s) non récupéré(s).")
+        return [pd.DataFrame(rows) for rows in all_data], failed_dates
+
+    def fetch_weather_dates(self, dates, batch_size=None):
+        """
+        Récupère uniquement les jours listés (jours futurs ignorés) ; DataFrame vide si rien.
+        Les jours toujours en échec après reprises sont dans self.failed_dates.
+        """
+        self.failed_dates = []
+        today = pd.Timestamp.today().normalize()
+        dates = [d for d in pd.to_datetime(list(dates)) if d <= today]
+        if not dates:
+            print("🚫 Aucun jour à récupérer. Vérifiez la plage de dates.")
+            return pd.DataFrame()
+        all_data, self.failed_dates = asyncio.run(self.fetch_dates_in_batch(dates, batch_size=batch_size))
+        if self.cache:
+            stats = self.cache.stats()
+            print(f"[INFO] Cache HTTP : {stats['hits']} réponse(s) servie(s), {stats['misses']} absente(s).")
+        if self.failed_dates:
+            print(f"⚠️ {len(self.failed_dates)} jour(s) non récupéré(s) : "
+                  f"{', '.join(f'{s:%Y-%m-%d} → {e:%Y-%m-%d}' for s, e in self.contiguous_ranges(self.failed_dates))}")
+        if not all_data:
+            print(f"❗ Aucune donnée récupérée pour {min(dates).date()} -> {max(dates).date()} sur la zone ({self.lat}, {self.lon})")
+            return pd.DataFrame()
+        return pd.DataFrame(all_data)
+
+    def fetch_weather_data_optimized(self, start_date, end_date, batch_size=None):
         start_date = start_date if isinstance(start_date, date) else start_date.date()
         end_date = end_date if isinstance(end_date, date) else end_date.date()
         today = pd.Timestamp.today().normalize()
@@ -61,117 +298,25 @@ class WeatherDataFetcher:
             print(f"⚠️ end_date {end_date} est dans le futur. Limitation à aujourd'hui : {today}.")
             end_date = today
         dates_to_fetch = [start_date + timedelta(days=x) for x in range((end_date - start_date).days + 1)]
-        if not dates_to_fetch:
-            print("🚫 Aucun jour à récupérer. Vérifiez la plage de dates.")
-            return pd.DataFrame()
-        all_data = asyncio.run(self.fetch_dates_in_batch(dates_to_fetch, batch_size=batch_size))
-        if not all_data:
-            print(f"❗ Aucune donnée récupérée pour {start_date} -> {end_date} sur la zone ({self.lat}, {self.lon})")
-            return pd.DataFrame()
-        return pd.DataFrame(all_data)
+        return self.fetch_weather_dates(dates_to_fetch, batch_size=batch_size)
 
-    def update_historic_file(self, histo_path, end_date):
+    def update_daily_store(self, store, end_date, start_date=None):
         """
-        Met à jour automatiquement le fichier historique avec les nouvelles données disponibles.
-        - Ajoute les nouveaux jours manquants.
-        - Remplace les jours existants si la donnée API est disponible.
+        Complète le store météo journalier (DailyWeatherStore) jusqu'à end_date : seuls les
+        jours absents (trous et fin d'historique) sont demandés, par plages contiguës, puis
+        ajoutés ; seules les partitions des années concernées sont réécrites.
+        Renvoie (nombre de jours ajoutés, jours en échec après reprises).
         """
-        # Charger l'historique existant ou créer un DataFrame vide
-        if os.path.exists(histo_path):
-            histo = pd.read_excel(histo_path)
-            # robustesse nom de colonne
-            date_col = next((col for col in histo.columns if col.lower() == 'date'), None)
-            if not date_col:
-                raise ValueError("Aucune colonne 'date' trouvée dans l'historique météo.")
-            histo[date_col] = pd.to_datetime(histo[date_col])
-            histo = histo.rename(columns={date_col: 'date'})
-        else:
-            histo = pd.DataFrame(columns=['date', 'temperature_max', 'temperature_min', 'precipitation'])
-
-        today = pd.Timestamp.today().normalize()
-        all_dates = pd.date_range(end_date, today, freq="D")
-        all_dates = pd.to_datetime(all_dates)
-        histo_dates = set(histo['date']) if not histo.empty else set()
-        missing_or_update_dates = [d for d in all_dates if d not in histo_dates]
-
-        if not missing_or_update_dates:
+        missing = store.missing_days(min(pd.Timestamp(end_date), pd.Timestamp.today().normalize()), start_date)
+        if missing.empty:
             print("Aucune nouvelle donnée à mettre à jour.")
-            return histo
-
-        print(f"Récupération de {len(missing_or_update_dates)} jours manquants ou à mettre à jour...")
-        new_data = self.fetch_weather_data_optimized(missing_or_update_dates[0], missing_or_update_dates[-1])
-        if new_data is not None and not new_data.empty:
-            new_data['date'] = pd.to_datetime(new_data['date'])
-            histo = pd.concat([histo[~histo['date'].isin(new_data['date'])], new_data], ignore_index=True)
-            histo = histo.sort_values('date').reset_index(drop=True)
+            return 0, []
 
-            # -- NETTOYAGE : supprimer toutes les lignes incomplètes
-            histo = histo.dropna(subset=['temperature_max', 'temperature_min', 'precipitation'], how='any')
-
-            try:
-                histo.to_excel(histo_path, index=False)
-            except PermissionError:
-                print(f"❌ Impossible d’écrire dans {histo_path}.\nFermez le fichier dans Excel ou tout autre logiciel, puis réessayez.")
-                raise
-        return histo
-
-
-from datetime import timedelta
-import pandas as pd
-
-def compute_custom_week_counts_for_period(start_date, end_date):
-    """
-    Pour la période [start_date, end_date], calcule pour chaque année
-    le découpage en semaines avec les bornes réelles (en respectant les limites de l'année).
-    Toutes les dates sont des pd.Timestamp.
-    """
-    start_date = pd.Timestamp(start_date)
-    end_date = pd.Timestamp(end_date)
-    results = []
-
-    for year in range(start_date.year, end_date.year + 1):
-        year_start = pd.Timestamp(year=year, month=1, day=1)
-        year_end = pd.Timestamp(year=year, month=12, day=31)
-        effective_start = max(year_start, start_date)
-        effective_end = min(year_end, end_date)
-
-        # Première semaine : du 1er janvier au premier dimanche
-        first_week_start = effective_start
-        first_week_end = first_week_start + timedelta(days=(6 - first_week_start.weekday()))
-        if first_week_end > effective_end:
-            first_week_end = effective_end
-        if effective_start > first_week_start:
-            first_week_start = effective_start
-
-        week_number = 1
-        results.append({
-            'year': year,
-            'week': week_number,
-            'week_start': first_week_start,
-            'week_end': first_week_end,
-            'days_in_week': max(1, (first_week_end - first_week_start).days + 1)
-        })
-
-        # Semaines suivantes
-        week_number += 1
-        next_week_start = first_week_end + timedelta(days=1)
-        while next_week_start <= effective_end:
-            week_start = next_week_start
-            week_end = week_start + timedelta(days=6)
-            if week_end > effective_end:
-                week_end = effective_end
-
-            days_in_week = max(1, (week_end - week_start).days + 1)
-
-            results.append({
-                'year': year,
-                'week': week_number,
-                'week_start': week_start,
-                'week_end': week_end,
-                'days_in_week': days_in_week
-            })
-
-            week_number += 1
-            next_week_start = week_end + timedelta(days=1)
-
-    return pd.DataFrame(results)
+        print(f"Récupération de {len(missing)} jours manquants...")
+        new_data = self.fetch_weather_dates(missing)
+        if self.failed_dates:
+            # Restés absents de l'historique : ils seront redemandés à la prochaine mise à jour
+            print(f"⚠️ {len(self.failed_dates)} jour(s) en échec, redemandés à la prochaine mise à jour.")
+        added = store.append(new_data)
+        print(f"✅ {added} jour(s) ajouté(s) à l'historique météo journalier.")
+        return added, list(self.failed_dates)
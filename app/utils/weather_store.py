@@ -0,0 +1,185 @@
+"""
+Historique météo journalier brut, en ajout seul, partitionné par année.
+
+Un dossier par point (lat, lon), un fichier Parquet par année : une mise à jour ne
+réécrit que les années qui reçoivent des jours (en pratique l'année en cours), via
+un fichier temporaire renommé atomiquement. Les jours déjà présents ne sont jamais
+modifiés. Les variables hebdo dérivées sont stockées à part (exog_weekly).
+
+Météo_SUD.xlsx amorce le store du point LAT/LON s'il est journalier. S'il est hebdo
+(ancien format, une ligne par début de semaine), il n'est pas importé : ses semaines
+restent l'historique de la table exogène (read_legacy_weekly) là où le store
+journalier n'a pas de données.
+"""
+import os
+import threading
+import pandas as pd
+from app.utils.excel_cache import file_signature, read_excel_cached
+from config import LAT, LON, HISTORICAL_EXOG, WEATHER_DAILY_DIR
+
+WEATHER_COLS = ['temperature_max', 'temperature_min', 'precipitation']
+DAILY_COLUMNS = ['date'] + WEATHER_COLS
+DEFAULT_START = pd.Timestamp("2016-01-01")
+
+
+class DailyWeatherStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def partition_path(self, year: int) -> str:
+        return os.path.join(self.root, f"{year}.parquet")
+
+    def years(self) -> list[int]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(name[:-len(".parquet")]) for name in os.listdir(self.root)
+                      if name.endswith(".parquet") and name[:-len(".parquet")].isdigit())
+
+    def has_history(self) -> bool:
+        return bool(self.years())
+
+    def signature(self) -> str:
+        """Empreinte des partitions (année, mtime, taille) : change à chaque ajout."""
+        return ";".join(f"{y}:{s[1]}:{s[2]}"
+                        for y in self.years() for s in [file_signature(self.partition_path(y))])
+
+    def _read_partition(self, year, columns=None) -> pd.DataFrame:
+        df = pd.read_parquet(self.partition_path(year), columns=columns)
+        df['date'] = pd.to_datetime(df['date'])
+        return df
+
+    def read(self, start=None, end=None, columns=None) -> pd.DataFrame:
+        """Jours de [start, end] (tout l'historique par défaut), triés ; seules les années utiles sont lues."""
+        columns = DAILY_COLUMNS if columns is None else ['date'] + [c for c in columns if c != 'date']
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        years = [y for y in self.years()
+                 if (start is None or y >= start.year) and (end is None or y <= end.year)]
+        if not years:
+            return pd.DataFrame({c: pd.Series(dtype='datetime64[ns]' if c == 'date' else 'float64')
+                                 for c in columns})
+        df = pd.concat([self._read_partition(y, columns) for y in years], ignore_index=True)
+        if start is not None:
+            df = df[df['date'] >= start]
+        if end is not None:
+            df = df[df['date'] <= end]
+        return df.sort_values('date').reset_index(drop=True)
+
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.read(columns=[])['date'])
+
+    def first_date(self):
+        years = self.years()
+        return self._read_partition(years[0], ['date'])['date'].min() if years else None
+
+    def missing_days(self, end, start=None) -> pd.DatetimeIndex:
+        """Jours absents de [start, end] ; start = début de l'historique (DEFAULT_START si vide)."""
+        start = pd.Timestamp(start if start is not None else self.first_date() or DEFAULT_START)
+        wanted = pd.date_range(start, pd.Timestamp(end).normalize(), freq="D")
+        return wanted.difference(self.read(start, end, columns=[])['date'])
+
+    def append(self, df: pd.DataFrame) -> int:
+        """
+        Ajoute les jours complets de df (colonnes date + WEATHER_COLS) absents du store.
+        Seules les partitions des années concernées sont réécrites. Renvoie le nombre de jours ajoutés.
+        """
+        if df is None or df.empty:
+            return 0
+        new = df[DAILY_COLUMNS].copy()
+        new['date'] = pd.to_datetime(new['date']).dt.normalize()
+        new = (new.dropna(subset=WEATHER_COLS, how='any')
+                  .drop_duplicates(subset='date', keep='last')
+                  .astype({c: 'float64' for c in WEATHER_COLS}))
+        added = 0
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            for year, rows in new.groupby(new['date'].dt.year):
+                path = self.partition_path(year)
+                if os.path.exists(path):
+                    existing = self._read_partition(year)
+                    rows = rows[~rows['date'].isin(existing['date'])]
+                    if rows.empty:
+                        continue
+                    added += len(rows)
+                    rows = pd.concat([existing, rows], ignore_index=True)
+                else:
+                    added += len(rows)
+                rows = rows.sort_values('date').reset_index(drop=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                rows.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+        return added
+
+    def import_legacy(self, path: str) -> int:
+        """
+        Amorce un store vide depuis un classeur historique journalier (Météo_SUD.xlsx).
+        Un classeur hebdo n'est pas importé : une moyenne de semaine deviendrait une
+        observation journalière définitive (append ne réécrit jamais un jour). Ses
+        semaines sont servies telles quelles par read_legacy_weekly.
+        """
+        if self.has_history() or not os.path.exists(path):
+            return 0
+        df, spacing = _read_legacy(path)
+        if pd.notna(spacing) and spacing != pd.Timedelta(days=1):
+            print(f"[INFO] {os.path.basename(path)} est hebdo (pas de {spacing.days} jour(s)) : "
+                  f"conservé comme historique hebdo, store journalier non amorcé.")
+            return 0
+        added = self.append(df)
+        print(f"[INFO] Historique météo journalier amorcé depuis {os.path.basename(path)} : {added} jour(s).")
+        return added
+
+
+def _read_legacy(path: str):
+    """(lignes date + WEATHER_COLS du classeur, pas médian entre deux dates)."""
+    df = read_excel_cached(path)
+    date_col = next((col for col in df.columns if col.lower() == 'date'), None)
+    if not date_col or not set(WEATHER_COLS) <= set(df.columns):
+        raise ValueError(f"{os.path.basename(path)} : colonnes date / météo introuvables.")
+    df = df.rename(columns={date_col: 'date'})[DAILY_COLUMNS]
+    df['date'] = pd.to_datetime(df['date'])
+    spacing = pd.Series(df['date'].dropna().drop_duplicates().sort_values()).diff().median()
+    return df, spacing
+
+
+def read_legacy_weekly(path: str = HISTORICAL_EXOG) -> pd.DataFrame:
+    """
+    Semaines d'un Météo_SUD.xlsx hebdo : date (début de semaine) + WEATHER_COLS, lignes
+    incomplètes écartées. Vide si le classeur est absent ou journalier (dans ce cas
+    importé dans le store journalier par import_legacy).
+    """
+    empty = pd.DataFrame({c: pd.Series(dtype='datetime64[ns]' if c == 'date' else 'float64')
+                          for c in DAILY_COLUMNS})
+    if not os.path.exists(path):
+        return empty
+    df, spacing = _read_legacy(path)
+    if pd.isna(spacing) or spacing == pd.Timedelta(days=1):
+        return empty
+    return (df.dropna(subset=['date'] + WEATHER_COLS)
+              .drop_duplicates(subset='date', keep='last')
+              .astype({c: 'float64' for c in WEATHER_COLS})
+              .sort_values('date').reset_index(drop=True))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def point_dir(lat, lon) -> str:
+    return os.path.join(WEATHER_DAILY_DIR, f"{lat:.4f}_{lon:.4f}")
+
+
+def get_daily_weather_store(lat: float = LAT, lon: float = LON) -> DailyWeatherStore:
+    """
+    Store (unique par processus) du point (lat, lon). Celui du point LAT/LON de
+    config.py est amorcé depuis Météo_SUD.xlsx à la première utilisation.
+    """
+    key = (round(lat, 4), round(lon, 4))
+    if key not in _stores:
+        with _stores_lock:
+            if key not in _stores:
+                store = DailyWeatherStore(point_dir(*key))
+                if key == (round(LAT, 4), round(LON, 4)):
+                    store.import_legacy(HISTORICAL_EXOG)
+                _stores[key] = store
+    return _stores[key]
@@ -0,0 +1,63 @@
+"""
+Benchmark du cache Parquet des classeurs Excel : lecture froide vs chaude.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_excel_cache                 # classeur synthétique
+    python -m benchmarks.bench_excel_cache Flux_final.xlsx # classeur réel
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from app.utils.excel_cache import read_excel_cached
+
+
+def make_workbook(path, n_weeks=520, n_shops=19):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "Annee": np.repeat(np.arange(2016, 2016 + n_weeks // 52 + 1), 52)[:n_weeks],
+        "Semaine": np.tile(np.arange(1, 53), n_weeks // 52 + 1)[:n_weeks],
+    })
+    for i in range(n_shops):
+        df[f"BOUTIQUE {i:02d}"] = rng.integers(500, 5000, n_weeks)
+    df.to_excel(path, index=False)
+    return df.columns[2]
+
+
+def timed(label, fn, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<38} {best * 1000:9.1f} ms")
+    return best
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 1:
+            path = sys.argv[1]
+            column = pd.read_excel(path, nrows=0).columns[-1]
+        else:
+            path = os.path.join(tmp, "bench_flux.xlsx")
+            column = make_workbook(path)
+        cache_dir = os.path.join(tmp, "cache")
+        print(f"Classeur : {path} ({os.path.getsize(path) / 1024:.0f} Ko)")
+
+        excel = timed("pd.read_excel", lambda: pd.read_excel(path), repeat=3)
+        cold = timed("cache froid (lecture + conversion)",
+                     lambda: read_excel_cached(path, cache_dir=cache_dir))
+        warm = timed("cache chaud (toutes colonnes)",
+                     lambda: read_excel_cached(path, cache_dir=cache_dir), repeat=5)
+        timed("cache chaud (projection 3 colonnes)",
+              lambda: read_excel_cached(path, cache_dir=cache_dir,
+                                        columns=["Annee", "Semaine", column]), repeat=5)
+        print(f"Accélération lecture chaude : x{excel / warm:.0f} "
+              f"(surcoût de conversion à froid : {(cold - excel) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
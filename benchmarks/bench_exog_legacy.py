@@ -0,0 +1,82 @@
+"""
+Exogènes sans historique journalier : store journalier vide et Météo_SUD.xlsx hebdo
+(ancien format). Vérifie que les semaines du classeur servent d'historique (aucune
+valeur manquante, valeurs du classeur restituées) puis que les jours ajoutés au store
+ne remplacent que les semaines qu'ils couvrent ; mesure la latence des tranches.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_exog_legacy
+    python -m benchmarks.bench_exog_legacy 2018 2025   # années du classeur hebdo
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from app.utils.weather_backends import SyntheticWeatherBackend, set_weather_backend
+from app.utils.weather_fetcher import WeatherDataFetcher
+from app.utils.weather_store import DailyWeatherStore
+from app.utils import exogenous
+from config import LAT, LON
+
+
+def synthetic_days(start, end):
+    fetcher = WeatherDataFetcher(LAT, LON, backend=SyntheticWeatherBackend(), cache=False, rate_per_sec=1000)
+    return fetcher.fetch_weather_dates(list(pd.date_range(start, end))).assign(
+        date=lambda d: pd.to_datetime(d["date"]))
+
+
+def timed_get(store, label, start, end):
+    t0 = time.perf_counter()
+    rows = store.get(start, end)
+    elapsed = time.perf_counter() - t0
+    assert not rows[exogenous.EXOG_COLS].isna().any().any(), f"{label} : valeurs manquantes"
+    print(f"{label:<40} {elapsed * 1000:8.1f} ms ({len(rows)} semaines)")
+    return rows
+
+
+def check(store, daily, weekly, last_year):
+    weekly = weekly.set_index("date")
+
+    # 1. Store journalier vide : historique = semaines du classeur
+    year = last_year - 1
+    rows = timed_get(store, f"store vide, année {year} (1er appel)", f"{year}-01-01", f"{year}-12-31")
+    timed_get(store, f"store vide, année {year} (suivant)", f"{year}-01-01", f"{year}-12-31")
+    expected = weekly.reindex(rows["Date"])[exogenous.WEATHER_COLS].to_numpy()
+    assert np.allclose(rows[exogenous.WEATHER_COLS].to_numpy(dtype=float), expected, atol=1e-4), \
+        "semaines du classeur non restituées"
+
+    # 2. Jours ajoutés sur la dernière année (décalés d'un degré) : seules ces semaines changent
+    daily.append(synthetic_days(f"{last_year}-01-01", f"{last_year}-12-31").assign(
+        temperature_max=lambda d: d["temperature_max"] + 1.0))
+    after = timed_get(store, f"+ journalier {last_year} (mise à jour)",
+                      f"{year}-01-01", f"{last_year}-12-31").set_index("Date")
+    kept = after.index.year < last_year
+    assert np.allclose(after.loc[kept, "temperature_max"].to_numpy(dtype=float),
+                       rows["temperature_max"].to_numpy(dtype=float), atol=1e-4), "classeur écrasé"
+    replaced = after.loc[~kept, "temperature_max"].to_numpy(dtype=float)
+    assert (np.abs(replaced - weekly.reindex(after.index[~kept])["temperature_max"].to_numpy()) > 1e-4).all(), \
+        "semaines couvertes par le journalier non remplacées"
+    print(f"classeur conservé sur {kept.sum()} semaines, remplacé par le journalier sur {(~kept).sum()}")
+
+
+def main():
+    first_year = int(sys.argv[1]) if len(sys.argv) > 1 else 2018
+    last_year = int(sys.argv[2]) if len(sys.argv) > 2 else 2025
+    days = synthetic_days(f"{first_year}-01-01", f"{last_year}-12-31")
+    weekly = exogenous.aggregate_daily_to_custom_week(exogenous.add_exogenous_variables(days))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "Météo_SUD.xlsx")
+        weekly.rename(columns={"date": "Date"}).to_excel(legacy, index=False)
+        daily = DailyWeatherStore(os.path.join(tmp, "journalier"))
+        set_weather_backend(SyntheticWeatherBackend())  # prévision hors ligne
+        try:
+            check(exogenous.ExogStore(daily, db_path=None, legacy=legacy), daily, weekly, last_year)
+        finally:
+            set_weather_backend(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark de la conversion des dates françaises du brut journalier :
+ancienne conversion (15 str.replace + 3 str.extract) vs parseur mémoïsé.
+
+Feuille synthétique : 10 ans de jours × plusieurs régions (les mêmes libellés
+se répètent d'une région à l'autre, comme dans les extractions multi-sites).
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_french_dates
+    python -m benchmarks.bench_french_dates 12   # nombre de régions
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from app.utils import french_dates
+from app.utils.french_dates import parse_french_dates
+
+JOURS = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi", "Dimanche"]
+MOIS = ["Janvier", "Février", "Mars", "Avril", "Mai", "Juin", "Juillet",
+        "Août", "Septembre", "Octobre", "Novembre", "Décembre"]
+
+LEGACY_MONTHS = {
+    'janvier': '01', 'février': '02', 'fevrier': '02', 'mars': '03',
+    'avril': '04', 'mai': '05', 'juin': '06',
+    'juillet': '07', 'août': '08', 'aout': '08', 'septembre': '09',
+    'octobre': '10', 'novembre': '11', 'décembre': '12', 'decembre': '12'
+}
+
+
+def make_column(n_regions=6, start="2016-01-01", years=10):
+    days = pd.date_range(start, periods=365 * years + years // 4, freq="D")
+    labels = [f"{JOURS[d.weekday()]} {d.day} {MOIS[d.month - 1]} {d.year}" for d in days]
+    return pd.Series(np.tile(np.asarray(labels, dtype=object), n_regions))
+
+
+def legacy_parse(col):
+    col = col.astype(str).str.lower()
+    for fr, num in LEGACY_MONTHS.items():
+        col = col.str.replace(fr, num, regex=False)
+    return pd.to_datetime(
+        col.str.extract(r"(\d{1,2})[- ](\d{2})[- ](\d{4})")[0]
+        + '-' + col.str.extract(r"(\d{1,2})[- ](\d{2})[- ](\d{4})")[1]
+        + '-' + col.str.extract(r"(\d{1,2})[- ](\d{2})[- ](\d{4})")[2],
+        format="%d-%m-%Y", errors='coerce'
+    )
+
+
+def timed(label, fn, repeat=3, setup=None):
+    best = float("inf")
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<36} {best * 1000:9.1f} ms")
+    return best, result
+
+
+def main():
+    n_regions = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    col = make_column(n_regions)
+    print(f"{len(col)} lignes, {col.nunique()} libellés distincts ({n_regions} régions)")
+
+    legacy, ref = timed("ancienne conversion", lambda: legacy_parse(col))
+    cold, new = timed("parseur (mémo vide)", lambda: parse_french_dates(col),
+                      setup=french_dates.clear_cache)
+    warm, _ = timed("parseur (mémo chaud)", lambda: parse_french_dates(col))
+
+    pd.testing.assert_series_equal(ref.astype("datetime64[ns]"), new, check_names=False)
+    print(f"Résultats identiques. Accélération : x{legacy / cold:.1f} à froid, x{legacy / warm:.1f} à chaud")
+
+
+if __name__ == "__main__":
+    main()
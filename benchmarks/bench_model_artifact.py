@@ -0,0 +1,87 @@
+"""
+Artefact modèle : taille du fichier et temps chargement + prévision.
+
+Compare, sur un SARIMAX saisonnier (s=53) ajusté sur des données synthétiques :
+- le pickle joblib du SARIMAXResults (format historique) ;
+- le paquet complet (model_bundle), lu en mémoire ou projeté (mmap) ;
+- le paquet allégé (SlimSarimaxResults : paramètres, spécification, état final).
+Les prévisions doivent être identiques d'un format à l'autre.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_model_artifact
+    python -m benchmarks.bench_model_artifact 520 2 1 2 1   # semaines, p, q, P, Q
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+from app.utils.model_bundle import load_bundle, write_bundle
+from app.utils.slim_sarimax import SlimSarimaxResults
+
+HORIZON = 12
+REPEAT = 5
+
+
+def fit_model(n_weeks, p, q, P, Q):
+    rng = np.random.default_rng(0)
+    t = np.arange(n_weeks + HORIZON)
+    exog = pd.DataFrame(rng.normal(size=(len(t), 5)))
+    y = np.sin(t * 2 * np.pi / 53) + 0.3 * exog[0].to_numpy() + rng.normal(scale=0.3, size=len(t))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        res = sm.tsa.SARIMAX(pd.Series(y[:n_weeks]), exog=exog.iloc[:n_weeks], order=(p, 1, q),
+                             seasonal_order=(P, 0, Q, 53), enforce_stationarity=False,
+                             enforce_invertibility=False).fit(disp=False, maxiter=3)
+    future = exog.iloc[n_weeks:].set_axis(pd.RangeIndex(n_weeks, n_weeks + HORIZON))
+    return res, future
+
+
+def timed(load, future):
+    """Médiane (s) de chargement + prévision sur REPEAT essais, et la dernière prévision."""
+    times = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        model = load()
+        forecast = model.predict(start=model.nobs, end=model.nobs + HORIZON - 1, exog=future)
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), np.asarray(forecast)
+
+
+def main():
+    n_weeks, p, q, P, Q = (list(map(int, sys.argv[1:6])) + [520, 1, 1, 2, 1][len(sys.argv[1:6]):])[:5]
+    t0 = time.perf_counter()
+    res, future = fit_model(n_weeks, p, q, P, Q)
+    print(f"SARIMAX ({p},1,{q})x({P},0,{Q},53) sur {n_weeks} semaines, "
+          f"{res.model.k_states} états, ajusté en {time.perf_counter() - t0:.1f} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = os.path.join(tmp, "sarimax_model.pkl")
+        full_path = os.path.join(tmp, "full.bundle")
+        slim_path = os.path.join(tmp, "slim.bundle")
+        joblib.dump(res, pickle_path)
+        write_bundle(full_path, {"model": res}, {"format": 1})
+        write_bundle(slim_path, {"model": SlimSarimaxResults.from_results(res)}, {"format": 1})
+
+        cases = [
+            ("pickle joblib", pickle_path, lambda: joblib.load(pickle_path)),
+            ("paquet complet", full_path, lambda: load_bundle(full_path, mmap_mode=None, check=False)[1]["model"]),
+            ("paquet complet mmap", full_path, lambda: load_bundle(full_path, mmap_mode="c", check=False)[1]["model"]),
+            ("paquet allégé", slim_path, lambda: load_bundle(slim_path, mmap_mode=None, check=False)[1]["model"]),
+        ]
+        reference = None
+        for label, path, load in cases:
+            elapsed, forecast = timed(load, future)
+            reference = forecast if reference is None else reference
+            assert np.allclose(forecast, reference, rtol=0, atol=1e-9), f"{label} : prévision différente"
+            print(f"{label:<20} : {os.path.getsize(path) / 1e6:8.2f} Mo | "
+                  f"chargement + prévision {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
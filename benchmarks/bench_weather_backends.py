@@ -0,0 +1,89 @@
+"""
+Pipeline météo hors ligne : débit du WeatherDataFetcher et latence de bout en bout
+des exogènes, sur les backends synthétique et de rejeu (aucun accès réseau).
+
+1. Le backend synthétique génère 2016 → aujourd'hui ; les réponses sont enregistrées
+   dans un cache de réponses temporaire.
+2. Le backend de rejeu relit cet enregistrement, avec latence et erreurs simulées :
+   débit du fetcher (requêtes/s, jours/s) et valeurs identiques à l'enregistrement.
+3. Latence d'une tranche exogène (ExogStore) construite sur l'historique synthétique,
+   prévision comprise.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_weather_backends
+    python -m benchmarks.bench_weather_backends 0.05 0.1   # latence (s), taux d'erreur
+"""
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+from app.utils.http_cache import ResponseCache
+from app.utils.weather_backends import ReplayWeatherBackend, SyntheticWeatherBackend, set_weather_backend
+from app.utils.weather_fetcher import WeatherDataFetcher
+from app.utils import exogenous
+from config import LAT, LON
+
+RANGE_DAYS = 31  # plages courtes : beaucoup de requêtes, pour mesurer le débit
+
+
+def fetch_all(backend, days, cache, **kwargs):
+    fetcher = WeatherDataFetcher(LAT, LON, backend=backend, cache=cache, max_range_days=RANGE_DAYS,
+                                 rate_per_sec=1000, backoff_base=0.01, **kwargs)
+    t0 = time.perf_counter()
+    df = fetcher.fetch_weather_dates(days)
+    return df, fetcher.failed_dates, time.perf_counter() - t0
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.02
+    error_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    today = pd.Timestamp.today().normalize()
+    days = list(pd.date_range("2016-01-01", today - pd.Timedelta(days=1)))
+    n_requests = len(WeatherDataFetcher.contiguous_ranges(days, RANGE_DAYS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1. Génération + enregistrement
+        synthetic = SyntheticWeatherBackend()
+        recorded, _, elapsed = fetch_all(synthetic, days, ResponseCache(tmp))
+        print(f"synthétique : {n_requests} requêtes, {len(recorded)} jours en {elapsed:.2f} s "
+              f"({n_requests / elapsed:.0f} req/s)")
+
+        # 2. Rejeu avec latence et erreurs, à plusieurs niveaux de parallélisme
+        for concurrency in (1, 4, 16):
+            replay = ReplayWeatherBackend(tmp, sources=("synthetic",), latency=latency,
+                                          jitter=latency / 2, error_rate=error_rate)
+            df, failed, elapsed = fetch_all(replay, days, False, max_concurrency=concurrency, max_retries=6)
+            assert not failed, f"jours en échec malgré les reprises : {len(failed)}"
+            merged = recorded.merge(df, on="date", suffixes=("", "_replay"))
+            assert len(merged) == len(recorded) and all(
+                (merged[c] == merged[f"{c}_replay"]).all() for c in exogenous.WEATHER_COLS
+            ), "le rejeu ne restitue pas l'enregistrement"
+            print(f"rejeu x{concurrency:<2} ({latency * 1000:.0f} ms, {error_rate:.0%} d'erreurs) : "
+                  f"{replay.requests} requêtes dont {replay.errors} en erreur, {elapsed:.2f} s "
+                  f"→ {len(df) / elapsed:,.0f} jours/s")
+
+        # 3. Exogènes de bout en bout sur l'historique synthétique (prévision comprise)
+        history = os.path.join(tmp, "meteo_synthetique.parquet")
+        recorded.assign(date=pd.to_datetime(recorded["date"])).to_parquet(history, index=False)
+        set_weather_backend(synthetic)
+        try:
+            store = exogenous.ExogStore(history, db_path=None)
+            t0 = time.perf_counter()
+            exogenous.refresh_forecasts([store])
+            print(f"prévision publiée en {(time.perf_counter() - t0) * 1000:.0f} ms")
+            for label, start, end in [("historique complet", "2016-01-01", today),
+                                      ("12 semaines à venir", today, today + pd.Timedelta(weeks=12))]:
+                t0 = time.perf_counter()
+                store.get(start, end)
+                first = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                rows = store.get(start, end)
+                print(f"exogènes {label:<20} : 1er appel {first * 1000:7.1f} ms | "
+                      f"suivant {(time.perf_counter() - t0) * 1000:6.1f} ms ({len(rows)} semaines)")
+        finally:
+            set_weather_backend(None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Requêtes d'archive météo : un appel par jour vs un appel par plage contiguë,
+contre un serveur HTTP local qui imite l'API archive d'open-meteo.
+
+Vérifie au passage que chaque jour demandé revient une fois, avec ses valeurs,
+et que le nombre de requêtes est celui des plages (découpées à max_range_days).
+Un second scénario rend le serveur capricieux (429 + Retry-After, 503, une plage
+toujours en erreur) : tout doit être récupéré après reprises, sauf la plage
+en échec qui doit figurer dans le rapport failed_dates. Enfin, avec un cache de
+réponses, une seconde récupération des mêmes jours ne doit plus rien demander.
+Le dernier scénario récupère la météo des boutiques : une requête multi-points
+par plage pour toutes les mailles, au lieu d'une série de requêtes par boutique.
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_weather_ranges
+    python -m benchmarks.bench_weather_ranges 0.02   # latence simulée par requête (s)
+"""
+import json
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
+from app.utils.http_cache import ResponseCache
+from app.utils.weather_fetcher import WeatherDataFetcher, group_by_cell
+
+
+BROKEN_DAY = date(2019, 7, 14)
+
+
+def day_values(day, lat=0.0):
+    n = day.toordinal()
+    return round(10 + n % 17 + lat, 1), round(n % 11, 1), round((n % 5) / 2, 1)
+
+
+def daily_payload(days, lat):
+    values = [day_values(d, lat) for d in days]
+    return {"latitude": lat, "daily": {
+        "time": [d.isoformat() for d in days],
+        "temperature_2m_max": [v[0] for v in values],
+        "temperature_2m_min": [v[1] for v in values],
+        "precipitation_sum": [v[2] for v in values],
+    }}
+
+
+class StubArchive(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # connexions réutilisées, comme l'API réelle
+    latency = 0.0
+    requests = 0
+    flaky = False
+    attempts = {}
+    lock = threading.Lock()
+
+    def send_error_status(self, status, retry_after=None):
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        start = date.fromisoformat(query["start_date"][0])
+        end = date.fromisoformat(query["end_date"][0])
+        days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+        with StubArchive.lock:
+            StubArchive.requests += 1
+            attempt = StubArchive.attempts[start, end] = StubArchive.attempts.get((start, end), 0) + 1
+        time.sleep(self.latency)
+        if self.flaky:
+            if start == BROKEN_DAY:
+                return self.send_error_status(503)
+            if attempt == 1:
+                return self.send_error_status(429, retry_after=1) if start.year % 2 else self.send_error_status(503)
+        # Plusieurs points (latitudes séparées par des virgules) : liste de réponses
+        lats = [float(v) for v in query["latitude"][0].split(",")]
+        payloads = [daily_payload(days, lat) for lat in lats]
+        body = json.dumps(payloads if len(payloads) > 1 else payloads[0]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    request_queue_size = 64  # file d'attente par défaut (5) trop courte pour les requêtes parallèles
+
+
+def missing_days():
+    """Historique 2016 → hier avec des trous : 3 semaines en 2018, un jour isolé, fin d'année 2021."""
+    days = pd.date_range("2016-01-01", pd.Timestamp.today().normalize() - pd.Timedelta(days=1))
+    holes = (days.isin(pd.date_range("2018-03-05", "2018-03-25"))
+             | (days == "2019-07-14")
+             | days.isin(pd.date_range("2021-11-20", "2021-12-31")))
+    return list(days[holes]), list(days)
+
+
+def run(url, dates, max_range_days):
+    StubArchive.requests = 0
+    fetcher = WeatherDataFetcher(0.0, 0.0, api_url=url, max_range_days=max_range_days,
+                                 max_concurrency=10, rate_per_sec=1000, cache=False)
+    t0 = time.perf_counter()
+    df = fetcher.fetch_weather_dates(dates, batch_size=10)
+    elapsed = time.perf_counter() - t0
+
+    expected = {d.date() for d in dates}
+    got = pd.to_datetime(df["date"]).dt.date
+    assert len(got) == len(expected) and set(got) == expected, "jours manquants ou en double"
+    for row in df.sample(min(len(df), 200), random_state=0).itertuples():
+        assert (row.temperature_max, row.temperature_min, row.precipitation) == \
+            day_values(date.fromisoformat(row.date)), "valeurs incohérentes"
+    n_ranges = len(WeatherDataFetcher.contiguous_ranges(dates, max_range_days))
+    assert StubArchive.requests == n_ranges, (StubArchive.requests, n_ranges)
+    return StubArchive.requests, elapsed
+
+
+def main():
+    StubArchive.latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+    server = StubServer(("127.0.0.1", 0), StubArchive)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/archive"
+    try:
+        holes, full = missing_days()
+        for label, dates in [("trous (%d jours)" % len(holes), holes),
+                             ("reconstruction (%d jours)" % len(full), full)]:
+            per_day = run(url, dates, max_range_days=1)
+            ranged = run(url, dates, max_range_days=WeatherDataFetcher.MAX_RANGE_DAYS)
+            print(f"{label:<28} par jour : {per_day[0]:5d} requêtes {per_day[1]:7.2f} s | "
+                  f"par plage : {ranged[0]:3d} requêtes {ranged[1]:6.2f} s")
+        print("OK : chaque jour demandé est revenu une fois, avec ses valeurs.")
+
+        # Serveur capricieux : reprises, Retry-After, rapport des jours en échec
+        StubArchive.flaky, StubArchive.requests, StubArchive.attempts = True, 0, {}
+        fetcher = WeatherDataFetcher(0.0, 0.0, api_url=url, max_concurrency=4, rate_per_sec=20,
+                                     max_retries=3, backoff_base=0.05, cache=False)
+        t0 = time.perf_counter()
+        df = fetcher.fetch_weather_dates(holes)
+        elapsed = time.perf_counter() - t0
+        got = set(pd.to_datetime(df["date"]).dt.date)
+        assert got == {d.date() for d in holes} - {BROKEN_DAY}, "jours perdus malgré les reprises"
+        assert fetcher.failed_dates == [BROKEN_DAY], fetcher.failed_dates
+        print(f"capricieux : {StubArchive.requests} requêtes en {elapsed:.2f} s, "
+              f"{len(got)} jours récupérés, en échec : {fetcher.failed_dates}")
+
+        # Cache de réponses : la seconde passe ne touche plus le réseau
+        StubArchive.flaky = False
+        with tempfile.TemporaryDirectory() as tmp:
+            fetcher = WeatherDataFetcher(0.0, 0.0, api_url=url, cache=ResponseCache(tmp))
+            passes = []
+            for _ in range(2):
+                StubArchive.requests = 0
+                t0 = time.perf_counter()
+                df = fetcher.fetch_weather_dates(full)
+                passes.append((StubArchive.requests, time.perf_counter() - t0, len(df)))
+            assert passes[1][0] == 0 and passes[0][2] == passes[1][2] == len(full), passes
+            print(f"cache : 1re passe {passes[0][0]} requêtes {passes[0][1]:.2f} s | "
+                  f"2e passe {passes[1][0]} requête {passes[1][1]:.2f} s | {fetcher.cache.stats()}")
+
+        # Météo par boutique : 19 boutiques, mailles partagées, une requête par plage
+        shops = {f"BOUTIQUE {i:02d}": (43.0 + 0.1 * (i % 12), 5.0 + 0.1 * (i % 12)) for i in range(19)}
+        cells = list(group_by_cell(shops))
+        fetcher = WeatherDataFetcher(0.0, 0.0, api_url=url, max_concurrency=10,
+                                     rate_per_sec=1000, cache=False)
+        StubArchive.requests = 0
+        t0 = time.perf_counter()
+        frames, failed = fetcher.fetch_locations_dates(cells, holes)
+        elapsed = time.perf_counter() - t0
+        n_ranges = len(WeatherDataFetcher.contiguous_ranges(holes, WeatherDataFetcher.MAX_RANGE_DAYS))
+        assert StubArchive.requests == n_ranges and not any(failed), (StubArchive.requests, failed)
+        for (lat, _), df in zip(cells, frames):
+            assert len(df) == len(holes), "jours manquants pour une maille"
+            row = df.iloc[0]
+            assert row.temperature_max == day_values(date.fromisoformat(row.date), lat)[0], \
+                "réponse attribuée à la mauvaise maille"
+        print(f"boutiques : {len(shops)} boutiques → {len(cells)} mailles, "
+              f"{StubArchive.requests} requêtes en {elapsed:.2f} s "
+              f"(au lieu de {len(shops) * n_ranges} requêtes par boutique)")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Micro-benchmark de l'agrégation des prévisions hebdomadaires sur une plage de jours :
+ancienne boucle (iterrows, date_range et intersection d'ensembles par semaine,
+appelée une fois par colonne) vs aggregate_weekly_forecast vectorisé (un appel
+pour toutes les colonnes).
+
+Usage (depuis la racine du projet) :
+    python -m benchmarks.bench_weekly_aggregate
+    python -m benchmarks.bench_weekly_aggregate 52 20   # semaines, boutiques
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from app.utils.forecast import aggregate_weekly_forecast
+
+
+def legacy_aggregate(forecast_weekly, selected_days, column):
+    weights = {0: 1, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1.2, 6: 0}
+    total_weight = sum(weights.values())
+    selected_set = set(selected_days.date)
+    total_flux = 0.0
+    for _, row in forecast_weekly.iterrows():
+        days = pd.date_range(start=pd.to_datetime(row['Date']), periods=7)
+        common_days = set(days.date).intersection(selected_set)
+        daily_flux = row[column] / total_weight
+        for day in common_days:
+            total_flux += daily_flux * weights[day.weekday()]
+    return total_flux
+
+
+def timed(label, fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{label:<40} {best * 1000:9.2f} ms")
+    return best, result
+
+
+def main():
+    n_weeks = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    n_shops = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    rng = np.random.default_rng(0)
+    start = pd.Timestamp("2026-01-05")
+    columns = [f"{measure} {i}" for i in range(n_shops)
+               for measure in ("Prévision", "Borne inférieure", "Borne supérieure")]
+    df = pd.DataFrame(rng.uniform(1000, 5000, size=(n_weeks, len(columns))), columns=columns)
+    df.insert(0, "Date", pd.date_range(start, periods=n_weeks, freq="W-MON"))
+    # plage à cheval sur des semaines partielles (début un mercredi, fin un samedi)
+    days = pd.date_range(start + pd.Timedelta(days=2), start + pd.Timedelta(weeks=n_weeks, days=-2))
+    print(f"{n_weeks} semaines, {len(columns)} colonne(s), {len(days)} jours sélectionnés")
+
+    t_old, old = timed("boucle (un appel par colonne)",
+                       lambda: [legacy_aggregate(df, days, c) for c in columns], repeat=3)
+    t_new, new = timed("vectorisé (un appel)", lambda: aggregate_weekly_forecast(df, days, columns))
+    assert np.allclose(old, new.to_numpy(), rtol=1e-12), "totaux différents"
+    print(f"accélération x{t_old / t_new:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
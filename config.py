@@ -16,11 +16,37 @@ HISTORICAL_FILE = os.path.join(BASE_DIR, "Flux_final.xlsx")
 HISTORICAL_EXOG = os.path.join(BASE_DIR, "Météo_SUD.xlsx")
 RAW_HISTORICAL_FILE = os.path.join(BASE_DIR, "Flux_brut.xlsx")
 
+# Historique météo journalier brut (Parquet, un dossier par point, un fichier par année)
+WEATHER_DAILY_DIR = os.path.join(BASE_DIR, "data", "meteo_journaliere")
+
+# Base SQLite (boutiques, secteurs, séries hebdomadaires)
+DB_PATH = os.path.join(BASE_DIR, "app", "database", "boutiques.db")
+
+# Cache local (conversions Parquet des classeurs…), supprimable sans risque
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+
+# Météo propre à chaque boutique (coordonnées en base, une série par maille) :
+# à activer après réentraînement des modèles, entraînés sur la météo LAT/LON
+USE_BOUTIQUE_WEATHER = False
+
 # API météo et proxy
 API_METEO_URL = "https://archive-api.open-meteo.com/v1/archive"
+API_METEO_FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
 USE_PROXY = True
 PROXY_URL = "http://127.0.0.1:3128" if USE_PROXY else None
 
+# Source météo : "http" (open-meteo), "replay" (réponses enregistrées, hors ligne) ou
+# "synthetic" (générateur) ; surchargeable par variable d'environnement
+WEATHER_BACKEND = os.environ.get("WEATHER_BACKEND", "http")
+# Enregistrements rejoués : hors de cache/ (supprimable), copier ici le contenu de cache/http
+WEATHER_REPLAY_DIR = os.environ.get("WEATHER_REPLAY_DIR", os.path.join(BASE_DIR, "data", "meteo_rejeu"))
+WEATHER_REPLAY_LATENCY = float(os.environ.get("WEATHER_REPLAY_LATENCY", "0"))        # secondes
+WEATHER_REPLAY_ERROR_RATE = float(os.environ.get("WEATHER_REPLAY_ERROR_RATE", "0"))  # 0 → 1
+
+# Modèles sauvegardés en version allégée (paramètres + état final, sans les données ni les
+# sorties du filtre) : fichiers bien plus petits, chargement et prévision plus rapides
+SLIM_MODEL_ARTIFACT = False
+
 # Utilitaire pour générer les chemins modèles dynamiquement
 def get_model_paths(cible):
     model_path = os.path.join(BASE_DIR, 'models', f"{cible}_models")
@@ -30,4 +56,9 @@ def get_model_paths(cible):
         "SCALER_EXOG_FILE": os.path.join(model_path, f"scaler_exog_{cible}.pkl"),
         "SCALER_TARGET_FILE": os.path.join(model_path, f"scaler_target_{cible}.pkl"),
         "PCA_FILE": os.path.join(model_path, f"pca_{cible}.pkl"),
+        # Paquet unique (modèle + transformateurs + manifeste) : remplace les quatre fichiers ci-dessus
+        "BUNDLE_FILE": os.path.join(model_path, f"model_{cible}.bundle"),
+        # Semaines ajoutées depuis l'entraînement, et verrou des écritures
+        "DELTA_FILE": os.path.join(model_path, f"model_{cible}.delta"),
+        "LOCK_FILE": os.path.join(model_path, f"model_{cible}.lock"),
     }